@@ -0,0 +1,56 @@
+# grown-up modules
+import logging
+import os
+import sys
+
+if __name__ == "__main__":
+    import argparse
+    import textwrap
+
+    import compose.cli.command
+    import compose.project
+    import docker
+
+    import cli
+    from irods_testing_environment import logs
+
+    parser = argparse.ArgumentParser(
+        description='Build the images for one or more Compose projects in parallel.')
+
+    cli.add_common_args(parser)
+    cli.add_build_args(parser)
+
+    parser.add_argument('project_directories',
+                        metavar='PATH_TO_PROJECT_DIRECTORY',
+                        nargs='+',
+                        help='Paths to the Compose projects whose images are built.')
+
+    parser.add_argument('--max-parallel-builds',
+                        dest='max_workers', type=int,
+                        help=textwrap.dedent('''\
+                            Maximum number of images to build at the same time. By default, \
+                            every distinct image is built at the same time.'''))
+
+    parser.add_argument('--rebuild',
+                        dest='rebuild', action='store_true',
+                        help=textwrap.dedent('''\
+                            If indicated, the images are built even if images with the same \
+                            Dockerfile and build arguments already exist locally.'''))
+
+    args = parser.parse_args()
+
+    logs.configure(args.verbosity)
+
+    docker_client = docker.from_env(use_ssh_client=True)
+
+    projects = [compose.cli.command.get_project(project_dir=os.path.abspath(d),
+                                                docker_client=docker_client,
+                                                build_cache_directory=args.build_cache_directory)
+                for d in args.project_directories]
+
+    try:
+        compose.project.build_projects(projects, max_workers=args.max_workers, rebuild=args.rebuild)
+
+    except Exception as e:
+        logging.critical(e)
+        sys.exit(1)
@@ -21,6 +21,20 @@ def add_compose_args(parser):
                         dest='project_name',
                         help='Name of Compose project on which to install packages.')
 
+def add_build_args(parser):
+    '''Add argparse options related to building the images for a Docker Compose project.
+
+    Arguments:
+    parser -- argparse.ArgumentParser to augment
+    '''
+    parser.add_argument('--build-cache-directory',
+                        metavar='PATH_TO_BUILD_CACHE_DIRECTORY',
+                        dest='build_cache_directory',
+                        help=textwrap.dedent('''\
+                            Path to a directory on the host in which the BuildKit cache for the \
+                            images is kept. The cache is shared by every project which uses the \
+                            directory and by later builds.'''))
+
 def add_irods_package_args(parser):
     '''Add argparse options related to to-be-installed iRODS packages.
 
@@ -41,6 +55,30 @@ def add_irods_package_args(parser):
                             the latest available version will be installed. Can be used \
                             with --use-static-image to avoid downloading packages.'''))
 
+    parser.add_argument('--cache-package-images',
+                        dest='cache_package_images', action='store_true',
+                        help=textwrap.dedent('''\
+                            If specified with --irods-package-directory, the iRODS containers are \
+                            committed to images after the packages are installed, tagged by the \
+                            SHA-256 of the base image and the packages. Later runs with the same \
+                            packages start from those images instead of installing the packages.'''))
+
+    parser.add_argument('--package-cache-directory',
+                        metavar='PATH_TO_PACKAGE_CACHE_DIRECTORY',
+                        dest='package_cache_directory',
+                        help=textwrap.dedent('''\
+                            Path to a directory on the host which is mounted into the iRODS \
+                            containers as the apt or dnf package cache. Repository metadata and \
+                            packages are downloaded into it once and shared by every container \
+                            and every later run on the host.'''))
+
+    parser.add_argument('--offline',
+                        dest='offline_package_cache', action='store_true',
+                        help=textwrap.dedent('''\
+                            If specified with --package-cache-directory, packages are installed \
+                            only from the package cache, which must already hold every package \
+                            (e.g. from an earlier run with the same packages).'''))
+
     parser.add_argument('--irods-externals-package-directory',
                         metavar='PATH_TO_DIRECTORY_WITH_IRODS_EXTERNALS_PACKAGES',
                         dest='irods_externals_package_directory',
@@ -80,6 +118,28 @@ def add_irods_plugin_args(parser):
                             #the latest available version will be installed.'''))
 
 
+def executor_count(value):
+    '''Return the value of --concurrent-test-executor-count as a positive int or 'auto'.
+
+    Arguments:
+    value -- string from the command line
+    '''
+    import argparse
+
+    if value == 'auto':
+        return value
+
+    try:
+        count = int(value)
+    except ValueError:
+        count = 0
+
+    if count < 1:
+        raise argparse.ArgumentTypeError(f'expected a positive integer or "auto", got [{value}]')
+
+    return count
+
+
 def add_irods_test_args(parser):
     """Add argparse options related to iRODS tests and the test environment.
 
@@ -113,9 +173,10 @@ def add_irods_test_args(parser):
                             code.'''))
 
     parser.add_argument('--concurrent-test-executor-count',
-                        dest='executor_count', type=int, default=1,
+                        dest='executor_count', type=executor_count, default=1,
                         help=textwrap.dedent('''\
-                            Number of concurrent executors to run tests at the same time.'''))
+                            Number of concurrent executors to run tests at the same time, or \
+                            "auto" to use as many as the CPUs and memory of the host allow.'''))
 
     parser.add_argument('--discard-logs',
                         dest='save_logs', default=True, action='store_false',
@@ -123,6 +184,17 @@ def add_irods_test_args(parser):
                             Indicates that the logs should not be collected from the \
                             containers.'''))
 
+    parser.add_argument('--package-output',
+                        metavar='COMPRESSION',
+                        dest='package_output',
+                        choices=['xz', 'zstd'],
+                        help=textwrap.dedent('''\
+                            If indicated, the job output directory is replaced at the end of the \
+                            run by a single compressed tar file (xz or zstd) in which files with \
+                            identical contents are stored only once. zstd requires the \
+                            zstandard package. Use package_job_output.py --extract to restore \
+                            the directory.'''))
+
     parser.add_argument('--leak-containers',
                         action='store_false', dest='cleanup_containers',
                         help='If indicated, the containers will not be torn down.')
@@ -146,6 +218,23 @@ def add_irods_test_args(parser):
     )
 
 
+def add_zone_pool_args(parser):
+    """Add argparse options related to leasing zones from a pool.
+
+    Arguments:
+    parser -- argparse.ArgumentParser to augment
+    """
+    parser.add_argument('--zone-pool',
+                        metavar='PATH_TO_POOL_DIRECTORY',
+                        dest='zone_pool',
+                        help=textwrap.dedent('''\
+                            Lease already set up zones from the pool kept in this directory by \
+                            manage_zone_pool.py instead of creating them. The zones are returned \
+                            to the pool at the end of the run. If no idle zones in the pool match \
+                            the packages and setup options for this run, zones are created as \
+                            usual.'''))
+
+
 def add_irods_setup_args(parser):
     """
     Add argparse options related to setting up and configuring iRODS.
@@ -169,6 +258,109 @@ def add_irods_setup_args(parser):
     )
 
 
+def add_consumer_setup_args(parser):
+    """
+    Add argparse options related to setting up iRODS catalog service consumers.
+
+    Args:
+        parser: argparse.ArgumentParser to augment
+    """
+    parser.add_argument('--max-concurrent-consumer-setups',
+                        metavar='COUNT',
+                        dest='max_concurrent_consumer_setups', type=int, default=4,
+                        help=textwrap.dedent('''\
+                            Maximum number of catalog service consumers to set up at once against \
+                            one catalog service provider. Fewer are set up at once while setups \
+                            are slow or failing.'''))
+
+    parser.add_argument('--consumer-setup-retries',
+                        metavar='COUNT',
+                        dest='consumer_setup_retries', type=int, default=2,
+                        help='Number of times a failed catalog service consumer setup is tried again.')
+
+
+def add_catalog_profile_args(parser):
+    """
+    Add argparse options related to the database server which holds the catalog.
+
+    Args:
+        parser: argparse.ArgumentParser to augment
+    """
+    from irods_testing_environment import database_setup
+
+    parser.add_argument('--catalog-profile',
+                        dest='catalog_profile',
+                        choices=database_setup.catalog_profiles(),
+                        default='default',
+                        help=textwrap.dedent('''\
+                            Settings for the database server. "fast" turns off flushing to disk \
+                            (and keeps Postgres data on tmpfs), which is safe for disposable test \
+                            catalogs. "durable" flushes every commit. "default" uses the settings \
+                            in the Compose project.'''))
+
+
+def add_scratch_storage_args(parser):
+    """
+    Add argparse options related to where the iRODS servers keep the data written by tests.
+
+    Args:
+        parser: argparse.ArgumentParser to augment
+    """
+    parser.add_argument('--scratch-tmpfs-size',
+                        dest='scratch_tmpfs_size', metavar='SIZE',
+                        help=textwrap.dedent('''\
+                            Mount the vaults and /tmp of the iRODS servers, and the volume they \
+                            share, as tmpfs of at most this size each (e.g. 1g). The data is kept \
+                            in memory.'''))
+
+    parser.add_argument('--shared-volume-directory',
+                        dest='shared_volume_directory', metavar='DIRECTORY',
+                        help=textwrap.dedent('''\
+                            Directory on the host (e.g. on a fast disk) to hold the volume shared \
+                            by the iRODS servers.'''))
+
+
+def federation_pair(value):
+    '''Return the value of --federation-pairs as a tuple of two zone names.
+
+    Arguments:
+    value -- string from the command line of the form ZONE:ZONE
+    '''
+    import argparse
+
+    zones = value.split(':')
+
+    if len(zones) != 2 or not all(zones):
+        raise argparse.ArgumentTypeError(f'expected a pair of zone names of the form ZONE:ZONE, got [{value}]')
+
+    return tuple(zones)
+
+
+def add_federation_topology_args(parser):
+    """
+    Add argparse options related to which zones are federated with each other.
+
+    Args:
+        parser: argparse.ArgumentParser to augment
+    """
+    from irods_testing_environment import federate
+
+    parser.add_argument('--topology',
+                        dest='topology',
+                        choices=federate.topology_kinds(),
+                        default='clique',
+                        help=textwrap.dedent('''\
+                            Which zones are federated with each other. "clique" federates every \
+                            zone with every other zone, "star" federates the first zone with each \
+                            of the others, "ring" federates each zone with the zones next to it, \
+                            and "pairs" federates the zones given by --federation-pairs.'''))
+
+    parser.add_argument('--federation-pairs',
+                        metavar='ZONE:ZONE',
+                        nargs='+', dest='federation_pairs', type=federation_pair,
+                        help='Space-delimited list of pairs of zones to federate with --topology pairs.')
+
+
 def add_common_args(parser):
     '''Add argparse options common to irods_testing_environment scripts.
 
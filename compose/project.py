@@ -1,40 +1,420 @@
 """Minimal compose Project implementation backed by Docker Compose CLI."""
 
+import concurrent.futures
+import hashlib
+import json
+import logging
 import pathlib
+import re
 import shutil
 import subprocess
+import tempfile
+import threading
 
 import docker
 
 from .container import Container
 
 
+BUILD_IMAGE_REPOSITORY = "irods-testing-environment-build"
+
+BUILDER_NAME = "irods-testing-environment"
+
+_builder_lock = threading.Lock()
+
+
 def _sanitize_project_name(name):
     # Match legacy usage in this repo: strip characters compose v1 rejects.
     return name.replace(".", "").replace(":", "").replace("/", "")
 
 
+def _docker_cmd(cmd, cwd=None, capture_output=False):
+    if not shutil.which("docker"):
+        raise RuntimeError("docker CLI not found in PATH")
+    return subprocess.run(cmd, cwd=cwd, check=True, capture_output=capture_output, text=capture_output)
+
+
+def _hash_path(h, path):
+    """Add the relative paths and contents of the file or directory at `path` to the hash `h`."""
+    path = pathlib.Path(path)
+    for p in sorted([path, *path.rglob("*")]) if path.is_dir() else [path]:
+        if not p.is_file():
+            continue
+        h.update(str(p.relative_to(path.parent)).encode("utf-8"))
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+
+
+_VARIABLE_PATTERN = re.compile(r"\$(?:\{(\w+)(?::?([-+])([^}]*))?\}|(\w+))")
+
+
+def _substitute(word, variables):
+    """
+    Return `word` with the Dockerfile variables in it replaced by their values, or None if one is not known.
+
+    Supports $name, ${name}, ${name:-default}, and ${name:+alternative}, like the Dockerfile frontend.
+    """
+    unresolved = False
+
+    def replace(match):
+        nonlocal unresolved
+        name = match.group(1) or match.group(4)
+        modifier, value = match.group(2), match.group(3)
+        if modifier == "-":
+            return variables.get(name) or value
+        if modifier == "+":
+            return value if variables.get(name) else ""
+        if name not in variables:
+            unresolved = True
+            return ""
+        return variables[name]
+
+    word = _VARIABLE_PATTERN.sub(replace, word)
+
+    return None if unresolved else word
+
+
+def _copied_paths(definition):
+    """
+    Return the paths in the build context which the Dockerfile copies into the image.
+
+    Build arguments and environment variables in the sources are expanded with the values they have at that point
+    in the Dockerfile. Returns None if a source cannot be resolved (e.g. it uses a variable with no value, or it
+    names nothing in the build context), in which case the whole build context must be considered copied.
+    """
+    import shlex
+
+    context = pathlib.Path(definition["context"]).resolve()
+    paths = []
+    variables = {}
+
+    with open(definition["dockerfile"]) as f:
+        # Join continued lines so that each instruction is on one line.
+        instructions = f.read().replace("\\\n", " ").splitlines()
+
+    for instruction in instructions:
+        words = instruction.split(None, 1)
+        if not words or words[0].startswith("#"):
+            continue
+
+        keyword = words[0].upper()
+        rest = words[1] if len(words) > 1 else ""
+
+        if keyword in ("ARG", "ENV"):
+            try:
+                pairs = shlex.split(rest)
+            except ValueError:
+                return None
+
+            # The legacy form 'ENV name value' sets one variable to the rest of the line.
+            if keyword == "ENV" and len(pairs) > 1 and "=" not in pairs[0]:
+                pairs = [pairs[0] + "=" + " ".join(pairs[1:])]
+
+            for pair in pairs:
+                name, has_default, value = pair.partition("=")
+                if keyword == "ARG":
+                    # A build argument passed to the build overrides the default in the Dockerfile.
+                    value = definition["args"].get(name, value if has_default else variables.get(name))
+                else:
+                    value = _substitute(value, variables)
+                if value is None:
+                    variables.pop(name, None)
+                else:
+                    variables[name] = value
+            continue
+
+        if keyword not in ("COPY", "ADD"):
+            continue
+
+        # Files copied from other stages or images are not part of the build context.
+        if any(w.startswith("--from") for w in rest.split()):
+            continue
+
+        if rest.lstrip().startswith("["):
+            try:
+                arguments = json.loads(rest)
+            except ValueError:
+                return None
+        else:
+            arguments = [w for w in rest.split() if not w.startswith("--")]
+
+        # Heredocs are not files from the build context.
+        if any(a.startswith("<<") for a in arguments):
+            continue
+
+        for source in arguments[:-1]:
+            source = _substitute(source, variables)
+            if source is None:
+                return None
+
+            if "://" in source:
+                continue
+
+            # Sources are always relative to the build context, even if they are absolute.
+            matches = sorted(context.glob(source.lstrip("/") or "."))
+            if not matches or any(context not in [m.resolve(), *m.resolve().parents] for m in matches):
+                return None
+
+            paths.extend(matches)
+
+    return paths
+
+
+def image_content_key(definition):
+    """
+    Return the SHA-256 of the inputs which determine the contents of an image built from a build definition.
+
+    The inputs are the Dockerfile, the files from the build context which it copies into the image, the build
+    arguments, and the build target. If the copied files cannot be worked out from the Dockerfile (see
+    _copied_paths), every file in the build context is hashed instead. The paths of the project and build context
+    are not included, so every project which builds the same Dockerfile with the same arguments (e.g. each database
+    variant of a platform) gets the same key, even from different checkouts of the repository.
+
+    Arguments:
+        definition: Build definition as returned by Project.build_definitions.
+
+    Returns:
+        The key as a hex string.
+    """
+    h = hashlib.sha256()
+
+    h.update(json.dumps({"args": definition["args"], "target": definition["target"]}, sort_keys=True).encode("utf-8"))
+
+    with open(definition["dockerfile"], "rb") as f:
+        h.update(f.read())
+
+    paths = _copied_paths(definition)
+
+    if paths is None:
+        logging.info(f"hashing the whole build context [{definition['context']}] for [{definition['dockerfile']}]")
+        paths = sorted(pathlib.Path(definition["context"]).iterdir())
+
+    for path in paths:
+        _hash_path(h, path)
+
+    return h.hexdigest()
+
+
+def build_image_name(definition):
+    """
+    Return the image name for a build definition.
+
+    Services and projects whose build definitions have the same content key share the image.
+
+    Arguments:
+        definition: Build definition as returned by Project.build_definitions.
+
+    Returns:
+        The image name, tagged with the content key of the build definition (see image_content_key).
+    """
+    return f"{BUILD_IMAGE_REPOSITORY}/{pathlib.Path(definition['context']).name.lower()}:{image_content_key(definition)[:16]}"
+
+
+def _image_exists(docker_client, image):
+    try:
+        docker_client.images.get(image)
+        return True
+    except docker.errors.ImageNotFound:
+        return False
+
+
+def _ensure_builder():
+    """Create the BuildKit builder which can export its cache to a local directory, if needed."""
+    with _builder_lock:
+        inspect = subprocess.run(["docker", "buildx", "inspect", BUILDER_NAME], capture_output=True)
+        if inspect.returncode != 0:
+            # The default builder cannot export its cache, so a builder running in a container is needed.
+            _docker_cmd(["docker", "buildx", "create", "--name", BUILDER_NAME, "--driver", "docker-container"])
+
+
+def build_image(definition, image, cache_directory=None):
+    """
+    Build an image from a build definition with BuildKit.
+
+    BuildKit is always used, so Dockerfiles can use `RUN --mount=type=cache` to keep package manager caches between
+    builds.
+
+    Arguments:
+        definition: Build definition as returned by Project.build_definitions.
+        image: Name with which to tag the image.
+        cache_directory: Directory on the host to import the build cache from and export it to, so that the layers
+            are shared across projects and with later builds. Default is None (the builder's own cache is used).
+    """
+    cmd = ["docker", "buildx", "build", "--load", "--tag", image, "--file", definition["dockerfile"]]
+
+    for name, value in sorted(definition["args"].items()):
+        cmd.extend(["--build-arg", f"{name}={value}"])
+
+    if definition["target"]:
+        cmd.extend(["--target", definition["target"]])
+
+    if cache_directory:
+        _ensure_builder()
+
+        # One cache per image keeps builds which run in parallel from exporting to the same directory.
+        cache = pathlib.Path(cache_directory).resolve() / image.replace("/", "-").replace(":", "-")
+        cmd.extend(["--builder", BUILDER_NAME])
+        cmd.extend(["--cache-from", f"type=local,src={cache}"])
+        cmd.extend(["--cache-to", f"type=local,dest={cache},mode=max"])
+
+    cmd.append(definition["context"])
+
+    _docker_cmd(cmd)
+
+
+def build_projects(projects, max_workers=None, rebuild=False):
+    """
+    Build the images for several projects in parallel, building each distinct image once.
+
+    Each service is then run from the image for its build definition (see Project.use_images), so services and
+    projects which build the same Dockerfile with the same arguments share one image. An image which already exists
+    locally is reused without building it, so e.g. the database variants of a platform build the platform image
+    only once between them.
+
+    Arguments:
+        projects: List of Projects to build.
+        max_workers: Maximum number of images to build at the same time. Default is None (see ThreadPoolExecutor).
+        rebuild: If True, build the images even if they already exist (e.g. to pick up a newer base image).
+    """
+    images_for_projects = []
+    builds = {}
+
+    for project in projects:
+        images = {}
+        for service, definition in project.build_definitions().items():
+            image = build_image_name(definition)
+            images[service] = image
+            if image in builds:
+                continue
+            if not rebuild and _image_exists(project.docker_client, image):
+                logging.info(f"reusing image [{image}] for [{project.name}]")
+                builds[image] = None
+                continue
+            builds[image] = (definition, project.build_cache_directory)
+        images_for_projects.append(images)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(build_image, definition, image, cache_directory)
+            for image, (definition, cache_directory) in [(i, b) for i, b in builds.items() if b]
+        ]
+        for f in concurrent.futures.as_completed(futures):
+            f.result()
+
+    for project, images in zip(projects, images_for_projects):
+        project.use_images(images)
+
+
 class Project:
     """Subset of compose.project.Project used by this codebase."""
 
-    def __init__(self, project_dir, project_name=None, docker_client=None):
+    def __init__(self, project_dir, project_name=None, docker_client=None, override_files=None,
+                 build_cache_directory=None):
         """Initialize a Compose Project with a project_dir."""
         self.project_dir = pathlib.Path(project_dir).resolve()
         base_name = pathlib.Path(self.project_dir).name
         name = project_name or base_name
         self.name = _sanitize_project_name(name)
         self._docker_client = docker_client or docker.from_env()
+        self.override_files = [str(f) for f in override_files or []]
+        self.build_cache_directory = build_cache_directory
+        self._images_override_file = None
+
+    @property
+    def docker_client(self):
+        """The Docker client which the project uses to communicate with the daemon."""
+        return self._docker_client
+
+    def add_override_file(self, path):
+        """
+        Merge the Compose file at `path` over the project's docker-compose.yml in later commands.
+
+        Arguments:
+            path: Path to a Compose file (YAML or JSON) which overrides parts of the project.
+        """
+        self.override_files.append(str(pathlib.Path(path).resolve()))
 
-    def _compose_cmd(self, args):
+    def _compose_cmd(self, args, capture_output=False):
         if not shutil.which("docker"):
             raise RuntimeError("docker CLI not found in PATH")
         cmd = ["docker", "compose", "-p", self.name]
+        if self.override_files:
+            # Naming any file with -f disables the default lookup, so the base file must be named too.
+            cmd.extend(["-f", str(self.project_dir / "docker-compose.yml")])
+            for f in self.override_files:
+                cmd.extend(["-f", f])
         cmd.extend(args)
-        subprocess.run(cmd, cwd=self.project_dir, check=True)
+        return _docker_cmd(cmd, cwd=self.project_dir, capture_output=capture_output)
 
-    def build(self):
-        """Build the compose project images."""
-        self._compose_cmd(["build"])
+    def config(self):
+        """
+        Return the Compose configuration for the project with variables and overrides resolved.
+
+        Returns:
+            The configuration as a dict, as printed by `docker compose config`.
+        """
+        return json.loads(self._compose_cmd(["config", "--format", "json"], capture_output=True).stdout)
+
+    def build_definitions(self):
+        """
+        Return the build definition of each service which is built from a Dockerfile.
+
+        Returns:
+            A dict mapping service names to dicts with the absolute paths to the build context and Dockerfile, the
+            build arguments, and the build target.
+        """
+        definitions = {}
+
+        for service, configuration in self.config().get("services", {}).items():
+            build = configuration.get("build")
+            if not build:
+                continue
+
+            if isinstance(build, str):
+                build = {"context": build}
+
+            context = (self.project_dir / build.get("context", ".")).resolve()
+
+            definitions[service] = {
+                "context": str(context),
+                "dockerfile": str(context / (build.get("dockerfile") or "Dockerfile")),
+                "args": {name: str(value) for name, value in (build.get("args") or {}).items() if value is not None},
+                "target": build.get("target"),
+            }
+
+        return definitions
+
+    def use_images(self, images):
+        """
+        Run services from the given images in later commands instead of the images Compose would build.
+
+        Arguments:
+            images: Dict mapping service names to image names.
+        """
+        if not self._images_override_file:
+            fd, self._images_override_file = tempfile.mkstemp(prefix=f"{self.name}-images-", suffix=".yml")
+            with open(fd, "w") as f:
+                f.write("{}")
+            # Overrides added by callers (e.g. to run services from snapshot images) take precedence.
+            self.override_files.insert(0, self._images_override_file)
+
+        # The file is JSON, which Compose accepts as YAML.
+        with open(self._images_override_file, "w") as f:
+            json.dump(
+                {"services": {service: {"image": image, "pull_policy": "never"} for service, image in images.items()}},
+                f,
+                indent=4,
+            )
+
+    def build(self, rebuild=False):
+        """
+        Build each distinct image for the compose project once with BuildKit (see build_projects).
+
+        Arguments:
+            rebuild: If True, build the images even if they already exist locally. Default is False.
+        """
+        build_projects([self], rebuild=rebuild)
 
     def up(self, scale_override=None):
         """
@@ -12,6 +12,7 @@ from irods_testing_environment import execute
 from irods_testing_environment import irods_setup
 from irods_testing_environment import irods_config
 from irods_testing_environment import json_utils
+from irods_testing_environment import scratch_storage
 from irods_testing_environment import federate
 from irods_testing_environment import tls_setup
 from irods_testing_environment.install import install
@@ -27,8 +28,13 @@ if __name__ == "__main__":
 
     cli.add_common_args(parser)
     cli.add_compose_args(parser)
+    cli.add_build_args(parser)
     cli.add_irods_package_args(parser)
     cli.add_irods_setup_args(parser)
+    cli.add_consumer_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
+    cli.add_federation_topology_args(parser)
 
     parser.add_argument('--consumers-per-zone',
                         metavar='IRODS_CATALOG_CONSUMER_INSTANCES_PER_ZONE',
@@ -72,6 +78,16 @@ if __name__ == "__main__":
 
     zone_names = args.zone_names or ['tempZone', 'otherZone']
 
+    if args.topology == 'pairs' and not args.federation_pairs:
+        print('--federation-pairs is required when using --topology pairs')
+        exit(1)
+
+    try:
+        topology = federate.make_topology(args.topology, zone_names, args.federation_pairs)
+    except ValueError as e:
+        print(e)
+        exit(1)
+
     project_directory = os.path.abspath(args.project_directory or os.getcwd())
 
     if not args.install_packages:
@@ -82,16 +98,31 @@ if __name__ == "__main__":
     ctx = context.context(docker.from_env(),
                           compose.cli.command.get_project(
                               project_dir=project_directory,
-                              project_name=args.project_name))
+                              project_name=args.project_name,
+                              build_cache_directory=args.build_cache_directory))
 
     logs.configure(args.verbosity)
 
+    irods_setup.configure_consumer_admission(limit=args.max_concurrent_consumer_setups,
+                                            retries=args.consumer_setup_retries)
+
     zone_count = len(zone_names)
     consumer_count = args.consumers_per_zone * zone_count
 
     if args.do_setup:
         # Bring up the services
         logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
+        package_cache_directory = None
+        if args.install_packages and args.package_cache_directory:
+            package_cache_directory = install.add_package_cache_to_project(ctx.compose_project,
+                                                                           args.package_cache_directory)
+
+        database_setup.add_catalog_profile_to_project(ctx.compose_project, args.catalog_profile)
+
+        scratch_storage.add_scratch_storage_to_project(ctx.compose_project,
+                                                       tmpfs_size=args.scratch_tmpfs_size,
+                                                       shared_volume_directory=args.shared_volume_directory)
+
         ctx.compose_project.build()
         ctx.compose_project.up(scale_override={
             context.irods_catalog_database_service(): zone_count,
@@ -102,17 +133,22 @@ if __name__ == "__main__":
         # The catalog consumers are only determined after the containers are running
         zone_info_list = irods_setup.get_info_for_zones(ctx, zone_names, args.consumers_per_zone)
 
+        installer = None
         if args.install_packages:
-            install.make_installer(ctx.platform_name()).install_irods_packages(
-                ctx,
-                externals_directory=args.irods_externals_package_directory,
-                package_directory=args.package_directory,
-                package_version=args.package_version)
-
-        irods_setup.setup_irods_zones(ctx,
-                                      zone_info_list,
-                                      odbc_driver=args.odbc_driver,
-                                      do_unattended_install=args.do_unattended_install)
+            installer = install.make_installer(ctx.platform_name(),
+                                               package_cache_directory=package_cache_directory,
+                                               offline=args.offline_package_cache)
+
+        federate.setup_federated_zones(ctx,
+                                       zone_info_list,
+                                       installer=installer,
+                                       include_consumers=args.federate_consumers,
+                                       topology=topology,
+                                       externals_directory=args.irods_externals_package_directory,
+                                       package_directory=args.package_directory,
+                                       package_version=args.package_version,
+                                       odbc_driver=args.odbc_driver,
+                                       do_unattended_install=args.do_unattended_install)
 
         if args.use_tls:
             tls_setup.configure_tls_in_zone(ctx.docker_client, ctx.compose_project)
@@ -120,5 +156,5 @@ if __name__ == "__main__":
     else:
         zone_info_list = irods_setup.get_info_for_zones(ctx, zone_names, args.consumers_per_zone)
 
-    federate.form_federation_clique(ctx, zone_info_list, args.federate_consumers)
+        federate.form_federation(ctx, zone_info_list, topology, args.federate_consumers)
 
@@ -30,6 +30,11 @@ if __name__ == "__main__":
         print('package directory and package version are mutually exclusive')
         exit(1)
 
+    if args.package_cache_directory:
+        # The package cache is mounted when the containers are created, and these are already running.
+        print('--package-cache-directory must be used by the script which brings up the containers')
+        exit(1)
+
     logs.configure(args.verbosity)
 
     project_directory = os.path.abspath(args.project_directory or os.getcwd())
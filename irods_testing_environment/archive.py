@@ -1,4 +1,5 @@
 # grown-up imports
+import io
 import logging
 import os
 import tarfile
@@ -169,6 +170,33 @@ def copy_from_container(container,
     return dest if cleanup else archive_path
 
 
+def read_file(container, path_to_file_on_container):
+    """Return the contents of a file inside the specified container as bytes.
+
+    The archive returned by the Docker daemon is streamed into memory and the file is extracted
+    from it directly, so nothing is written to the local filesystem. This is meant for small
+    files such as configuration files and version files.
+
+    docker.errors.NotFound is raised if the file does not exist in the container.
+
+    Arguments:
+    container -- the Docker container from which the file is to be read
+    path_to_file_on_container -- absolute path to the file inside the container
+    """
+    logging.debug('reading file [{}] in container [{}]'.format(path_to_file_on_container, container.name))
+
+    bits, _ = container.get_archive(path_to_file_on_container)
+
+    with tarfile.open(fileobj=io.BytesIO(b''.join(bits)), mode='r') as f:
+        member = f.next()
+
+        if member is None or not member.isfile():
+            raise RuntimeError('[{}] path is not a regular file [{}]'
+                               .format(container.name, path_to_file_on_container))
+
+        return f.extractfile(member).read()
+
+
 def copy_files_in_container(container, sources_and_destinations):
     """Copy files in container from source to destination.
 
@@ -214,13 +242,61 @@ def collect_files_from_containers(docker_client,
             copy_from_container(source_container, p, od)
 
 
+def write_file(container, target_file, contents):
+    """Write `contents` to `target_file` in `container`, atomically replacing existing contents.
+
+    The contents are packed into an in-memory, single-member tar archive which is put in the
+    directory of `target_file` under a temporary name. The temporary file then takes on the
+    ownership and mode of `target_file` (if it exists) and is renamed over it, so readers never
+    observe a partially written file.
+
+    Arguments:
+    container -- docker.Container where the target_file is hosted
+    target_file -- the path inside the container with the contents to overwrite
+    contents -- bytes to write to the target file
+    """
+    import shlex
+    import time
+    import uuid
+
+    directory = os.path.dirname(target_file) or '/'
+    temporary_name = '.{}.{}.tmp'.format(os.path.basename(target_file), uuid.uuid4().hex)
+    temporary_file = os.path.join(directory, temporary_name)
+
+    logging.debug('writing [{}] bytes to file [{}] in container [{}]'
+                  .format(len(contents), target_file, container.name))
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as f:
+        info = tarfile.TarInfo(name=temporary_name)
+        info.size = len(contents)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        f.addfile(info, io.BytesIO(contents))
+
+    if not container.put_archive(directory, buffer.getvalue()):
+        raise RuntimeError('[{}] failed to put archive for file [{}]'.format(container.name, target_file))
+
+    target = shlex.quote(target_file)
+    temporary = shlex.quote(temporary_file)
+    replace_file = (f'bash -c "if [ -e {target} ]; then '
+                    f'chown --reference={target} {temporary} && chmod --reference={target} {temporary}; '
+                    f'fi && mv -f {temporary} {target}"')
+
+    if execute.execute_command(container, replace_file) != 0:
+        execute.execute_command(container, f'rm -f {temporary}')
+        raise RuntimeError('[{}] failed to replace file [{}]'.format(container.name, target_file))
+
+
 def put_string_to_file(container, target_file, string):
-    """Echo `string` into `target_file` in `container`, overwriting existing contents.
+    """Write `string` into `target_file` in `container`, overwriting existing contents.
+
+    The string is written verbatim (encoded as UTF-8), so no shell quoting or escaping is
+    required of the caller. See `write_file` for details.
 
     Arguments:
     container -- docker.Container where the target_file is hosted
     target_file -- the path inside the container with the contents to overwrite
-    string -- contents to echo into the target file
+    string -- contents to write into the target file
     """
-    if execute.execute_command(container, f'bash -c \'echo "{string}" > {target_file}\'') != 0:
-        raise RuntimeError(f'[{container.name}] failed to put string to file [{target_file}]')
+    write_file(container, target_file, string.encode('utf-8'))
@@ -0,0 +1,197 @@
+# grown-up modules
+import json
+import logging
+
+# local modules
+from . import context
+from . import json_utils
+
+class config_session(object):
+    """A class that batches modifications to a JSON configuration file in a container.
+
+    The file is read from the container at most once, every patch is applied to the in-memory
+    copy, and the result is written back at most once when the session is committed. This
+    allows several independent configuration steps (e.g. TLS, federation, host resolution) to
+    modify server_config.json with a single round trip per container.
+
+    Sessions can be used as context managers, in which case the session is committed when the
+    block exits without an exception:
+
+        with config_session(container, reload_configuration=True) as session:
+            session.set_value(['log_level', 'server'], 'debug')
+    """
+
+    def __init__(self, container, path_to_config=None, reload_configuration=False):
+        """Constructor for `config_session`.
+
+        Arguments:
+        container -- the docker.Container hosting the configuration file
+        path_to_config -- path to the JSON file in the container (default: server_config.json)
+        reload_configuration -- if True, the iRODS server configuration is reloaded after the
+                                file is written (only applies to iRODS 5 servers)
+        """
+        self.container = container
+        self.path_to_config = path_to_config or context.server_config()
+        self.reload_configuration = reload_configuration
+        self.patches = list()
+        self.contents = None
+        self.dirty = False
+
+
+    def __enter__(self):
+        """Return self for use as a context manager."""
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Commit the session if no exception was raised in the managed block."""
+        if exc_type is None:
+            self.commit()
+
+
+    def config(self):
+        """Return the in-memory configuration with all patches applied so far.
+
+        The file is read from the container the first time this is called.
+        """
+        if self.contents is None:
+            self.contents = json_utils.get_json_from_file(self.container, self.path_to_config)
+
+        while self.patches:
+            patch = self.patches.pop(0)
+            result = patch(self.contents)
+            if result is not None:
+                self.contents = result
+
+        return self.contents
+
+
+    def patch(self, patch):
+        """Queue `patch` to be applied to the configuration and return self.
+
+        Arguments:
+        patch -- callable taking the configuration dict; it may modify the dict in place and
+                 return None, or return a replacement dict
+        """
+        self.patches.append(patch)
+        self.dirty = True
+        return self
+
+
+    def set_value(self, keys, value):
+        """Queue setting the value at the path of `keys` to `value` and return self.
+
+        Intermediate objects are created as needed.
+
+        Arguments:
+        keys -- list of keys leading to the member to set
+        value -- the value to set
+        """
+        def set_value_(config):
+            node = config
+            for k in keys[:-1]:
+                node = node.setdefault(k, dict())
+            node[keys[-1]] = value
+
+        return self.patch(set_value_)
+
+
+    def delete_value(self, keys):
+        """Queue removing the member at the path of `keys` (if it exists) and return self.
+
+        Arguments:
+        keys -- list of keys leading to the member to remove
+        """
+        def delete_value_(config):
+            node = config
+            for k in keys[:-1]:
+                node = node.get(k, dict())
+            node.pop(keys[-1], None)
+
+        return self.patch(delete_value_)
+
+
+    def extend_list(self, keys, values):
+        """Queue appending `values` to the list at the path of `keys` and return self.
+
+        Arguments:
+        keys -- list of keys leading to the list to extend
+        values -- list of values to append
+        """
+        def extend_list_(config):
+            node = config
+            for k in keys[:-1]:
+                node = node.setdefault(k, dict())
+            node.setdefault(keys[-1], list()).extend(values)
+
+        return self.patch(extend_list_)
+
+
+    def commit(self):
+        """Write the patched configuration to the container and reload it if requested.
+
+        Nothing is written if no patches have been queued since the session was created or last
+        committed.
+        """
+        from . import irods_config
+        from . import irods_setup
+
+        if not self.dirty:
+            logging.debug(f'[{self.container.name}]: nothing to commit for [{self.path_to_config}]')
+            return
+
+        config = self.config()
+
+        logging.debug(f'[{self.container.name}]: committing [{self.path_to_config}] [{json.dumps(config)}]')
+
+        json_utils.put_json_to_file(self.container, self.path_to_config, config)
+
+        self.dirty = False
+
+        if self.reload_configuration and irods_config.server_version_is_irods_5(self.container):
+            if irods_setup.reload_configuration(self.container) != 0:
+                raise RuntimeError(f'[{self.container.name}] failed to reload configuration')
+
+
+def open_sessions(docker_client, containers, reload_configuration=False):
+    """Return a dict mapping container names to new `config_session`s for server_config.json.
+
+    Arguments:
+    docker_client -- docker client for interacting with the docker-compose project
+    containers -- list of containers (or Compose containers) for which sessions are opened
+    reload_configuration -- passed to each `config_session`
+    """
+    return {
+        c.name: config_session(docker_client.containers.get(c.name),
+                               reload_configuration=reload_configuration)
+        for c in containers
+    }
+
+
+def commit_sessions(sessions):
+    """Commit each `config_session` in the dict `sessions` in parallel.
+
+    Arguments:
+    sessions -- dict mapping container names to `config_session`s
+    """
+    import concurrent.futures
+
+    rc = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        futures_to_containers = {
+            executor.submit(s.commit): name for name, s in sessions.items()
+        }
+
+        for f in concurrent.futures.as_completed(futures_to_containers):
+            container_name = futures_to_containers[f]
+            try:
+                f.result()
+                logging.debug(f'[{container_name}] configuration committed successfully')
+
+            except Exception as e:
+                logging.error(f'[{container_name}] exception raised while committing configuration')
+                logging.error(e)
+                rc = 1
+
+    if rc != 0:
+        raise RuntimeError('failed to commit configuration on some service')
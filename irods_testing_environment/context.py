@@ -38,13 +38,19 @@ class context(object):
         platform_service_instance -- service instance to target for platform derivation
         """
         if not self.platform_image_tag:
-            container = self.docker_client.containers.get(
-                container_name(
-                    self.compose_project.name,
-                    platform_service_name or irods_catalog_provider_service(),
-                    platform_service_instance,
+            try:
+                container = self.docker_client.containers.get(
+                    container_name(
+                        self.compose_project.name,
+                        platform_service_name or irods_catalog_provider_service(),
+                        platform_service_instance,
+                    )
                 )
-            )
+
+            except docker.errors.NotFound:
+                # Before the containers are brought up, the image which the service runs has the same information.
+                self.platform_image_tag = self._platform_from_image(platform_service_name)
+                return self.platform_image_tag
 
             # This is a reliable way to get the image tag for the platform. This has historically been derived from
             # the image layer history, but the images from the base layers can shift and information is lost over
@@ -58,6 +64,18 @@ class context(object):
 
         return self.platform_image_tag
 
+    def _platform_from_image(self, platform_service_name=None):
+        """Return the platform image tag from the image of a service which has not been brought up yet."""
+        service = platform_service_name or irods_catalog_provider_service()
+        image = self.docker_client.images.get(self.compose_project.config()["services"][service]["image"])
+
+        for variable in image.attrs["Config"].get("Env") or []:
+            name, _, value = variable.partition("=")
+            if name == "BASE_IMAGE_TAG":
+                return value.split("/")[-1]
+
+        raise RuntimeError(f"[{image.tags}]: Failed to get platform ID and version")
+
     def database(self, database_service_instance=1):
         """Return database Docker image from the database service in `self.compose_project`.
 
@@ -65,12 +83,19 @@ class context(object):
         database_service_instance -- service instance to target for database derivation
         """
         if not self.database_image_tag:
-            container = self.docker_client.containers.get(
-                container_name(self.compose_project.name, irods_catalog_database_service(), database_service_instance)
-            )
+            try:
+                container = self.docker_client.containers.get(
+                    container_name(self.compose_project.name, irods_catalog_database_service(), database_service_instance)
+                )
+                image = container.image.tags[0]
+
+            except docker.errors.NotFound:
+                # Before the containers are brought up, the service configuration names the image.
+                image = self.compose_project.config()["services"][irods_catalog_database_service()]["image"]
+
             # Just take the first tag as it is likely the database image tag. Some image tags use forward slashes as
             # delimiters, but the last part usually contains the platform name.
-            self.database_image_tag = container.image.tags[0].split("/")[-1]
+            self.database_image_tag = image.split("/")[-1]
 
         return self.database_image_tag
 
@@ -148,6 +173,12 @@ def core_re():
     return os.path.join(irods_config(), 'core.re')
 
 
+def default_vault_directory():
+    """Return the path to the vault of the default resource created by the iRODS setup script."""
+    import os
+    return os.path.join(irods_home(), 'Vault')
+
+
 def service_account_irods_env():
     """Return the path to the iRODS service account client environment file."""
     import os
@@ -89,6 +89,102 @@ class database_setup_strategy(object):
         """
         raise NotImplementedError('method not implemented for database strategy')
 
+    def provision(self, database, username, password, force_recreate=False):
+        """Create a database and a user which owns it, in one run of the database client.
+
+        The SQL is idempotent: the database and the user are only created if they do not exist.
+
+        This method must be overridden.
+
+        Arguments:
+        database -- name of the database to create
+        username -- name of the user to create and grant all privileges on the database
+        password -- password for the user
+        force_recreate -- if True, drops the database and the user before creating them
+
+        Returns:
+            A dict with the exit code of the client ('ec'), whether the database and the user
+            existed beforehand ('database_existed', 'user_existed'), and the names of the
+            databases on the server afterwards ('databases').
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def data_directory(self):
+        """Return the path to the directory in the database container holding its data.
+
+        This method must be overridden.
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def catalog_snapshot_name(self, name):
+        """Return the name of the snapshot which snapshot_catalog saves for database `name`."""
+        return '{}_snapshot'.format(name)
+
+    def snapshot_catalog(self, name):
+        """Save the contents of database `name` so that restore_catalog can bring them back.
+
+        Any existing snapshot of the database is replaced. Connections to the database are
+        closed, so the iRODS server should be stopped first.
+
+        This method must be overridden.
+
+        Arguments:
+        name -- name of the database to save
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def restore_catalog(self, name, owner):
+        """Replace database `name` with the contents saved by snapshot_catalog.
+
+        Connections to the database are closed, so the iRODS server should be stopped first.
+
+        This method must be overridden.
+
+        Arguments:
+        name -- name of the database to restore
+        owner -- name of the user which owns the database and has all privileges on it
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def default_command(self):
+        """Return the command which the official image of the database runs by default.
+
+        This method must be overridden.
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def profile_command_options(self, profile):
+        """Return the server options which make up a catalog profile (see catalog_profiles).
+
+        Arguments:
+        profile -- name of the catalog profile
+        """
+        return list()
+
+    def profile_tmpfs(self, profile):
+        """Return the paths in the database container to mount as tmpfs for a catalog profile.
+
+        Arguments:
+        profile -- name of the catalog profile
+        """
+        return list()
+
+    def snapshot_data_directory(self):
+        """Return the path where a snapshot image of the database keeps its data.
+
+        The data directory of the official database images is a volume, so `docker commit` does
+        not capture it. Snapshot images hold a copy of the data outside of the volume instead.
+        """
+        return self.data_directory().rstrip('/') + '-snapshot'
+
+    def snapshot_image_changes(self):
+        """Return Dockerfile instructions which make a snapshot image use its copy of the data."""
+        return list()
+
+    def snapshot_image_files(self):
+        """Return a dict mapping paths to contents of files to add to a snapshot image."""
+        return dict()
+
 
 class postgres_database_setup_strategy(database_setup_strategy):
     """Database setup strategy for postgres"""
@@ -198,10 +294,148 @@ class postgres_database_setup_strategy(database_setup_strategy):
         """List databases."""
         return self.execute_psql_command('\l')
 
+    def execute_psql_script(self, script):
+        """Run `script` in one psql process as the postgres user and return the exit code and output.
+
+        The script is passed to psql on stdin, so it can use psql meta-commands like \\gexec. psql
+        stops at the first error.
+
+        Arguments:
+        script -- SQL script to run
+        """
+        import base64
+
+        b64 = base64.b64encode(script.encode('utf-8')).decode('ascii')
+
+        cmd = ('bash -c \'printf %s {0} | base64 -d | psql --port {1} --no-psqlrc --quiet --tuples-only '
+               '--no-align --set ON_ERROR_STOP=1 --file=-\''.format(b64, self.port))
+
+        logging.debug('executing on [{0}] [{1}]'.format(self.container.name, script))
+
+        ec, out = self.container.exec_run(cmd, user='postgres')
+
+        return ec, out.decode('utf-8')
+
+    def provision(self, database, username, password, force_recreate=False):
+        """Create a database and a user which owns it, in one run of psql.
+
+        See database_setup_strategy.provision.
+        """
+        script = [
+            'SELECT json_build_object('
+            '\'database_existed\', EXISTS (SELECT FROM pg_database WHERE datname = \'{0}\'), '
+            '\'user_existed\', EXISTS (SELECT FROM pg_roles WHERE rolname = \'{1}\'));'
+        ]
+
+        if force_recreate:
+            script.extend(['DROP DATABASE IF EXISTS "{0}";', 'DROP ROLE IF EXISTS {1};'])
+
+        script.extend([
+            # CREATE DATABASE cannot run in a transaction or a function, so it is generated by a
+            # query and only executed (by \\gexec) when the database does not exist.
+            'SELECT \'CREATE DATABASE "{0}"\' WHERE NOT EXISTS (SELECT FROM pg_database WHERE datname = \'{0}\')\\gexec',
+            'DO $$BEGIN IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = \'{1}\') '
+            'THEN CREATE ROLE {1} LOGIN PASSWORD \'{2}\'; END IF; END$$;',
+            'GRANT ALL PRIVILEGES ON DATABASE "{0}" TO {1};',
+            'ALTER DATABASE "{0}" OWNER TO {1};',
+            'SELECT json_agg(datname ORDER BY datname) FROM pg_database WHERE NOT datistemplate;',
+        ])
+
+        ec, out = self.execute_psql_script('\n'.join(script).format(database, username, password) + '\n')
+
+        return _provision_result(ec, out)
+
+    def terminate_connections(self, name):
+        """Close every connection to database `name` (other than the one doing the closing).
+
+        Arguments:
+        name -- name of the database
+        """
+        return self.execute_psql_command(
+            'select pg_terminate_backend(pid) from pg_stat_activity '
+            'where datname = \'{}\' and pid <> pg_backend_pid();'.format(name))
+
+    def clone_database(self, template, name, owner=None):
+        """Replace database `name` with a copy of database `template`.
+
+        The copy is made by the server from the files of the template (CREATE DATABASE ...
+        TEMPLATE), which is much faster than loading a dump. No one may be connected to the
+        template while it is copied.
+
+        Arguments:
+        template -- name of the database to copy
+        name -- name of the new database
+        owner -- name of the user/role which owns the new database (default: the postgres user)
+        """
+        for database in [template, name]:
+            ec = self.terminate_connections(database)
+            if ec != 0:
+                return ec
+
+        ec = self.execute_psql_command('drop database if exists \\\"{}\\\";'.format(name))
+        if ec != 0:
+            return ec
+
+        return self.execute_psql_command('create database \\\"{0}\\\" template \\\"{1}\\\"{2};'
+            .format(name, template, ' owner {}'.format(owner) if owner else ''))
+
+    def snapshot_catalog(self, name):
+        """Save the contents of database `name` as a template database.
+
+        Arguments:
+        name -- name of the database to save
+        """
+        return self.clone_database(name, self.catalog_snapshot_name(name))
+
+    def restore_catalog(self, name, owner):
+        """Replace database `name` with a copy of the template database saved by snapshot_catalog.
+
+        Privileges granted on the database itself are not copied, but the owner has them all.
+
+        Arguments:
+        name -- name of the database to restore
+        owner -- name of the user which owns the database
+        """
+        return self.clone_database(self.catalog_snapshot_name(name), name, owner)
+
+    def data_directory(self):
+        """Return the path to the directory in the database container holding its data."""
+        return '/var/lib/postgresql/data'
+
+    def default_command(self):
+        """Return the command which the official image of the database runs by default."""
+        return ['postgres']
+
+    def profile_command_options(self, profile):
+        """Return the server options which make up a catalog profile (see catalog_profiles).
+
+        Arguments:
+        profile -- name of the catalog profile
+        """
+        settings = {
+            'fast': ['fsync=off', 'synchronous_commit=off', 'full_page_writes=off', 'shared_buffers=256MB'],
+            'durable': ['fsync=on', 'synchronous_commit=on', 'full_page_writes=on'],
+        }.get(profile, list())
+
+        return [option for setting in settings for option in ['-c', setting]]
+
+    def profile_tmpfs(self, profile):
+        """Return the paths in the database container to mount as tmpfs for a catalog profile.
+
+        Arguments:
+        profile -- name of the catalog profile
+        """
+        return [self.data_directory()] if profile == 'fast' else list()
+
+    def snapshot_image_changes(self):
+        """Return Dockerfile instructions which make a snapshot image use its copy of the data."""
+        # The entrypoint skips initialization when PGDATA already holds a database cluster.
+        return ['ENV PGDATA={}'.format(self.snapshot_data_directory())]
+
 
 class mysql_database_setup_strategy(database_setup_strategy):
     """Database setup strategy for mysql"""
-    def __init__(self, container=None, root_password=None, port=None, db_exec=None):
+    def __init__(self, container=None, root_password=None, port=None, db_exec=None, dump_exec=None):
         """Construct a mysql_database_setup_strategy.
 
         Arguments:
@@ -209,15 +443,71 @@ class mysql_database_setup_strategy(database_setup_strategy):
         root_password -- password for the root database user
         database_port -- port on which the postgres server is listening (default: 3306)
         db_exec -- name of the standard command-line client executable 
+        dump_exec -- name of the command-line dump executable
         """
         self.container = container
         self.root_password = root_password if root_password else 'testpassword'
         self.port = port if port else 3306
         self.db_exec = db_exec if db_exec else 'mysql'
+        self.dump_exec = dump_exec if dump_exec else 'mysqldump'
+        self.server_ready = False
         # TODO: 'irods'@'%' is generated by the docker entrypoint for mysql container...
         # should be 'irods'@'localhost', but that doesn't work right now
         self.host = '%'
 
+    def execute_mysql_script(self, script, user='root', password='testpassword'):
+        """Run `script` in one client process and return the exit code and output.
+
+        The output is tab-separated with no column names. The client stops at the first error.
+
+        Arguments:
+        script -- SQL statements to run
+        """
+        cmd = [self.db_exec, '--host', '127.0.0.1', '--port', str(self.port), '--user', user,
+               '--password={}'.format(password), '--batch', '--skip-column-names', '--execute', script]
+
+        logging.debug('executing on [{0}] [{1}]'.format(self.container.name, script))
+
+        ec, out = self.container.exec_run(cmd)
+
+        return ec, out.decode('utf-8')
+
+    def wait_for_server(self, timeout=120):
+        """Wait until the server accepts connections over TCP, for at most `timeout` seconds.
+
+        The entrypoint of the official images first runs a temporary server which does not listen
+        on the network, so a successful connection to 127.0.0.1 means the real server is up. The
+        check is only done once for each strategy.
+
+        Arguments:
+        timeout -- seconds after which RuntimeError is raised
+        """
+        if self.server_ready:
+            return
+
+        deadline = time.time() + timeout
+        delay = 0.25
+
+        logging.debug('checking if database is accepting connections [{}]'.format(self.container.name))
+
+        while True:
+            ec, _ = self.execute_mysql_script('SELECT 1;', password=self.root_password)
+            if ec == 0:
+                break
+
+            if time.time() + delay > deadline:
+                raise RuntimeError('database is not accepting connections after [{}] seconds [{}]'
+                                   .format(timeout, self.container.name))
+
+            logging.debug('database is not accepting connections yet, retrying in [{}] seconds'.format(delay))
+
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+        logging.debug('database is ready [{}]'.format(self.container.name))
+
+        self.server_ready = True
+
     def execute_mysql_command(self, mysql_cmd, user='root', password='testpassword'):
         """Execute a mysql command as the postgres user.
 
@@ -239,14 +529,7 @@ class mysql_database_setup_strategy(database_setup_strategy):
         as_user -- name of the user/role connecting to the database
         """
 
-        logging.debug('checking if database is accepting connection ...')
-
-        # Make sure the database is ready for connections.
-        while self.execute_mysql_command('SHOW DATABASES;') != 0:
-            logging.debug('database is not accepting connections yet. retrying in 5 seconds ...')
-            time.sleep(5)
-
-        logging.debug('database is ready!')
+        self.wait_for_server()
 
         return self.execute_mysql_command('\\r \'{}\''.format(name),
                                           user=as_user,
@@ -330,10 +613,101 @@ class mysql_database_setup_strategy(database_setup_strategy):
         """List databases."""
         return self.execute_mysql_command('SHOW DATABASES;')
 
+    def provision(self, database, username, password, force_recreate=False):
+        """Create a database and a user with all privileges on it, in one run of the client.
+
+        See database_setup_strategy.provision.
+        """
+        self.wait_for_server()
+
+        user = '\'{}\'@\'{}\''.format(username, self.host)
+
+        script = [
+            'SELECT JSON_OBJECT('
+            '\'database_existed\', EXISTS (SELECT 1 FROM information_schema.schemata WHERE schema_name = \'{0}\'), '
+            '\'user_existed\', EXISTS (SELECT 1 FROM mysql.user WHERE user = \'{1}\' AND host = \'{2}\'));'
+            .format(database, username, self.host)
+        ]
+
+        if force_recreate:
+            script.extend(['DROP DATABASE IF EXISTS {};'.format(database), 'DROP USER IF EXISTS {};'.format(user)])
+
+        script.extend([
+            'CREATE DATABASE IF NOT EXISTS {};'.format(database),
+            'CREATE USER IF NOT EXISTS {} IDENTIFIED BY \'{}\';'.format(user, password),
+            'GRANT ALL ON {}.* TO {};'.format(database, user),
+            'SELECT JSON_ARRAYAGG(schema_name) FROM information_schema.schemata;',
+        ])
+
+        ec, out = self.execute_mysql_script(' '.join(script), password=self.root_password)
+
+        return _provision_result(ec, out)
+
+    def catalog_snapshot_path(self, name):
+        """Return the path in the database container of the dump saved by snapshot_catalog.
+
+        Arguments:
+        name -- name of the database
+        """
+        return '/var/tmp/{}.sql'.format(self.catalog_snapshot_name(name))
+
+    def snapshot_catalog(self, name):
+        """Save the contents of database `name` to a dump file in the database container.
+
+        Arguments:
+        name -- name of the database to save
+        """
+        return execute.execute_command(self.container,
+            '{0} --host 127.0.0.1 --port {1} --user {2} --password={3} --single-transaction '
+            '--routines --result-file={4} {5}'
+            .format(self.dump_exec, self.port, 'root', self.root_password, self.catalog_snapshot_path(name), name))
+
+    def restore_catalog(self, name, owner):
+        """Replace database `name` by loading the dump saved by snapshot_catalog.
+
+        Privileges granted on the database are kept by the server when it is dropped, so the
+        owner has the same privileges on the restored database.
+
+        Arguments:
+        name -- name of the database to restore
+        owner -- name of the user which has all privileges on the database
+        """
+        return self.execute_mysql_command('DROP DATABASE IF EXISTS {0}; CREATE DATABASE {0}; USE {0}; source {1};'
+                                          .format(name, self.catalog_snapshot_path(name)))
+
+    def data_directory(self):
+        """Return the path to the directory in the database container holding its data."""
+        return '/var/lib/mysql'
+
+    def default_command(self):
+        """Return the command which the official image of the database runs by default."""
+        return ['mysqld']
+
+    def profile_command_options(self, profile):
+        """Return the server options which make up a catalog profile (see catalog_profiles).
+
+        Arguments:
+        profile -- name of the catalog profile
+        """
+        return {
+            # Flush the redo log to disk about once a second instead of at every commit.
+            'fast': ['--innodb-flush-log-at-trx-commit=2', '--innodb-buffer-pool-size=256M'],
+            'durable': ['--innodb-flush-log-at-trx-commit=1', '--innodb-doublewrite=ON'],
+        }.get(profile, list())
+
+    def snapshot_image_files(self):
+        """Return a dict mapping paths to contents of files to add to a snapshot image."""
+        # The entrypoint reads datadir from the server configuration and skips initialization
+        # when it already holds a database. Options in the Compose file's command still apply.
+        return {
+            '/etc/mysql/conf.d/zz-irods-snapshot.cnf':
+                '[mysqld]\ndatadir={}\n'.format(self.snapshot_data_directory())
+        }
+
 
 class mariadb_database_setup_strategy(mysql_database_setup_strategy):
     """Database setup strategy for mariadb"""
-    def __init__(self, container=None, root_password=None, port=None, db_exec=None):
+    def __init__(self, container=None, root_password=None, port=None, db_exec=None, dump_exec=None):
         """Construct a mysql_database_setup_strategy.
 
         Arguments:
@@ -341,9 +715,15 @@ class mariadb_database_setup_strategy(mysql_database_setup_strategy):
         root_password -- password for the root database user
         database_port -- port on which the postgres server is listening (default: 3306)
         db_exec -- name of the standard command-line client executable 
+        dump_exec -- name of the command-line dump executable
         """
         db_exec = db_exec if db_exec else 'mariadb'
-        super(mariadb_database_setup_strategy, self).__init__(container, root_password, port, db_exec)
+        dump_exec = dump_exec if dump_exec else 'mariadb-dump'
+        super(mariadb_database_setup_strategy, self).__init__(container, root_password, port, db_exec, dump_exec)
+
+    def default_command(self):
+        """Return the command which the official image of the database runs by default."""
+        return ['mariadbd']
 
     def execute_mariadb_command(self, mariadb_cmd, user='root', password='testpassword'):
         """Execute a mariadb command.
@@ -354,6 +734,108 @@ class mariadb_database_setup_strategy(mysql_database_setup_strategy):
         return self.execute_mysql_command(mariadb_cmd, root, password)
 
 
+def catalog_profiles():
+    """Return the names of the catalog profiles (see add_catalog_profile_to_project).
+
+    default -- the settings in the Compose project are used as they are
+    fast -- the server does not wait for data to reach the disk, which is safe for disposable
+            test catalogs but loses data if the container crashes; Postgres also keeps its data
+            on tmpfs
+    durable -- every commit is flushed to disk, for runs which check crash safety or which
+               should match production settings
+    """
+    return ['default', 'fast', 'durable']
+
+def add_catalog_profile_to_project(compose_project, profile, data_on_tmpfs=True, path_to_override=None):
+    """Apply a catalog profile to the database service of a Compose project.
+
+    The server options for the profile are appended to the command of the database service in
+    an override file, so this must be called before the containers are brought up.
+
+    Arguments:
+    compose_project -- compose.Project with the database service
+    profile -- name of the catalog profile (see catalog_profiles)
+    data_on_tmpfs -- if False, the data directory is not mounted as tmpfs even if the profile
+                     asks for it. The contents of a tmpfs are lost when the database container
+                     stops, so zones which are committed to snapshots must keep their data.
+    path_to_override -- path to the override file to write (default: a new temporary file)
+    """
+    import json
+    import os
+    import shlex
+    import tempfile
+
+    if profile not in catalog_profiles():
+        raise ValueError('unknown catalog profile [{}], expected one of {}'.format(profile, catalog_profiles()))
+
+    if profile == 'default':
+        return
+
+    service = compose_project.config()['services'][context.irods_catalog_database_service()]
+
+    strat = make_strategy(service['image'])
+
+    command = service.get('command') or strat.default_command()
+    if isinstance(command, str):
+        command = shlex.split(command)
+
+    override = {
+        'services': {
+            context.irods_catalog_database_service(): {
+                'command': list(command) + strat.profile_command_options(profile),
+            }
+        }
+    }
+
+    tmpfs = strat.profile_tmpfs(profile) if data_on_tmpfs else list()
+    if tmpfs:
+        override['services'][context.irods_catalog_database_service()]['tmpfs'] = tmpfs
+
+    if not path_to_override:
+        fd, path_to_override = tempfile.mkstemp(prefix=compose_project.name + '-catalog-profile-', suffix='.yml')
+        os.close(fd)
+
+    with open(path_to_override, 'w') as f:
+        json.dump(override, f, indent=4)
+
+    compose_project.add_override_file(path_to_override)
+
+    logging.info('using catalog profile [{}] for project [{}]'.format(profile, compose_project.name))
+
+def _provision_result(ec, out):
+    """Return the result of a provision script from the client's exit code and output.
+
+    The provision scripts print a JSON object with what existed beforehand and finish by
+    printing a JSON array of the databases on the server.
+
+    Arguments:
+    ec -- exit code of the client
+    out -- output of the client
+    """
+    import json
+
+    result = {'ec': ec, 'database_existed': None, 'user_existed': None, 'databases': None}
+
+    for line in out.splitlines():
+        line = line.strip()
+
+        try:
+            if line.startswith('{'):
+                existed = json.loads(line)
+                result['database_existed'] = bool(existed['database_existed'])
+                result['user_existed'] = bool(existed['user_existed'])
+
+            elif line.startswith('['):
+                result['databases'] = sorted(json.loads(line))
+
+        except (ValueError, KeyError):
+            logging.debug('ignoring unexpected output from provision script [{}]'.format(line))
+
+    if ec != 0:
+        logging.error('provision script failed [ec=[{}]]:\n{}'.format(ec, out))
+
+    return result
+
 def make_strategy(database_image, container=None, database_port=None, root_password=None):
     """Make a database setup strategy for the given database type.
 
@@ -394,19 +876,66 @@ def setup_catalog(ctx,
 
     strat = make_strategy(ctx.database(), db_container, database_port, root_password)
 
-    ec = strat.create_database(database_name, force_recreate)
-    if ec != 0:
-        raise RuntimeError('failed to create database [{}]'.format(database_name))
+    result = strat.provision(database_name, database_user, database_password, force_recreate)
+    if result['ec'] != 0:
+        raise RuntimeError('failed to create database [{0}] and user [{1}] with privileges on it [{2}]'
+                           .format(database_name, database_user, db_container.name))
 
-    ec = strat.create_user(database_user, database_password, force_recreate)
-    if ec != 0:
-        raise RuntimeError('failed to create user [{}]'.format(database_user))
+    logging.info('catalog provisioned [{}] [{}]'.format(db_container.name, result))
+
+def snapshot_catalog(ctx,
+                     database_port=None,
+                     service_instance=1,
+                     database_name='ICAT',
+                     root_password=None):
+    """Save the iRODS catalog on the specified database service so that it can be restored.
+
+    The iRODS servers using the catalog should be stopped first.
+
+    Arguments:
+    database_port -- the port on which the database service is listening
+    service_instance -- service instance number for the database service being targeted
+    database_name -- name of the iRODS database (for testing, this should be 'ICAT')
+    root_password -- password for the root database user
+    """
+    db_container = ctx.docker_client.containers.get(
+        context.irods_catalog_database_container(ctx.compose_project.name, service_instance))
+
+    logging.info('saving snapshot of catalog [{}]'.format(db_container.name))
+
+    strat = make_strategy(ctx.database(), db_container, database_port, root_password)
 
-    ec = strat.grant_privileges(database_name, database_user)
+    ec = strat.snapshot_catalog(database_name)
     if ec != 0:
-        raise RuntimeError('failed to grant privileges to user [{0}] on database [{1}]'.format(database_user, database_name))
+        raise RuntimeError('failed to save snapshot of database [{}] [{}]'.format(database_name, db_container.name))
 
-    strat.list_databases()
+def restore_catalog(ctx,
+                    database_port=None,
+                    service_instance=1,
+                    database_name='ICAT',
+                    database_user='irods',
+                    root_password=None):
+    """Restore the iRODS catalog on the specified database service from its snapshot.
+
+    See snapshot_catalog. The iRODS servers using the catalog should be stopped first.
+
+    Arguments:
+    database_port -- the port on which the database service is listening
+    service_instance -- service instance number for the database service being targeted
+    database_name -- name of the iRODS database (for testing, this should be 'ICAT')
+    database_user -- name of the iRODS database user (for testing, this should be 'irods')
+    root_password -- password for the root database user
+    """
+    db_container = ctx.docker_client.containers.get(
+        context.irods_catalog_database_container(ctx.compose_project.name, service_instance))
+
+    logging.info('restoring catalog from snapshot [{}]'.format(db_container.name))
+
+    strat = make_strategy(ctx.database(), db_container, database_port, root_password)
+
+    ec = strat.restore_catalog(database_name, database_user)
+    if ec != 0:
+        raise RuntimeError('failed to restore database [{}] [{}]'.format(database_name, db_container.name))
 
 def wait_for_database_service(ctx,
                               database_service_instance=1,
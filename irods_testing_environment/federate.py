@@ -1,12 +1,111 @@
 # grown-up modules
 import logging
+import shlex
 
 # local modules
 from . import context
 from . import execute
-from . import irods_config
+from . import governor
 from . import irods_setup
-from . import json_utils
+
+def topology_kinds():
+    """Return the names of the federation topologies which make_topology can generate."""
+    return ['clique', 'star', 'ring', 'pairs']
+
+
+def clique_topology(zone_names):
+    """Return a topology in which every zone is federated with every other zone.
+
+    A topology is a dict mapping each zone name to the sorted list of the zones it is federated
+    with. Federation is always both ways, so each zone is also in the lists of its peers.
+
+    Arguments:
+    zone_names -- names of the zones in the topology
+    """
+    return {z: sorted(p for p in zone_names if p != z) for z in zone_names}
+
+
+def pairs_topology(zone_names, pairs):
+    """Return a topology in which only the given pairs of zones are federated (see clique_topology).
+
+    Arguments:
+    zone_names -- names of the zones in the topology
+    pairs -- list of pairs of zone names to federate with each other
+    """
+    topology = {z: set() for z in zone_names}
+
+    for a, b in pairs:
+        if a not in topology or b not in topology:
+            raise ValueError('federation pair [{}, {}] names a zone not in {}'.format(a, b, list(zone_names)))
+
+        if a == b:
+            raise ValueError('cannot federate zone [{}] with itself'.format(a))
+
+        topology[a].add(b)
+        topology[b].add(a)
+
+    return {z: sorted(peers) for z, peers in topology.items()}
+
+
+def star_topology(zone_names, hub=None):
+    """Return a topology in which one zone is federated with each of the others (see clique_topology).
+
+    Arguments:
+    zone_names -- names of the zones in the topology
+    hub -- name of the zone in the middle of the star (default: the first zone)
+    """
+    hub = hub or zone_names[0]
+
+    return pairs_topology(zone_names, [(hub, z) for z in zone_names if z != hub])
+
+
+def ring_topology(zone_names):
+    """Return a topology in which each zone is federated with the zones next to it (see clique_topology).
+
+    Arguments:
+    zone_names -- names of the zones in the topology, in ring order
+    """
+    if len(zone_names) < 3:
+        return clique_topology(zone_names)
+
+    return pairs_topology(zone_names, [(z, zone_names[(i + 1) % len(zone_names)]) for i, z in enumerate(zone_names)])
+
+
+def make_topology(kind, zone_names, pairs=None):
+    """Return the federation topology of the given kind for `zone_names` (see clique_topology).
+
+    Arguments:
+    kind -- name of the kind of topology (see topology_kinds)
+    zone_names -- names of the zones in the topology
+    pairs -- list of pairs of zone names to federate (only for 'pairs')
+    """
+    if kind == 'clique':
+        return clique_topology(zone_names)
+
+    if kind == 'star':
+        return star_topology(zone_names)
+
+    if kind == 'ring':
+        return ring_topology(zone_names)
+
+    if kind == 'pairs':
+        return pairs_topology(zone_names, pairs or list())
+
+    raise ValueError('unknown federation topology [{}], expected one of {}'.format(kind, topology_kinds()))
+
+
+def peer_zones(zone_info_list, topology, local_zone):
+    """Return the information for the zones `local_zone` is federated with in `topology`.
+
+    Arguments:
+    zone_info_list -- list of information about the zones in the topology
+    topology -- dict mapping zone names to the names of their peers (see clique_topology)
+    local_zone -- information about the zone whose peers are returned
+    """
+    peers = topology.get(local_zone.zone_name, list())
+
+    return [z for z in zone_info_list if z.zone_name in peers]
+
 
 def make_federation_entry(ctx, local_zone, remote_zone):
     """Create an entry for the federation stanza to federate two zones together.
@@ -27,9 +126,37 @@ def make_federation_entry(ctx, local_zone, remote_zone):
     }
 
 
-def federate_zones(ctx, zone_info_list, local_zone, include_consumers=True):
+def make_remote_zones(ctx, container, remote_zones):
+    """Create a remote zone in the catalog of the provider in `container` for each of `remote_zones`.
+
+    All of the iadmin commands run in a single exec in the container.
+
+    Arguments:
+    ctx -- context object which contains information about the Docker environment
+    container -- the container running the iRODS catalog service provider of the local zone
+    remote_zones -- list of iRODS Zone information for the remote zones
+    """
+    if not remote_zones:
+        return
+
+    make_remote_zones = ' && '.join(
+        'iadmin mkzone {} remote {}:{}'.format(shlex.quote(z.zone_name), z.provider_hostname(ctx), z.zone_port)
+        for z in remote_zones)
+
+    logging.info('creating [{}] remote zones [{}]'.format(len(remote_zones), container.name))
+
+    if execute.execute_command(container, 'bash -c {}'.format(shlex.quote(make_remote_zones)), user='irods') != 0:
+        raise RuntimeError('failed to create remote zones {} [{}]'
+                           .format([z.zone_name for z in remote_zones], container.name))
+
+
+def federate_zones(ctx, zone_info_list, local_zone, include_consumers=True, config_sessions=None):
     """Federate `local_zone` with each zone in `zone_info_list`.
 
+    The federation stanza of each server in `local_zone` is written once with an entry for every
+    remote zone, after which the server reloads its configuration, and the remote zones are all
+    created in one exec on the catalog service provider.
+
     Arguments:
     ctx -- context object which contains information about the Docker environment
     zone_info_list -- list of iRODS Zone information for the Zones to federate
@@ -37,7 +164,18 @@ def federate_zones(ctx, zone_info_list, local_zone, include_consumers=True):
     include_consumers -- if True, a Federation stanza will be included for every iRODS catalog
                          service consumer in `local_zone` in addition to the catalog service
                          provider (which is not optional in the federation configuration)
+    config_sessions -- dict mapping container names to config_sessions in which to batch the
+                       federation stanzas (optional). If provided, the caller is responsible for
+                       committing the sessions and reloading the server configuration.
     """
+    from . import config_session
+
+    remote_zones = [z for z in zone_info_list if z.zone_name != local_zone.zone_name]
+
+    if not remote_zones:
+        logging.info('no zones to federate with local zone [{}]'.format(local_zone.zone_name))
+        return
+
     # Every iRODS server in the Zone must be federated
     for c in ctx.compose_project.containers():
         if not context.is_irods_server_in_local_zone(c, local_zone): continue
@@ -51,51 +189,68 @@ def federate_zones(ctx, zone_info_list, local_zone, include_consumers=True):
 
         container = ctx.docker_client.containers.get(c.name)
 
-        server_config = json_utils.get_json_from_file(container, context.server_config())
-
-        for remote_zone in zone_info_list:
-            if remote_zone.zone_name == local_zone.zone_name: continue
+        if config_sessions is not None:
+            session = config_sessions[c.name]
+        else:
+            # The iRODS 5 server only picks up the federation stanza when its configuration is reloaded.
+            session = config_session.config_session(container, reload_configuration=True)
 
-            logging.warning('federating remote zone [{}] with local zone [{}] on [{}]'
-                            .format(remote_zone.zone_name, local_zone.zone_name, container.name))
+        logging.warning('federating remote zones {} with local zone [{}] on [{}]'
+                        .format([z.zone_name for z in remote_zones], local_zone.zone_name, container.name))
 
-            server_config['federation'].append(make_federation_entry(ctx,
-                                                                     local_zone,
-                                                                     remote_zone))
+        session.extend_list(['federation'], [make_federation_entry(ctx, local_zone, z) for z in remote_zones])
 
-            # Only make the remote Zone once per local Zone
-            if context.is_irods_catalog_provider_container(container):
-                make_remote_zone = 'iadmin mkzone {} remote {}:{}'.format(remote_zone.zone_name,
-                                                                          remote_zone.provider_hostname(ctx),
-                                                                          remote_zone.zone_port)
+        # Only make the remote Zones once per local Zone
+        if context.is_irods_catalog_provider_container(container):
+            make_remote_zones(ctx, container, remote_zones)
 
-                if execute.execute_command(container, make_remote_zone, user="irods") != 0:
-                    raise RuntimeError('failed to create remote zone [{}]'
-                                       .format(container.name))
+        # The caller is batching configuration changes and will write them out later.
+        if config_sessions is not None: continue
 
         # Write out the server_config.json to the iRODS server container to complete the federation
-        json_utils.put_json_to_file(container, context.server_config(), server_config)
-
-        # Restart iRODS server in order for federation configuration to take effect.
-        if irods_config.server_version_is_irods_5(container) and irods_setup.restart_irods(container) != 0:
-            raise RuntimeError(f"[{container.name}] failed to reload configuration after configuring federation")
+        session.commit()
 
 
-def form_federation_clique(ctx, zone_info_list, include_consumers=True):
+def form_federation_clique(ctx, zone_info_list, include_consumers=True, config_sessions=None):
     """Federate each zone in `zone_info_list` with every other zone in `zone_info_list`.
 
     Arguments:
     ctx - context which holds information about the Compose environment
     zone_info_list - list of information about Zones which will be federated with one another
+    config_sessions - dict mapping container names to config_sessions in which to batch the
+                      federation stanzas (optional, see federate_zones)
+    """
+    # configure federation between all zones (O(len(zone_names)^2))
+    form_federation(ctx,
+                    zone_info_list,
+                    clique_topology([z.zone_name for z in zone_info_list]),
+                    include_consumers,
+                    config_sessions)
+
+
+def form_federation(ctx, zone_info_list, topology, include_consumers=True, config_sessions=None):
+    """Federate the zones in `zone_info_list` with each other as described by `topology`.
+
+    Arguments:
+    ctx - context which holds information about the Compose environment
+    zone_info_list - list of information about Zones which will be federated with one another
+    topology - dict mapping zone names to the names of their peers (see clique_topology)
+    config_sessions - dict mapping container names to config_sessions in which to batch the
+                      federation stanzas (optional, see federate_zones)
     """
     import concurrent.futures
 
     rc = 0
 
-    # configure federation between all zones (O(len(zone_names)^2))
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(len(zone_info_list))) as executor:
         futures_to_containers = {
-            executor.submit(federate_zones, ctx, zone_info_list, z, include_consumers):
+            executor.submit(federate_zones,
+                            ctx,
+                            peer_zones(zone_info_list, topology, z),
+                            z,
+                            include_consumers,
+                            config_sessions):
                 z for z in zone_info_list
         }
 
@@ -112,3 +267,106 @@ def form_federation_clique(ctx, zone_info_list, include_consumers=True):
 
     if rc != 0:
         raise RuntimeError('failed to federate one or more iRODS Zones, ec=[{}]'.format(rc))
+
+
+def zone_container_names(ctx, zone):
+    """Return the names of the containers running the iRODS servers in `zone`.
+
+    Arguments:
+    ctx -- context which holds information about the Compose environment
+    zone -- information about the Zone
+    """
+    consumer_service_instances = zone.consumer_service_instances
+    if consumer_service_instances is None:
+        consumer_service_instances = [
+            context.service_instance(c.name)
+            for c in ctx.compose_project.containers(service_names=[context.irods_catalog_consumer_service()])
+        ]
+
+    return [context.irods_catalog_provider_container(ctx.compose_project.name, zone.provider_service_instance)] + [
+        context.irods_catalog_consumer_container(ctx.compose_project.name, i) for i in consumer_service_instances
+    ]
+
+
+def add_federation_tasks(graph,
+                         ctx,
+                         zone_info_list,
+                         setup_tasks=None,
+                         include_consumers=True,
+                         config_sessions=None,
+                         topology=None):
+    """Add a task to a task_graph for each zone in `zone_info_list` which federates it with its peers.
+
+    Federating a zone only changes its own servers, so each task only waits for the servers of its
+    own zone to be set up.
+
+    Arguments:
+    graph -- the task_graph to which the tasks are added
+    ctx -- context which holds information about the Compose environment
+    zone_info_list -- list of information about Zones which will be federated with one another
+    setup_tasks -- dict mapping container names to the names of tasks in `graph` which set them up
+                   (see services.add_setup_tasks)
+    include_consumers -- see federate_zones
+    config_sessions -- see federate_zones
+    topology -- dict mapping zone names to the names of their peers (default: every zone is
+                federated with every other zone, see clique_topology)
+
+    Returns:
+        A dict mapping zone names to the names of the tasks which federate them.
+    """
+    setup_tasks = setup_tasks or dict()
+    topology = topology or clique_topology([z.zone_name for z in zone_info_list])
+
+    federation_tasks = dict()
+
+    for z in zone_info_list:
+        federation_tasks[z.zone_name] = graph.add_task(
+            'federate zone [{}]'.format(z.zone_name),
+            lambda z=z: federate_zones(ctx,
+                                       peer_zones(zone_info_list, topology, z),
+                                       z,
+                                       include_consumers,
+                                       config_sessions),
+            dependencies=[setup_tasks[name] for name in zone_container_names(ctx, z) if name in setup_tasks])
+
+    return federation_tasks
+
+
+def setup_federated_zones(ctx,
+                          zone_info_list,
+                          installer=None,
+                          include_consumers=True,
+                          config_sessions=None,
+                          topology=None,
+                          **kwargs):
+    """Set up the zones in `zone_info_list` and federate them with each other.
+
+    Installation, setup, and federation are one task graph (see services.setup_irods_zones), so
+    every zone is set up at the same time and is federated as soon as its own servers are ready.
+    Each server gets one write of its federation stanza and one configuration reload (or none, if
+    `config_sessions` is provided).
+
+    Arguments:
+    ctx -- context which holds information about the Compose environment
+    zone_info_list -- list of information about Zones to set up and federate
+    installer -- the installer for the platform (see install.make_installer). If None, the
+                 packages are assumed to be installed already.
+    include_consumers -- see federate_zones
+    config_sessions -- see federate_zones
+    topology -- see add_federation_tasks
+    kwargs -- options passed to services.add_setup_tasks
+    """
+    from . import services
+    from . import task_graph
+
+    graph = task_graph.task_graph()
+
+    setup_tasks = services.add_setup_tasks(graph, ctx, zone_info_list, installer=installer, **kwargs)
+
+    add_federation_tasks(graph, ctx, zone_info_list, setup_tasks, include_consumers, config_sessions, topology)
+
+    try:
+        graph.run()
+
+    finally:
+        logging.info(graph.report())
@@ -0,0 +1,289 @@
+# grown-up modules
+import json
+import logging
+import os
+import shlex
+import time
+
+# local modules
+from . import context
+from . import execute
+from . import federate
+from . import governor
+from . import irods_setup
+
+def report_file_name():
+    """Return the name of the file in the output directory which holds the federation scale report."""
+    return 'federation_scale_report.json'
+
+
+def zone_names(zone_count):
+    """Return the names of the zones for a federation scale step with `zone_count` zones."""
+    return ['fedZone{}'.format(i + 1) for i in range(zone_count)]
+
+
+def probe_collection(zone_name):
+    """Return the collection in `zone_name` which holds the data object read from remote zones."""
+    return '/{}/home/public'.format(zone_name)
+
+
+def probe_data_object(zone_name):
+    """Return the path to the data object in `zone_name` which is read from remote zones."""
+    return '/'.join([probe_collection(zone_name), 'federation_scale_probe'])
+
+
+def prepare_remote_access(ctx, zone_info_list, topology, probe_size=1024 ** 2):
+    """Give the administrator of each zone access to the probe data object of each of its peers.
+
+    In each zone, a user is created for the administrator of every peer zone (e.g. rods#otherZone)
+    and a data object of `probe_size` bytes is put in the public collection for them to read. All
+    of the commands for a zone run in one exec on its catalog service provider.
+
+    Arguments:
+    ctx -- context which holds information about the Compose environment
+    zone_info_list -- list of information about the federated zones
+    topology -- dict mapping zone names to the names of their peers (see federate.clique_topology)
+    probe_size -- size of the probe data object in bytes
+    """
+    import concurrent.futures
+
+    def prepare(zone):
+        commands = ['iadmin mkuser {} rodsuser'.format(shlex.quote('rods#' + peer))
+                    for peer in topology.get(zone.zone_name, list())]
+
+        commands.extend([
+            'head -c {} /dev/urandom > /tmp/federation_scale_probe'.format(probe_size),
+            'iput -f /tmp/federation_scale_probe {}'.format(probe_data_object(zone.zone_name)),
+            'ichmod read public {}'.format(probe_collection(zone.zone_name)),
+            'ichmod read public {}'.format(probe_data_object(zone.zone_name)),
+        ])
+
+        container = zone.provider_container(ctx)
+
+        if execute.execute_command(container, 'bash -c {}'.format(shlex.quote(' && '.join(commands))),
+                                   user='irods') != 0:
+            raise RuntimeError('failed to prepare remote access to zone [{}] [{}]'
+                               .format(zone.zone_name, container.name))
+
+    rc = 0
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(len(zone_info_list))) as executor:
+        futures_to_zones = {executor.submit(prepare, z): z for z in zone_info_list}
+
+        for f in concurrent.futures.as_completed(futures_to_zones):
+            z = futures_to_zones[f]
+            try:
+                f.result()
+
+            except Exception as e:
+                logging.error('exception raised while preparing remote access to zone [{}]'.format(z.zone_name))
+                logging.error(e)
+                rc = 1
+
+    if rc != 0:
+        raise RuntimeError('failed to prepare remote access to one or more zones')
+
+
+def time_command(container, command, samples):
+    """Run `command` in `container` `samples` times and return how long each run took in seconds.
+
+    The runs are timed in the container, so the time it takes to exec into it is not counted.
+
+    Arguments:
+    container -- the container in which the command runs (as the service account)
+    command -- the command to time
+    samples -- number of times to run the command
+    """
+    script = 'for i in $(seq {}); do ' \
+             's=$(date +%s%N); {} > /dev/null || exit 1; e=$(date +%s%N); echo $((e - s)); ' \
+             'done'.format(samples, command)
+
+    ec, out = container.exec_run('bash -c {}'.format(shlex.quote(script)), user='irods')
+
+    if ec != 0:
+        raise RuntimeError('[{}] failed to run [{}]: {}'.format(container.name, command, out.decode('utf-8')))
+
+    return [int(line) / 1e9 for line in out.decode('utf-8').split()]
+
+
+def federated_pairs(topology, max_pairs=None):
+    """Return the (local, remote) zone name pairs in `topology`, spread out to at most `max_pairs`.
+
+    Arguments:
+    topology -- dict mapping zone names to the names of their peers (see federate.clique_topology)
+    max_pairs -- maximum number of pairs to return (default: all of them)
+    """
+    pairs = [(local, remote) for local in sorted(topology) for remote in topology[local]]
+
+    if max_pairs and len(pairs) > max_pairs:
+        step = len(pairs) / max_pairs
+        pairs = [pairs[int(i * step)] for i in range(max_pairs)]
+
+    return pairs
+
+
+def measure_remote_operations(ctx, zone_info_list, topology, samples=5, max_pairs=None):
+    """Return the latency of listing and reading data in remote zones for pairs of federated zones.
+
+    For each (local, remote) pair, the administrator of the local zone lists the public collection
+    of the remote zone (ils) and reads its probe data object (iget) from the catalog service
+    provider of the local zone. The pairs are measured one at a time so they do not slow each
+    other down.
+
+    Arguments:
+    ctx -- context which holds information about the Compose environment
+    zone_info_list -- list of information about the federated zones
+    topology -- dict mapping zone names to the names of their peers (see federate.clique_topology)
+    samples -- number of times each operation is run for each pair
+    max_pairs -- maximum number of pairs to measure (see federated_pairs)
+
+    Returns:
+        A dict mapping operation names to lists of latencies in seconds.
+    """
+    zones = {z.zone_name: z for z in zone_info_list}
+
+    latencies = {'ils': list(), 'iget': list()}
+
+    for local, remote in federated_pairs(topology, max_pairs):
+        container = zones[local].provider_container(ctx)
+
+        logging.info('measuring remote operations from [{}] to [{}]'.format(local, remote))
+
+        latencies['ils'].extend(
+            time_command(container, 'ils {}'.format(probe_collection(remote)), samples))
+
+        latencies['iget'].extend(
+            time_command(container, 'iget -f {} -'.format(probe_data_object(remote)), samples))
+
+    return latencies
+
+
+def summarize(latencies):
+    """Return a dict with the count, mean, median, 95th percentile, and maximum of `latencies`."""
+    if not latencies:
+        return {'count': 0}
+
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': percentile(0.5),
+        'p95': percentile(0.95),
+        'max': ordered[-1],
+    }
+
+
+def run_scale_step(ctx,
+                   zone_count,
+                   topology_kind='clique',
+                   pairs=None,
+                   installer=None,
+                   samples=5,
+                   max_pairs=20,
+                   cleanup_containers=True,
+                   **kwargs):
+    """Stand up and federate `zone_count` zones, measure remote operations, and return the results.
+
+    Arguments:
+    ctx -- context which holds information about the Compose environment
+    zone_count -- number of zones to stand up, each with a catalog service provider and no consumers
+    topology_kind -- which zones to federate with each other (see federate.make_topology)
+    pairs -- list of pairs of zone names to federate (only for 'pairs')
+    installer -- the installer for the platform (see install.make_installer). If None, the
+                 packages are assumed to be installed already.
+    samples -- number of times each operation is run for each pair of zones
+    max_pairs -- maximum number of pairs of zones to measure
+    cleanup_containers -- if True, the containers are torn down at the end of the step
+    kwargs -- options passed to federate.setup_federated_zones
+    """
+    names = zone_names(zone_count)
+    topology = federate.make_topology(topology_kind, names, pairs)
+
+    memory = governor.default_governor().zone_memory(ctx.compose_project) * zone_count
+    if memory > governor.available_memory_bytes():
+        logging.warning('[{}] zones are expected to use [{}MiB] of memory, which is more than is available'
+                        .format(zone_count, memory // 1024 ** 2))
+
+    try:
+        logging.warning('standing up [{}] zones federated as a [{}]'.format(zone_count, topology_kind))
+
+        start = time.time()
+
+        ctx.compose_project.up(scale_override={
+            context.irods_catalog_database_service(): zone_count,
+            context.irods_catalog_provider_service(): zone_count,
+            context.irods_catalog_consumer_service(): 0
+        })
+
+        zone_info_list = irods_setup.get_info_for_zones(ctx, names)
+
+        federate.setup_federated_zones(ctx,
+                                       zone_info_list,
+                                       installer=installer,
+                                       include_consumers=False,
+                                       topology=topology,
+                                       **kwargs)
+
+        standup = time.time() - start
+
+        prepare_remote_access(ctx, zone_info_list, topology)
+
+        latencies = measure_remote_operations(ctx, zone_info_list, topology, samples, max_pairs)
+
+    finally:
+        if cleanup_containers:
+            ctx.compose_project.down(include_volumes=True, remove_image_type=False)
+
+    return {
+        'zone_count': zone_count,
+        'topology': topology_kind,
+        'federation_links': sum(len(peers) for peers in topology.values()) // 2,
+        'standup_seconds': standup,
+        'pairs_measured': len(federated_pairs(topology, max_pairs)),
+        'operations': {operation: summarize(l) for operation, l in latencies.items()},
+    }
+
+
+def write_report(results, output_directory):
+    """Write the results of a federation scale run and return the path to the report.
+
+    Arguments:
+    results -- list of results from run_scale_step
+    output_directory -- directory in which the report is written
+    """
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'steps': results,
+    }
+
+    path = os.path.join(output_directory, report_file_name())
+
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    return path
+
+
+def result_string(results):
+    """Return a string with a table of the results of a federation scale run."""
+    r = '==== begin federation scale results ====\n'
+    r = r + '{:>6} {:<8} {:>6} {:>10}  {:<5} {:>9} {:>9} {:>9}\n'.format(
+        'zones', 'topology', 'links', 'standup', 'op', 'mean', 'p95', 'max')
+
+    for result in results:
+        for operation, summary in sorted(result['operations'].items()):
+            if not summary['count']:
+                continue
+
+            r = r + '{:>6} {:<8} {:>6} {:>9.1f}s  {:<5} {:>8.3f}s {:>8.3f}s {:>8.3f}s\n'.format(
+                result['zone_count'], result['topology'], result['federation_links'], result['standup_seconds'],
+                operation, summary['mean'], summary['p95'], summary['max'])
+
+    r = r + '==== end of federation scale results ====\n'
+
+    return r
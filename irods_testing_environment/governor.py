@@ -0,0 +1,317 @@
+# grown-up modules
+import contextlib
+import logging
+import os
+import re
+import threading
+import time
+
+# local modules
+from . import context
+
+# Expected memory use of each service in a zone, not counting shared memory. These are rough
+# figures for a zone running the core test suite and only need to be in the right range.
+SERVICE_MEMORY_ESTIMATES = {
+    context.irods_catalog_database_service(): 512 * 1024 ** 2,
+    context.irods_catalog_provider_service(): 1024 ** 3,
+    context.irods_catalog_consumer_service(): 768 * 1024 ** 2,
+}
+
+_default_governor = None
+_default_governor_lock = threading.Lock()
+
+
+def host_cpu_count():
+    """Return the number of CPUs available to this process."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def host_memory_bytes():
+    """Return the total physical memory of the host in bytes."""
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+def available_memory_bytes():
+    """Return the memory available for new work on the host in bytes (MemAvailable on Linux)."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+
+
+def parse_size(size):
+    """Return the number of bytes in a Compose size value (e.g. 104857600, '100mb', '1g').
+
+    Arguments:
+    size -- size as an integer number of bytes or a string with an optional unit suffix
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([kmgt]?)i?b?\s*', str(size).lower())
+    if not match:
+        raise ValueError(f'invalid size [{size}]')
+
+    return int(float(match.group(1)) * 1024 ** ' kmgt'.index(match.group(2) or ' '))
+
+
+class governor(object):
+    """Decides how much work to run at once based on the resources of the host.
+
+    The governor caps the number of containers which are set up at the same time, recommends
+    how many zones (and test executors) the host can run, and holds back new tests while the
+    host is overloaded.
+    """
+
+    def __init__(self,
+                 cpus=None,
+                 memory=None,
+                 cpus_per_zone=2,
+                 max_load_per_cpu=2.0,
+                 min_available_memory_fraction=0.05,
+                 poll_interval=5,
+                 max_wait=600):
+        """Construct a governor.
+
+        Arguments:
+        cpus -- number of CPUs the work may use (default: all CPUs available to this process)
+        memory -- bytes of memory the work may use (default: all memory on the host)
+        cpus_per_zone -- number of CPUs each zone is expected to use while running tests
+        max_load_per_cpu -- one-minute load average per CPU above which new tests are held back
+        min_available_memory_fraction -- fraction of `memory` which must be available for new
+                                         tests to start
+        poll_interval -- seconds between checks while new tests are held back
+        max_wait -- seconds after which a held back test is started anyway
+        """
+        self.cpus = cpus or host_cpu_count()
+        self.memory = memory or host_memory_bytes()
+        self.cpus_per_zone = cpus_per_zone
+        self.max_load_per_cpu = max_load_per_cpu
+        self.min_available_memory_fraction = min_available_memory_fraction
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+
+
+    def setup_workers(self, task_count):
+        """Return how many of `task_count` setup tasks (one per container) to run at the same time.
+
+        Setup runs package managers and database and iRODS server processes in every container,
+        so running more tasks than there are CPUs only makes each of them slower.
+
+        Arguments:
+        task_count -- number of tasks which are ready to run
+        """
+        return max(1, min(task_count, self.cpus))
+
+
+    def zone_memory(self, compose_project, consumer_count=0):
+        """Return the bytes of memory one zone of `compose_project` is expected to use.
+
+        This is the estimate for each service (see SERVICE_MEMORY_ESTIMATES) plus the shared
+        memory which Compose reserves for it (shm_size).
+
+        Arguments:
+        compose_project -- compose.Project for the zones
+        consumer_count -- number of catalog service consumers in each zone
+        """
+        services = compose_project.config().get('services', dict())
+
+        counts = {
+            context.irods_catalog_database_service(): 1,
+            context.irods_catalog_provider_service(): 1,
+            context.irods_catalog_consumer_service(): consumer_count,
+        }
+
+        memory = 0
+        for service, count in counts.items():
+            shm_size = parse_size(services.get(service, dict()).get('shm_size') or 0)
+            memory += count * (SERVICE_MEMORY_ESTIMATES[service] + shm_size)
+
+        return memory
+
+
+    def recommended_executor_count(self, compose_project, consumer_count=0):
+        """Return how many zones (and test executors) of `compose_project` the host can run at once.
+
+        Arguments:
+        compose_project -- compose.Project for the zones
+        consumer_count -- number of catalog service consumers in each zone
+        """
+        memory = min(self.memory, available_memory_bytes())
+
+        by_cpu = int(self.cpus // self.cpus_per_zone)
+        by_memory = int(memory // self.zone_memory(compose_project, consumer_count))
+
+        return max(1, min(by_cpu, by_memory))
+
+
+    def overloaded(self):
+        """Return a description of why the host is overloaded, or None if it is not."""
+        load = os.getloadavg()[0]
+        if load > self.cpus * self.max_load_per_cpu:
+            return f'load average [{load:.1f}] is above [{self.cpus * self.max_load_per_cpu:.1f}]'
+
+        available = available_memory_bytes()
+        if available < self.memory * self.min_available_memory_fraction:
+            return f'available memory [{available // 1024 ** 2}MiB] is below ' \
+                   f'[{int(self.memory * self.min_available_memory_fraction) // 1024 ** 2}MiB]'
+
+        return None
+
+
+    def wait_for_capacity(self, name=None):
+        """Block until the host is no longer overloaded, for at most `max_wait` seconds.
+
+        Arguments:
+        name -- name of the executor which is waiting, for log messages
+        """
+        start = time.time()
+
+        reason = self.overloaded()
+        while reason:
+            if time.time() - start >= self.max_wait:
+                logging.warning(f'[{name}]: host is still overloaded after [{self.max_wait}]s; continuing ({reason})')
+                return
+
+            logging.info(f'[{name}]: holding back new test because {reason}')
+
+            time.sleep(self.poll_interval)
+
+            reason = self.overloaded()
+
+
+class admission_window(object):
+    """Limits how many tasks run at once against a shared server, adapting to how long they take.
+
+    The window starts small and grows by one each time a task finishes within `tolerance` times
+    the fastest time seen so far, up to `limit`. When a task takes longer than that or fails, the
+    window is halved (but never below 1), so that a server which is falling behind gets fewer new
+    tasks until it recovers.
+    """
+
+    def __init__(self, limit=4, initial=2, tolerance=2.0, name=None):
+        """Construct an admission_window.
+
+        Arguments:
+        limit -- maximum number of tasks to run at once
+        initial -- number of tasks to run at once before any have finished
+        tolerance -- how many times slower than the fastest task a task can be before the window
+                     shrinks
+        name -- name of the server the tasks run against, for log messages
+        """
+        self.limit = max(1, limit)
+        self.window = max(1, min(initial, self.limit))
+        self.tolerance = tolerance
+        self.name = name
+        self.running = 0
+        self.fastest = None
+        self.condition = threading.Condition()
+
+
+    def acquire(self):
+        """Block until there is room in the window for another task."""
+        with self.condition:
+            while self.running >= self.window:
+                self.condition.wait()
+
+            self.running += 1
+
+
+    def release(self, duration, succeeded=True):
+        """Record that a task has finished and resize the window based on how it went.
+
+        Arguments:
+        duration -- seconds the task took
+        succeeded -- False if the task failed
+        """
+        with self.condition:
+            self.running -= 1
+
+            if succeeded and (self.fastest is None or duration < self.fastest):
+                self.fastest = duration
+
+            if succeeded and duration <= self.fastest * self.tolerance:
+                self.window = min(self.limit, self.window + 1)
+            else:
+                self.window = max(1, self.window // 2)
+
+            logging.debug(f'[{self.name}]: task took [{duration:.1f}]s (succeeded: [{succeeded}]); '
+                          f'admitting [{self.window}] at once')
+
+            self.condition.notify_all()
+
+
+    @contextlib.contextmanager
+    def admit(self):
+        """Return a context manager which holds a place in the window while its block runs."""
+        self.acquire()
+
+        start = time.time()
+        succeeded = False
+
+        try:
+            yield
+            succeeded = True
+
+        finally:
+            # Interruptions (e.g. KeyboardInterrupt) count as failures, but the place is always
+            # given back so that nothing waits for it forever.
+            self.release(time.time() - start, succeeded=succeeded)
+
+
+def default_governor():
+    """Return the governor used by setup helpers and test runners, creating it if needed."""
+    global _default_governor
+
+    with _default_governor_lock:
+        if _default_governor is None:
+            _default_governor = governor()
+
+        return _default_governor
+
+
+def configure(**kwargs):
+    """Replace the default governor with one constructed from `kwargs` and return it.
+
+    Arguments:
+    kwargs -- arguments for the governor constructor
+    """
+    global _default_governor
+
+    with _default_governor_lock:
+        _default_governor = governor(**kwargs)
+
+        return _default_governor
+
+
+def resolve_executor_count(requested, compose_project, consumer_count=0):
+    """Return the number of test executors to use for a run.
+
+    Arguments:
+    requested -- the number of executors requested, or 'auto' to use the recommended number
+    compose_project -- compose.Project for the zones
+    consumer_count -- number of catalog service consumers in each zone
+    """
+    # This is called before the scripts configure logging, so a module logger is used to avoid
+    # having the root logger configure itself with defaults.
+    log = logging.getLogger(__name__)
+
+    recommended = default_governor().recommended_executor_count(compose_project, consumer_count)
+
+    if requested == 'auto':
+        log.warning(f'using [{recommended}] concurrent test executors for this host')
+        return recommended
+
+    if requested > recommended:
+        log.warning(f'[{requested}] concurrent test executors requested, but this host is only expected '
+                        f'to run [{recommended}] at once; tests may run out of memory or slow down')
+
+    return requested
@@ -20,3 +20,26 @@ class almalinux_installer(install.installer):
     def version_joinery(self):
         return '-'
 
+
+    def package_cache_mounts(self):
+        return {
+            'dnf': '/var/cache/dnf',
+        }
+
+
+    def enable_package_cache_command(self):
+        return ('bash -c \'sed -i "/^keepcache=/d" /etc/dnf/dnf.conf && '
+                'echo keepcache=True >> /etc/dnf/dnf.conf\'')
+
+
+    def refresh_package_cache_command(self):
+        # 'dnf update' would also upgrade the packages of the one container which refreshes.
+        return 'dnf makecache'
+
+
+    def download_only_option(self):
+        return '--downloadonly'
+
+
+    def cache_only_option(self):
+        return '--cacheonly'
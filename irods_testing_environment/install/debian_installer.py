@@ -20,3 +20,25 @@ class debian_installer(install.installer):
     def version_joinery(self):
         return '='
 
+
+    def package_cache_mounts(self):
+        return {
+            'archives': '/var/cache/apt/archives',
+            'lists': '/var/lib/apt/lists',
+        }
+
+
+    def enable_package_cache_command(self):
+        # The Docker images for Debian-based platforms delete downloaded packages after every install.
+        return ('bash -c \'rm -f /etc/apt/apt.conf.d/docker-clean && '
+                'echo "APT::Keep-Downloaded-Packages \\"true\\";" > /etc/apt/apt.conf.d/99keep-downloaded-packages\'')
+
+
+    def download_only_option(self):
+        return '--download-only'
+
+
+    def cache_only_option(self):
+        # Nothing is downloaded, so the containers can read the shared cache at the same time
+        # under the shared package cache lock.
+        return '--no-download -o Debug::NoLocking=true'
@@ -1,14 +1,68 @@
 # grown-up modules
+import contextlib
+import fcntl
 import logging
 import os
+import threading
 
 # local modules
 from .. import archive
 from .. import container_info
 from .. import context
 from .. import execute
+from .. import governor
+
+# IDs of containers on which the repository metadata has been refreshed. Container IDs are never
+# reused, so this limits the refresh to once per container lifetime.
+_refreshed_containers = set()
+_refreshed_containers_lock = threading.Lock()
+
+# Package cache directories whose repository metadata has been refreshed in this run. Every
+# container sharing a cache reads the same metadata, so it only needs to be refreshed once.
+_refreshed_package_caches = dict()
+
+
+class install_plan(object):
+    """Packages to install on a set of containers, one package manager transaction per container."""
+
+    def __init__(self, install_command, package_paths, groups):
+        """Construct an install_plan.
+
+        Arguments:
+        install_command -- package manager command to which each package list is appended
+        package_paths -- full paths on the host to local packages which are copied into every
+                         container (the same paths are used inside the containers)
+        groups -- dict mapping each space-separated package list to the containers which install it
+        """
+        self.install_command = install_command
+        self.package_paths = package_paths
+        self.groups = groups
+
+
+    def containers(self):
+        """Return every container in the plan."""
+        return [c for group_containers in self.groups.values() for c in group_containers]
+
 
 class installer(object):
+    def __init__(self, package_cache_directory=None, offline=False):
+        """Construct an installer.
+
+        Arguments:
+        package_cache_directory -- directory on the host which is bind-mounted into the iRODS
+                                   containers as the package manager cache (see
+                                   add_package_cache_to_project). If None, each container
+                                   downloads its own packages.
+        offline -- if True, packages are installed only from the package cache and the
+                   repository metadata is not refreshed
+        """
+        if offline and not package_cache_directory:
+            raise ValueError('offline installation requires a package cache directory')
+
+        self.package_cache_directory = package_cache_directory
+        self.offline = offline
+
+
     def update_command(self):
         raise NotImplementedError('method not implemented for installer strategy')
 
@@ -29,6 +83,179 @@ class installer(object):
         raise NotImplementedError('method not implemented for installer strategy')
 
 
+    def package_cache_mounts(self):
+        """Return a dict mapping package cache subdirectories on the host to paths in the container."""
+        raise NotImplementedError('method not implemented for installer strategy')
+
+
+    def enable_package_cache_command(self):
+        """Return a command which makes the package manager keep the packages it downloads."""
+        raise NotImplementedError('method not implemented for installer strategy')
+
+
+    def refresh_package_cache_command(self):
+        """Return a command which refreshes the repository metadata in the shared package cache."""
+        return self.update_command()
+
+
+    def download_only_option(self):
+        raise NotImplementedError('method not implemented for installer strategy')
+
+
+    def cache_only_option(self):
+        raise NotImplementedError('method not implemented for installer strategy')
+
+
+    @contextlib.contextmanager
+    def package_cache_lock(self, shared=False):
+        """Hold a lock on the package cache for the duration of the `with` block.
+
+        The package managers lock their caches, but the lock is only visible inside of one
+        container. The lock file on the host keeps containers (and other runs on the same host)
+        from writing to the shared cache while anything else uses it. Refreshing the metadata and
+        downloading take the exclusive lock. Installing from the cache only reads it, so any
+        number of containers can do so at once under the shared lock.
+
+        Arguments:
+        shared -- if True, take the shared lock instead of the exclusive lock
+        """
+        with open(os.path.join(self.package_cache_directory, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+    def refresh_repository_metadata(self, container):
+        """Refresh the repository metadata on the specified container unless it has been refreshed.
+
+        Without a package cache, the metadata is refreshed at most once in the lifetime of a
+        container, no matter how many times packages are installed on it. With a package cache,
+        the metadata is in the cache, so it is refreshed once per run for every container which
+        shares the cache (see refresh_package_cache). Offline, the metadata is never refreshed.
+
+        Arguments:
+        container -- container on which the repository metadata is refreshed
+        """
+        if self.offline:
+            return 0
+
+        if self.package_cache_directory:
+            return self.refresh_package_cache(container)
+
+        with _refreshed_containers_lock:
+            if container.id in _refreshed_containers:
+                logging.debug('repository metadata already refreshed [{}]'.format(container.name))
+                return 0
+
+        ec = execute.execute_command(container, self.update_command())
+
+        if ec != 0:
+            logging.error('failed to update local repositories [{}]'.format(container.name))
+            return ec
+
+        with _refreshed_containers_lock:
+            _refreshed_containers.add(container.id)
+
+        return 0
+
+
+    def refresh_package_cache(self, container):
+        """Refresh the repository metadata in the package cache from `container` once per run.
+
+        The first container to get here refreshes the metadata under the exclusive package cache
+        lock, and the other containers sharing the cache wait for it and then use its metadata.
+
+        Arguments:
+        container -- container from which the repository metadata is refreshed
+        """
+        key = os.path.abspath(self.package_cache_directory)
+
+        with _refreshed_containers_lock:
+            state = _refreshed_package_caches.setdefault(key, {'lock': threading.Lock(), 'refreshed': False})
+
+        with state['lock']:
+            if state['refreshed']:
+                logging.debug('package cache metadata already refreshed [{}]'.format(key))
+                return 0
+
+            with self.package_cache_lock():
+                ec = execute.execute_command(container, self.refresh_package_cache_command())
+
+            if ec != 0:
+                logging.error('failed to refresh package cache metadata [{}] [{}]'.format(key, container.name))
+                return ec
+
+            state['refreshed'] = True
+
+        return 0
+
+
+    def download_packages_on_container(self, container, install_command, package_list):
+        """Download packages into the package cache from the specified container without installing them.
+
+        The download happens while holding the package cache lock, so the first container
+        downloads everything into the cache and the others find it there.
+
+        Arguments:
+        container -- container from which packages are downloaded
+        install_command -- package manager command to which the packages are appended
+        package_list -- space-separated list of packages to download
+        """
+        with self.package_cache_lock():
+            ec = execute.execute_command(container, ' '.join(
+                [install_command, self.download_only_option(), package_list]))
+
+        if ec != 0:
+            logging.error('failed to download packages into package cache [{}]'.format(container.name))
+
+        return ec
+
+
+    def install_packages_on_container(self, container, install_command, package_list, download=True):
+        """Install packages on the specified container.
+
+        With a package cache, the packages are downloaded into the cache first (see
+        download_packages_on_container) and then installed from the cache under the shared lock,
+        so the containers still install in parallel. Offline, the packages are installed from the
+        cache without contacting any repository.
+
+        Arguments:
+        container -- container on which packages are being installed
+        install_command -- package manager command to which the packages are appended
+        package_list -- space-separated list of packages to install
+        download -- if False, the packages are assumed to be in the package cache already
+        """
+        ec = self.refresh_repository_metadata(container)
+        if ec != 0:
+            return ec
+
+        if not self.package_cache_directory:
+            cmd = ' '.join([install_command, package_list])
+
+            logging.warning('executing cmd [{0}] on container [{1}]'.format(cmd, container.name))
+
+            return execute.execute_command(container, cmd)
+
+        ec = execute.execute_command(container, self.enable_package_cache_command())
+        if ec != 0:
+            logging.error('failed to enable package cache [{}]'.format(container.name))
+            return ec
+
+        if download and not self.offline:
+            ec = self.download_packages_on_container(container, install_command, package_list)
+            if ec != 0:
+                return ec
+
+        cmd = ' '.join([install_command, self.cache_only_option(), package_list])
+
+        logging.warning('executing cmd [{0}] on container [{1}]'.format(cmd, container.name))
+
+        with self.package_cache_lock(shared=True):
+            return execute.execute_command(container, cmd)
+
+
     def get_list_of_package_paths(self, package_directory, package_name_list=None):
         import glob
 
@@ -87,16 +314,7 @@ class installer(object):
             if not context.is_database_plugin(p) or
                context.is_irods_catalog_provider_container(container)])
 
-        cmd = ' '.join([self.install_local_packages_command(), package_list])
-
-        logging.warning('executing cmd [{0}] on container [{1}]'.format(cmd, container.name))
-
-        ec = execute.execute_command(container, self.update_command())
-        if ec != 0:
-            logging.error('failed to update local repositories [{}]'.format(container.name))
-            return ec
-
-        ec = execute.execute_command(container, cmd)
+        ec = self.install_packages_on_container(container, self.install_local_packages_command(), package_list)
         if ec != 0:
             logging.error(
                 'failed to install packages on container [ec=[{0}], container=[{1}]'.format(ec, container.name))
@@ -105,21 +323,62 @@ class installer(object):
         return 0
 
 
-    def install_packages(self, ctx, package_directory, containers, package_name_list=None):
-        import concurrent.futures
+    def make_install_plan(self, ctx, containers, package_paths=None, package_names=None):
+        """Return an install_plan which installs the packages on the containers in one transaction each.
 
-        packages = self.get_list_of_package_paths(package_directory, package_name_list)
+        Local packages and packages from the repositories are installed together by the same
+        package manager command. The database plugin is only installed on catalog service
+        providers, so the containers are grouped by role, and every container in a group gets
+        the identical package list.
 
-        tarfile_path = archive.create_archive(packages)
+        Arguments:
+        ctx -- a context object which holds information about the Compose environment
+        containers -- containers on which the packages will be installed (database containers
+                      are skipped)
+        package_paths -- full paths on the host to local packages to install
+        package_names -- names (with optional versions) of packages to install from the repositories
+        """
+        package_paths = list(package_paths or list())
+        packages = package_paths + list(package_names or list())
+
+        if not packages:
+            raise ValueError('no packages to install')
+
+        install_command = (self.install_local_packages_command() if package_paths
+                           else self.install_official_packages_command())
+
+        groups = dict()
+
+        for c in containers:
+            container = ctx.docker_client.containers.get(c.name)
+
+            # Only the iRODS containers need to have packages installed
+            if context.is_catalog_database_container(container): continue
+
+            package_list = ' '.join([
+                p for p in packages
+                if not context.is_database_plugin(p) or
+                   context.is_irods_catalog_provider_container(container)])
+
+            groups.setdefault(package_list, list()).append(container)
+
+        return install_plan(install_command, package_paths, groups)
+
+
+    def _run_on_containers(self, containers, description, function):
+        """Run `function` on each container in parallel and return 0 if it returned 0 on every one.
+
+        Arguments:
+        containers -- containers on which `function` is run
+        description -- what `function` does, for log messages
+        function -- callable which takes a container and returns an error code
+        """
+        import concurrent.futures
 
         rc = 0
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures_to_containers = {
-                executor.submit(
-                    self.install_packages_on_container_from_tarfile,
-                    ctx, c.name, packages, tarfile_path
-                ): c for c in containers
-            }
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=governor.default_governor().setup_workers(len(containers))) as executor:
+            futures_to_containers = {executor.submit(function, c): c for c in containers}
             logging.debug(futures_to_containers)
 
             for f in concurrent.futures.as_completed(futures_to_containers):
@@ -127,102 +386,164 @@ class installer(object):
                 try:
                     ec = f.result()
                     if ec != 0:
-                        logging.error('error while installing packages on container [{}]'
-                                      .format(container.name))
+                        logging.error('error while {} [ec=[{}], container=[{}]]'
+                                      .format(description, ec, container.name))
                         rc = ec
-                    else:
-                        logging.info('packages installed successfully [{}]'
-                                     .format(container.name))
 
                 except Exception as e:
-                    logging.error('exception raised while installing packages [{}]'
-                                  .format(container.name))
+                    logging.error('exception raised while {} [{}]'.format(description, container.name))
                     logging.error(e)
                     rc = 1
 
         return rc
 
 
-    def install_official_irods_packages(self, ctx, version, containers):
-        """
-        Install iRODS packages from the Consortium repositories with the given version string on the given containers.
+    def execute_install_plan(self, plan):
+        """Install packages on containers according to an install_plan.
+
+        The containers move through each step in lock-step: the local packages are copied into
+        every container, the repository metadata is refreshed, and then every container runs its
+        single install transaction. With a package cache, one container from each group
+        downloads the packages for the group before anything is installed, so the others install
+        exactly the same packages from the cache.
 
         Arguments:
-            ctx: Context object about where the packages are to be installed.
-            version: The version string to use when installing packages (e.g. "5.0.2-0~noble").
-            containers: List of containers into which packages will be downloaded and installed.
+        plan -- the install_plan to execute (see make_install_plan)
 
         Returns:
             An integer value with 0 indicating success, and any other value indicating an error code.
         """
-        def install_packages_(ctx, docker_compose_container, packages_list):
-            container = ctx.docker_client.containers.get(docker_compose_container.name)
+        containers = plan.containers()
 
-            package_list = ' '.join([p for p in packages_list if not context.is_database_plugin(p) or context.is_irods_catalog_provider_container(container)])
+        if not containers:
+            return 0
 
-            cmd = ' '.join([self.install_official_packages_command(), package_list])
+        if plan.package_paths:
+            tarfile_path = archive.create_archive(plan.package_paths)
 
-            logging.warning('executing cmd [{0}] on container [{1}]'.format(cmd, container.name))
+            def copy_packages(container):
+                archive.copy_archive_to_container(container, tarfile_path)
+                return 0
+
+            rc = self._run_on_containers(containers, 'copying packages', copy_packages)
+            if rc != 0:
+                return rc
+
+        rc = self._run_on_containers(containers, 'refreshing repository metadata', self.refresh_repository_metadata)
+        if rc != 0:
+            return rc
+
+        if self.package_cache_directory and not self.offline:
+            leaders = {group_containers[0]: package_list for package_list, group_containers in plan.groups.items()}
+
+            rc = self._run_on_containers(list(leaders), 'downloading packages', lambda c:
+                self.download_packages_on_container(c, plan.install_command, leaders[c]))
+            if rc != 0:
+                return rc
+
+        package_lists = {c: package_list
+                         for package_list, group_containers in plan.groups.items()
+                         for c in group_containers}
+
+        rc = self._run_on_containers(containers, 'installing packages', lambda c:
+            self.install_packages_on_container(c, plan.install_command, package_lists[c], download=False))
+
+        if rc == 0:
+            logging.info('packages installed successfully {}'.format([c.name for c in containers]))
+
+        return rc
 
-            ec = execute.execute_command(container, self.update_command())
-            if ec != 0:
-                logging.error('failed to update local repositories [{}]'.format(container.name))
-                return ec
 
-            ec = execute.execute_command(container, cmd)
+    def add_install_tasks(self, graph, plan, retries=1):
+        """Add tasks which install the packages in an install_plan to a task_graph.
+
+        Unlike execute_install_plan, the containers do not wait for each other between steps.
+        Each container copies the packages, refreshes the metadata, and installs them in its own
+        task, so tasks which depend on one container (e.g. setting up the iRODS server on it) can
+        start as soon as that container is done. With a package cache, the first container to
+        take the lock downloads the packages and the others find them in the cache.
+
+        Arguments:
+        graph -- the task_graph to which the tasks are added
+        plan -- the install_plan to execute (see make_install_plan)
+        retries -- number of times a failed installation is retried on the same container
+
+        Returns:
+            A dict mapping container names to the names of the tasks which install packages on them.
+        """
+        dependencies = list()
+
+        if plan.package_paths:
+            dependencies.append(graph.add_task('create package archive',
+                                               lambda: archive.create_archive(plan.package_paths)))
+
+        def install(container, package_list):
+            if plan.package_paths:
+                archive.copy_archive_to_container(container, graph.result(dependencies[0]))
+
+            ec = self.install_packages_on_container(container, plan.install_command, package_list)
             if ec != 0:
-                logging.error(
-                    'failed to install packages on container [ec=[{0}], container=[{1}]'.format(ec, container.name))
+                raise RuntimeError('failed to install packages [ec=[{}], container=[{}]]'.format(ec, container.name))
 
-                return ec
+        return {
+            c.name: graph.add_task('install packages [{}]'.format(c.name),
+                                   lambda c=c, package_list=package_list: install(c, package_list),
+                                   dependencies=dependencies,
+                                   retries=retries)
+            for package_list, group_containers in plan.groups.items()
+            for c in group_containers
+        }
 
-            return 0
 
-        import concurrent.futures
+    def install_packages(self, ctx, package_directory, containers, package_name_list=None):
+        packages = self.get_list_of_package_paths(package_directory, package_name_list)
 
-        # If a version is not provided, just install the latest
-        if version:
-            packages = ['{}{}{}'.format(p, self.version_joinery(), version)
-                        for p in context.irods_package_names(ctx.database_name())]
-        else:
-            packages = context.irods_package_names(ctx.database_name())
+        return self.execute_install_plan(self.make_install_plan(ctx, containers, package_paths=packages))
 
-        rc = 0
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures_to_containers = {
-                executor.submit(install_packages_, ctx, c, packages): c
-                for c in containers
-                if not context.is_catalog_database_container(c)
-            }
-            logging.debug(futures_to_containers)
 
-            for f in concurrent.futures.as_completed(futures_to_containers):
-                container = futures_to_containers[f]
-                try:
-                    ec = f.result()
-                    if ec != 0:
-                        logging.error('error while installing packages on container [{}]'.format(container.name))
-                        rc = ec
+    def install_official_irods_packages(self, ctx, version, containers):
+        """
+        Install iRODS packages from the Consortium repositories with the given version string on the given containers.
 
-                    logging.info('packages installed successfully [{}]'.format(container.name))
+        Arguments:
+            ctx: Context object about where the packages are to be installed.
+            version: The version string to use when installing packages (e.g. "5.0.2-0~noble").
+            containers: List of containers into which packages will be downloaded and installed.
 
-                except Exception as e:
-                    logging.error('exception raised while installing packages [{}]'.format(container.name))
-                    logging.error(e)
-                    rc = 1
+        Returns:
+            An integer value with 0 indicating success, and any other value indicating an error code.
+        """
+        return self.execute_install_plan(
+            self.make_install_plan(ctx, containers, package_names=self.official_irods_package_names(ctx, version)))
 
-        return rc
 
+    def official_irods_package_names(self, ctx, version=None):
+        """Return the names of the official iRODS packages to install, pinned to `version` if provided.
+
+        Arguments:
+        ctx -- a context object which holds information about the Compose environment
+        version -- version string for the packages (if None, the latest available version is used)
+        """
+        # If a version is not provided, just install the latest
+        if version:
+            return ['{}{}{}'.format(p, self.version_joinery(), version)
+                    for p in context.irods_package_names(ctx.database_name())]
+
+        return context.irods_package_names(ctx.database_name())
 
-    def install_irods_packages(self,
-                               ctx,
-                               externals_directory=None,
-                               package_directory=None,
-                               package_version=None):
-        """Install iRODS packages and external dependencies.
+
+    def make_irods_install_plan(self,
+                                ctx,
+                                externals_directory=None,
+                                package_directory=None,
+                                package_version=None):
+        """Return an install_plan for the iRODS packages and external dependencies.
 
         `package_directory` and `package_version` cannot both be specified.
 
+        The externals, the iRODS packages, and the database plugin are installed in a single
+        package manager transaction on each container (see make_install_plan).
+
         Arguments:
         ctx -- a context object which holds information about the Compose environment
         externals_directory -- path to directory on local machine in which iRODS externals
@@ -238,39 +559,271 @@ class installer(object):
         if package_directory and package_version:
             raise ValueError('package_directory and package_version are incompatible')
 
+        package_paths = list()
+        package_names = list()
+
         if externals_directory:
-            ec = self.install_packages(ctx,
-                                       os.path.abspath(externals_directory),
-                                       ctx.irods_containers(),
-                                       context.irods_externals_package_names())
-            if ec != 0:
-                raise RuntimeError('failed to install externals')
+            package_paths.extend(self.get_list_of_package_paths(os.path.abspath(externals_directory),
+                                                                context.irods_externals_package_names()))
 
         if package_directory:
             logging.warning('installing iRODS packages from directory [{}]'
                             .format(package_directory))
 
-            ec = self.install_packages(ctx,
-                                       os.path.abspath(package_directory),
-                                       ctx.irods_containers(),
-                                       context.irods_package_names(ctx.database_name()))
-            if ec != 0:
-                raise RuntimeError('failed to install iRODS packages')
+            package_paths.extend(self.get_list_of_package_paths(os.path.abspath(package_directory),
+                                                                context.irods_package_names(ctx.database_name())))
 
         else:
             # Even if no version was provided, we default to using the latest official release
             logging.warning('installing official iRODS packages [{}]'
                             .format(package_version))
 
-            ec = self.install_official_irods_packages(ctx, package_version, ctx.irods_containers())
-            if ec != 0:
-                raise RuntimeError('failed to install iRODS packages')
+            package_names.extend(self.official_irods_package_names(ctx, package_version))
+
+        return self.make_install_plan(ctx,
+                                      ctx.irods_containers(),
+                                      package_paths=package_paths,
+                                      package_names=package_names)
+
+
+    def install_irods_packages(self,
+                               ctx,
+                               externals_directory=None,
+                               package_directory=None,
+                               package_version=None):
+        """Install iRODS packages and external dependencies.
+
+        See make_irods_install_plan for a description of the arguments.
+        """
+        plan = self.make_irods_install_plan(ctx,
+                                            externals_directory=externals_directory,
+                                            package_directory=package_directory,
+                                            package_version=package_version)
+
+        ec = self.execute_install_plan(plan)
+        if ec != 0:
+            raise RuntimeError('failed to install iRODS packages')
+
+
+    def package_image_key(self, ctx, externals_directory=None, package_directory=None):
+        """Return the SHA-256 of the base image and packages which make up a package image.
+
+        Arguments:
+        ctx -- a context object which holds information about the Compose environment
+        externals_directory -- path to directory on local machine in which iRODS externals
+                               packages are located
+        package_directory -- path to directory on local machine in which iRODS packages are
+                             located
+        """
+        import hashlib
+        import json
+
+        h = hashlib.sha256()
+
+        config = ctx.compose_project.config()
+        service = config['services'][context.irods_catalog_provider_service()]
+        build = service.get('build', dict())
+
+        h.update(json.dumps({
+            'platform': ctx.platform(),
+            'database': ctx.database_name(),
+            'build': build,
+        }, sort_keys=True).encode('utf-8'))
+
+        dockerfile = os.path.join(build.get('context', ''), build.get('dockerfile', 'Dockerfile'))
+        if os.path.isfile(dockerfile):
+            with open(dockerfile, 'rb') as f:
+                h.update(f.read())
+
+        package_paths = list()
+
+        if externals_directory:
+            package_paths.extend(self.get_list_of_package_paths(externals_directory,
+                                                                context.irods_externals_package_names()))
+
+        package_paths.extend(self.get_list_of_package_paths(package_directory,
+                                                            context.irods_package_names(ctx.database_name())))
+
+        for path in sorted(package_paths):
+            h.update(os.path.basename(path).encode('utf-8'))
+
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+
+        return h.hexdigest()
+
+
+    def package_images(self, ctx, key):
+        """Return a dict mapping iRODS service names to package image names for `key`.
+
+        Providers also get the database plugin, so each role has its own image.
+
+        Arguments:
+        ctx -- a context object which holds information about the Compose environment
+        key -- package image key (see package_image_key)
+        """
+        repository = 'irods-testing-environment-packages/{}'.format(context.sanitize(ctx.platform()).lower())
+
+        return {
+            service: '{}:{}-{}-{}'.format(repository, ctx.database_name(), role, key[:16])
+            for service, role in [(context.irods_catalog_provider_service(), 'provider'),
+                                  (context.irods_catalog_consumer_service(), 'consumer')]
+        }
+
+
+    def _package_images_for_project(self, ctx, scale_override, externals_directory=None, package_directory=None):
+        """Return the package images (see package_images) for the services which are brought up."""
+        key = self.package_image_key(ctx, externals_directory, package_directory)
+
+        return {
+            service: image for service, image in self.package_images(ctx, key).items()
+            if scale_override.get(service, 0) > 0
+        }
+
+
+    def add_package_images_to_project(self,
+                                      ctx,
+                                      scale_override,
+                                      externals_directory=None,
+                                      package_directory=None):
+        """Run the iRODS services from package images if they exist and return whether they do.
+
+        The first time a set of packages is installed on a base image,
+        install_irods_packages_with_image_cache commits one container of each iRODS role to an
+        image tagged with the SHA-256 of the base image and the packages. On later runs with the
+        same packages, the iRODS containers are created from those images instead, which takes
+        seconds rather than a package manager run per container.
+
+        The images are added to the Compose project in an override file, so this must be called
+        after the project is built and before the containers are brought up.
+
+        Arguments:
+        ctx -- a context object which holds information about the Compose environment
+        scale_override -- dict mapping service names to the number of containers which will be
+                          brought up for each service (as passed to compose.Project.up)
+        externals_directory -- path to directory on local machine in which iRODS externals
+                               packages are located
+        package_directory -- path to directory on local machine in which iRODS packages are
+                             located
+        """
+        import docker
 
+        from .. import snapshot
 
-def make_installer(platform_name):
+        images = self._package_images_for_project(ctx, scale_override, externals_directory, package_directory)
+
+        for image in images.values():
+            try:
+                ctx.docker_client.images.get(image)
+            except docker.errors.ImageNotFound:
+                return False
+
+        logging.warning('creating iRODS containers from package images [{}]'.format(list(images.values())))
+
+        ctx.compose_project.add_override_file(snapshot.write_compose_override(ctx, images))
+
+        return True
+
+
+    def install_irods_packages_with_image_cache(self,
+                                                ctx,
+                                                scale_override,
+                                                externals_directory=None,
+                                                package_directory=None):
+        """Install iRODS packages from a local directory and commit the package images.
+
+        This is the slow path of add_package_images_to_project, for when the package images do
+        not exist yet. One container of each iRODS role is committed to a package image once
+        its packages are installed.
+
+        Arguments:
+        ctx -- a context object which holds information about the Compose environment
+        scale_override -- dict mapping service names to the number of containers which were
+                          brought up for each service (as passed to compose.Project.up)
+        externals_directory -- path to directory on local machine in which iRODS externals
+                               packages are located
+        package_directory -- path to directory on local machine in which iRODS packages are
+                             located
+        """
+        images = self._package_images_for_project(ctx, scale_override, externals_directory, package_directory)
+
+        self.install_irods_packages(ctx,
+                                    externals_directory=externals_directory,
+                                    package_directory=package_directory)
+
+        for service, image in images.items():
+            container = ctx.docker_client.containers.get(
+                context.container_name(ctx.compose_project.name, service))
+
+            repository, tag = context.image_repo_and_tag(image)
+            container.commit(repository=repository, tag=tag)
+
+            logging.warning('committed package image [{}] [{}]'.format(image, container.name))
+
+
+def add_package_cache_to_project(compose_project, package_cache_directory, path_to_override=None):
+    """Bind-mount a package cache on the host into the iRODS services and return its directory.
+
+    Each platform gets its own subdirectory of `package_cache_directory` because the cached
+    repository metadata and packages are specific to the distribution and release. The mounts
+    are added to the Compose project in an override file, so this must be called before the
+    containers are brought up. The returned directory is the one to pass to make_installer.
+
+    Arguments:
+    compose_project -- compose.Project for the services which will share the cache
+    package_cache_directory -- directory on the host which holds the package caches
+    path_to_override -- path to the override file to write (default: a new temporary file)
+    """
+    import json
+    import tempfile
+
+    config = compose_project.config()
+    build = config['services'][context.irods_catalog_provider_service()].get('build', dict())
+
+    # The build context is the platform directory (e.g. projects/ubuntu-22.04).
+    platform_directory = os.path.basename(os.path.normpath(build.get('context', compose_project.project_dir)))
+
+    platform_cache_directory = os.path.join(os.path.abspath(package_cache_directory), platform_directory)
+
+    volumes = list()
+    for subdirectory, mount_point in make_installer(platform_directory).package_cache_mounts().items():
+        host_directory = os.path.join(platform_cache_directory, subdirectory)
+        os.makedirs(host_directory, exist_ok=True)
+        volumes.append('{}:{}'.format(host_directory, mount_point))
+
+    override = {
+        'services': {
+            service: {'volumes': volumes}
+            for service in [context.irods_catalog_provider_service(),
+                            context.irods_catalog_consumer_service()]
+        }
+    }
+
+    if not path_to_override:
+        fd, path_to_override = tempfile.mkstemp(prefix=compose_project.name + '-package-cache-', suffix='.yml')
+        os.close(fd)
+
+    with open(path_to_override, 'w') as f:
+        json.dump(override, f, indent=4)
+
+    compose_project.add_override_file(path_to_override)
+
+    logging.info('using package cache [{}] for project [{}]'.format(platform_cache_directory, compose_project.name))
+
+    return platform_cache_directory
+
+
+def make_installer(platform_name, package_cache_directory=None, offline=False):
     """
     Create and return an installer suited to the given platform_name.
 
+    Args:
+        platform_name: The name of the platform (e.g. "ubuntu" or "rockylinux-9").
+        package_cache_directory: Directory on the host which is mounted into the containers as the
+            package cache (see add_package_cache_to_project), or None to not use a package cache.
+        offline: If True, packages are only installed from the package cache.
+
     Returns:
         An installer suited to the given platform_name.
 
@@ -298,7 +851,7 @@ def make_installer(platform_name):
     if normalized not in installers:
         raise ValueError(f"unsupported platform [{platform_name}]")
 
-    return installers[normalized]()
+    return installers[normalized](package_cache_directory=package_cache_directory, offline=offline)
 
 
 def install_pip_package_from_repo(container,
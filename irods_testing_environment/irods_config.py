@@ -25,6 +25,17 @@ irods_version = dict()
 # is declared here to extend the lifetime of the dict.
 irods_commit_id = dict()
 
+# These dicts map image IDs to iRODS version triples and commit SHAs. When iRODS is part of the
+# image (e.g. release.Dockerfile or the package images), every container created from it runs the
+# same iRODS build, so the version file only needs to be read once per image. They are only meant
+# to be used by get_irods_version and get_irods_commit_id.
+irods_version_by_image = dict()
+irods_commit_id_by_image = dict()
+
+# This dict maps image IDs to whether the iRODS installation in containers created from the image
+# comes from the image itself rather than from packages installed in the container.
+image_carries_irods = dict()
+
 def get_irods_zone_name(container):
     """Return the Zone name of the iRODS server running on `container`."""
     global irods_zone
@@ -62,6 +73,30 @@ def update_cached_irods_version(container):
     irods_version[container.name] = _get_irods_version_from_file(container)
 
 
+def _image_id(container):
+    """Return the ID of the image from which `container` was created."""
+    return container.attrs.get('Image')
+
+
+def _image_carries_irods(container):
+    """Return whether the iRODS installation in `container` is the one in its image.
+
+    This is decided once per image from the first container asked about: if the container changed
+    the iRODS version file (by installing or upgrading iRODS), the version depends on the container
+    rather than the image, and the per-image caches are not used for that image.
+
+    Args:
+        container: container created from the image
+    """
+    image = _image_id(container)
+
+    if image not in image_carries_irods:
+        changed = {change['Path'] for change in container.diff() or list()}
+        image_carries_irods[image] = not any(f in changed for f in version_file_locations())
+
+    return image_carries_irods[image]
+
+
 def get_irods_version(container):
     """
     Return the version of iRODS running on container.
@@ -78,7 +113,16 @@ def get_irods_version(container):
     if container.name in irods_version:
         return irods_version[container.name]
 
-    update_cached_irods_version(container)
+    # Otherwise, another container created from the same image may have been asked already.
+    if not _image_carries_irods(container):
+        update_cached_irods_version(container)
+
+    elif _image_id(container) in irods_version_by_image:
+        irods_version[container.name] = irods_version_by_image[_image_id(container)]
+
+    else:
+        update_cached_irods_version(container)
+        irods_version_by_image[_image_id(container)] = irods_version[container.name]
 
     return irods_version[container.name]
 
@@ -109,11 +153,29 @@ def get_irods_commit_id(container):
     if container.name in irods_commit_id:
         return irods_commit_id[container.name]
 
-    update_cached_irods_commit_id(container)
+    if not _image_carries_irods(container):
+        update_cached_irods_commit_id(container)
+
+    elif _image_id(container) in irods_commit_id_by_image:
+        irods_commit_id[container.name] = irods_commit_id_by_image[_image_id(container)]
+
+    else:
+        update_cached_irods_commit_id(container)
+        irods_commit_id_by_image[_image_id(container)] = irods_commit_id[container.name]
 
     return irods_commit_id[container.name]
 
 
+def version_file_locations():
+    """Return the paths at which the iRODS version file may be found."""
+    # The name of the version file changed in iRODS version 4.3.0. The testing environment supports
+    # both 4.3.x and 4.2.x versions, so we want to check for both file names.
+    return [
+            os.path.join(context.irods_home(), 'version.json.dist'),
+            os.path.join(context.irods_home(), 'VERSION.json.dist')
+    ]
+
+
 def get_irods_version_info(container, version_file_key):
     """Returns the information from the iRODS version JSON file.
 
@@ -121,27 +183,15 @@ def get_irods_version_info(container, version_file_key):
     container -- container in which file is found
     version_file_key -- key to look for in the JSON file
     """
-    # The name of the version file changed in iRODS version 4.3.0. The testing environment supports
-    # both 4.3.x and 4.2.x versions, so we want to check for both file names.
-    version_file_locations = [
-            os.path.join(context.irods_home(), 'version.json.dist'),
-            os.path.join(context.irods_home(), 'VERSION.json.dist')
-    ]
-
-    for f in version_file_locations:
-        # Check to see whether the file exists. If not, try the next one.
-        if execute.execute_command(container, f'bash -c "[[ -f {f} ]]"') != 0:
-            logging.debug(f'[{container.name}]: version file [{f}] not found')
-            continue
+    # Read whichever of the files exists in one exec.
+    read_version_file = ' || '.join('cat {} 2>/dev/null'.format(f) for f in version_file_locations())
 
-        logging.debug(f'[{container.name}]: version file [{f}] found')
+    ec, out = container.exec_run(['bash', '-c', read_version_file])
 
-        # If the file exists, extract the version string and store it in the version
-        # dictionary under this container's name.
-        return json_utils.get_json_from_file(container, f)[version_file_key]
+    if ec != 0:
+        raise RuntimeError(f'[{container.name}]: No iRODS version file found')
 
-    # If we reach here, that's no good.
-    raise RuntimeError(f'[{container.name}]: No iRODS version file found')
+    return json.loads(out.decode('utf-8'))[version_file_key]
 
 
 def server_version_is_irods_5(container):
@@ -221,13 +271,18 @@ def configure_users_for_auth_tests(docker_client, compose_project):
         raise RuntimeError('failed to create test user accounts on some service')
 
 
-def configure_host_resolution(docker_client, compose_project):
+def configure_host_resolution(docker_client, compose_project, config_sessions=None):
     """Set hostname aliases for all iRODS servers in the compose project via server_config.json.
 
     Arguments:
     docker_client -- docker client for interacting with the docker-compose project
     compose_project -- compose.Project in which the iRODS servers are running
+    config_sessions -- dict mapping container names to config_sessions in which to batch the
+                       host_resolution changes (optional). If provided, the caller is
+                       responsible for committing the sessions.
     """
+    from . import config_session
+
     def set_hostnames(docker_client, docker_compose_container):
         container = docker_client.containers.get(docker_compose_container.name)
 
@@ -272,13 +327,12 @@ def configure_host_resolution(docker_client, compose_project):
 
         logging.info('json for host_resolution.host_entries [{}] [{}]'.format(json.dumps(host_entries), container.name))
 
-        update_host_resolution_config = '''bash -c "sed -i 's/\\"host_entries\\": \\[\\]/\\"host_entries\\": {}/g' /etc/irods/server_config.json"'''.format(
-            json.dumps(host_entries).replace('"', '\\"'))
-
-        if execute.execute_command(container, update_host_resolution_config) != 0:
-            raise RuntimeError('failed to update host_resolution configuration for [{}]'.format(container.name))
-
-        execute.execute_command(container, 'bash -c "cat /etc/irods/server_config.json"')
+        if config_sessions is not None:
+            config_sessions[container.name].set_value(['host_resolution', 'host_entries'], host_entries)
+        else:
+            config_session.config_session(container) \
+                .set_value(['host_resolution', 'host_entries'], host_entries) \
+                .commit()
 
         return 0
 
@@ -473,14 +527,16 @@ def configure_univmss_script(docker_client, compose_project):
         raise RuntimeError('failed to configure univMSS script on some service')
 
 
-def configure_irods_testing(docker_client, compose_project):
+def configure_irods_testing(docker_client, compose_project, config_sessions=None):
     """Run a series of prerequisite configuration steps for iRODS tests.
 
     Arguments:
     docker_client -- docker client for interacting with the docker-compose project
     compose_project -- compose.Project in which the iRODS servers are running
+    config_sessions -- dict mapping container names to config_sessions in which to batch changes
+                       to server_config (optional, see configure_host_resolution)
     """
-    configure_host_resolution(docker_client, compose_project)
+    configure_host_resolution(docker_client, compose_project, config_sessions)
 
     configure_hello_script(docker_client, compose_project)
     configure_univmss_script(docker_client, compose_project)
@@ -3,9 +3,11 @@ import concurrent.futures
 import json
 import logging
 import os
+import re
+import threading
 
 # local modules
-from . import context, database_setup, execute, irods_config, odbc_setup
+from . import context, database_setup, execute, governor, irods_config, negotiation_key, odbc_setup
 
 
 class zone_info(object):
@@ -87,6 +89,164 @@ class zone_info(object):
         return [self.consumer_hostname(ctx, i) for i in self.consumer_service_instances]
 
 
+    def irods_containers(self, ctx):
+        """Return list of Docker Containers running the iRODS servers, starting with the CSP."""
+        return [self.provider_container(ctx)] + [
+            self.consumer_container(ctx, i) for i in self.consumer_service_instances or list()]
+
+
+    def prepare_reset(self, ctx):
+        """Save the state of the Zone so that reset can bring it back.
+
+        The servers are stopped while the catalog, the configuration files, and the vault of the
+        default resource on each server are saved, and then started again.
+        """
+        logging.warning('saving state of zone [{}] for resets'.format(self.zone_name))
+
+        containers = self.irods_containers(ctx)
+
+        _run_on_containers(containers, 'stopping iRODS server', stop_irods)
+
+        def save(container):
+            for f in zone_reset_files():
+                negotiation_key.backup_file(container, f, suffix=zone_reset_suffix())
+
+            # Only the contents of the vault are archived because the vault may be a mount point
+            # (see scratch_storage), which cannot be removed and recreated by reset.
+            return execute.execute_command(container, 'bash -c \'rm -f {0} && if [ -d {1} ]; then tar -cpf {0} -C {1} .; fi\''
+                .format(zone_reset_vault_archive(), context.default_vault_directory()))
+
+        try:
+            database_setup.snapshot_catalog(ctx, service_instance=self.database_service_instance)
+
+            _run_on_containers(containers, 'saving configuration and vault', save)
+
+        finally:
+            _start_irods_servers(containers)
+
+
+    def reset(self, ctx):
+        """Return the Zone to the state saved by prepare_reset.
+
+        The servers are stopped, the catalog is restored from its snapshot, the configuration
+        files and the vault of the default resource are restored on each server, and the
+        servers are started again. This takes seconds rather than the minutes of standing up a
+        new Zone.
+        """
+        import concurrent.futures
+
+        logging.info('resetting zone [{}]'.format(self.zone_name))
+
+        containers = self.irods_containers(ctx)
+
+        _run_on_containers(containers, 'stopping iRODS server', stop_irods)
+
+        def restore(container):
+            for f in zone_reset_files():
+                negotiation_key.restore_file(container, f, suffix=zone_reset_suffix())
+
+            return execute.execute_command(container, 'bash -c \'mkdir -p {1} && find {1} -mindepth 1 -delete && if [ -f {0} ]; then tar -xpf {0} -C {1}; fi\''
+                .format(zone_reset_vault_archive(), context.default_vault_directory()))
+
+        try:
+            # The catalog is restored while the servers restore their files.
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                catalog_restore = executor.submit(database_setup.restore_catalog,
+                                                  ctx,
+                                                  service_instance=self.database_service_instance)
+
+                _run_on_containers(containers, 'restoring configuration and vault', restore)
+
+                catalog_restore.result()
+
+        finally:
+            _start_irods_servers(containers)
+
+
+def zone_reset_files():
+    """Return the paths of the files on each iRODS server which are restored by zone_info.reset."""
+    return [context.server_config(), context.core_re(), context.service_account_irods_env()]
+
+
+def zone_reset_suffix():
+    """Return the suffix of the copies of zone_reset_files saved by zone_info.prepare_reset.
+
+    This is not '.orig' because the TLS and negotiation key helpers keep their own copies there.
+    """
+    return '.reset'
+
+
+def zone_reset_vault_archive():
+    """Return the path on each iRODS server to the copy of the vault saved by zone_info.prepare_reset."""
+    return '/var/tmp/irods_vault_reset.tar'
+
+
+def _run_on_containers(containers, description, function):
+    """Run `function` on each container in parallel and raise if it failed on any of them.
+
+    Arguments:
+    containers -- containers on which `function` is run
+    description -- what `function` does, for log messages
+    function -- callable which takes a container and returns an error code
+    """
+    import concurrent.futures
+
+    rc = 0
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(len(containers))) as executor:
+        futures_to_containers = {executor.submit(function, c): c for c in containers}
+
+        for f in concurrent.futures.as_completed(futures_to_containers):
+            container = futures_to_containers[f]
+            try:
+                ec = f.result()
+                if ec != 0:
+                    logging.error('error while {} [ec=[{}], container=[{}]]'.format(description, ec, container.name))
+                    rc = ec
+
+            except Exception as e:
+                logging.error('exception raised while {} [{}]'.format(description, container.name))
+                logging.error(e)
+                rc = 1
+
+    if rc != 0:
+        raise RuntimeError('failed {} on one or more containers, ec=[{}]'.format(description, rc))
+
+
+def _start_irods_servers(containers):
+    """Start the iRODS server on the catalog service provider and then on the consumers.
+
+    Arguments:
+    containers -- the iRODS containers of a Zone, starting with the catalog service provider
+    """
+    _run_on_containers(containers[:1], 'starting iRODS server', restart_irods)
+
+    if len(containers) > 1:
+        _run_on_containers(containers[1:], 'starting iRODS server', restart_irods)
+
+
+# This dict maps (catalog service role, unattended install, iRODS version) to setup script inputs
+# with a placeholder for each value that can differ between servers, so that the input for each
+# role is generated once and only filled in for each server. This is only meant to be used by
+# setup_input_builder.build.
+setup_input_templates = dict()
+_setup_input_templates_lock = threading.Lock()
+
+# Settings for admitting catalog service consumers to their provider (see
+# configure_consumer_admission) and the admission window for each provider, keyed by Compose
+# project name and provider service instance.
+consumer_admission = {
+    'limit': 4,
+    'initial': 2,
+    'tolerance': 2.0,
+    'retries': 2,
+    'retry_delay': 10,
+}
+_consumer_admission_windows = dict()
+_consumer_admission_lock = threading.Lock()
+
+
 class setup_input_builder(object):
     """Builder for iRODS setup script inputs.
 
@@ -791,13 +951,68 @@ class setup_input_builder(object):
 
         return json.dumps(json_input, sort_keys=True, indent=4)
 
+    # The values which are filled in to the setup script input templates (see build).
+    template_fields = [
+        'service_account_name', 'service_account_group', 'host', 'database_technology',
+        'odbc_driver', 'database_server_hostname', 'database_server_port', 'database_name',
+        'database_username', 'database_password', 'stored_passwords_salt', 'zone_name',
+        'catalog_service_provider_host', 'zone_port', 'parallel_port_range_begin',
+        'parallel_port_range_end', 'control_plane_port', 'schema_validation_base_uri',
+        'admin_username', 'zone_key', 'negotiation_key', 'control_plane_key', 'admin_password',
+        'provides_local_storage', 'resource_name', 'vault_directory',
+    ]
+
+    @staticmethod
+    def placeholder(field):
+        """Return the placeholder for `field` in a setup script input template."""
+        return '@@{}@@'.format(field)
+
+
+    def template(self):
+        """Return the setup script input template for the role, install style, and version of this builder.
+
+        The template is generated the first time it is needed and cached in setup_input_templates.
+        """
+        key = (self.catalog_service_role, self.do_unattended_install, tuple(self.irods_version))
+
+        with _setup_input_templates_lock:
+            if key not in setup_input_templates:
+                template_builder = setup_input_builder()
+                template_builder.irods_version = self.irods_version
+                template_builder.catalog_service_role = self.catalog_service_role
+                template_builder.do_unattended_install = self.do_unattended_install
+
+                for field in self.template_fields:
+                    setattr(template_builder, field, self.placeholder(field))
+
+                setup_input_templates[key] = template_builder.build_for_role()
+
+            return setup_input_templates[key]
+
+
     def build(self):
         """Build the string for the setup script input.
 
         Depending on the way the inputs were provided, either an iRODS catalog service provider
         or a catalog service consumer will be set up and the resulting input string will be
-        returned.
+        returned. The input is the template for the role (see template) with the values of this
+        builder filled in.
         """
+        template = self.template()
+
+        if not self.do_unattended_install:
+            return re.sub(r'@@(\w+)@@', lambda m: str(getattr(self, m.group(1))), template)
+
+        # A placeholder which is a whole JSON string is replaced with the JSON for the value, which
+        # keeps numbers as numbers. A placeholder which is part of a JSON string (e.g. irods_home)
+        # is replaced with the escaped string for the value.
+        template = re.sub(r'"@@(\w+)@@"', lambda m: json.dumps(getattr(self, m.group(1))), template)
+
+        return re.sub(r'@@(\w+)@@', lambda m: json.dumps(str(getattr(self, m.group(1))))[1:-1], template)
+
+
+    def build_for_role(self):
+        """Build the string for the setup script input from the values of this builder."""
         if self.do_unattended_install:
             build_for_role = {
                 'provider': self.build_unattended_install_input_for_catalog_provider,
@@ -898,6 +1113,11 @@ def restart_irods(container):
     return execute.execute_command(container, cmd, user='irods', workdir=context.irods_home())
 
 
+def reload_configuration(container):
+    cmd = "python3 -c 'from scripts.irods.controller import IrodsController; IrodsController().reload_configuration()'"
+    return execute.execute_command(container, cmd, user='irods', workdir=context.irods_home())
+
+
 def setup_irods_server(container, setup_input, **kwargs):
     """Set up iRODS server on the given container with the provided input.
 
@@ -929,12 +1149,13 @@ def setup_irods_server(container, setup_input, **kwargs):
     import base64
     import shlex
     b64 = base64.b64encode(setup_input.encode('utf-8')).decode('ascii')
-    ec = execute.execute_command(container, f"bash -lc 'printf %s {shlex.quote(b64)} | base64 -d > /input'")
+
+    # tee shows the contents of the file in the output as it is written.
+    ec = execute.execute_command(container,
+                                 f"bash -lc 'set -o pipefail; printf %s {shlex.quote(b64)} | base64 -d | tee /input'")
     if ec != 0:
         raise RuntimeError('failed to create setup script input file [{}]'.format(container.name))
 
-    execute.execute_command(container, 'cat /input')
-
     path_to_setup_script = os.path.join(context.irods_home(), 'scripts', 'setup_irods.py')
     if kwargs.get('do_unattended_install', False):
         run_setup_script = 'bash -c \'{} {} --json_configuration_file /input\''.format(
@@ -1009,6 +1230,13 @@ def setup_irods_catalog_provider(ctx,
                        do_unattended_install=kwargs.get('do_unattended_install', False))
 
 
+def consumer_resource_name(csc_container):
+    """Return the name of the default resource created by setting up the consumer in `csc_container`."""
+    # Mirrors how setup_irods.py in irods/irods generates the default resource name
+    # for catalog service consumer servers.
+    return context.container_hostname(csc_container).split('.')[0] + 'Resource'
+
+
 def setup_irods_catalog_consumer(ctx,
                                  provider_service_instance=1,
                                  consumer_service_instance=1,
@@ -1035,9 +1263,7 @@ def setup_irods_catalog_consumer(ctx,
 
     csc_container_hostname = context.container_hostname(csc_container)
 
-    # Mirrors how setup_irods.py in irods/irods generates the default resource name
-    # for catalog service consumer servers.
-    resource_name = csc_container_hostname.split('.')[0] + 'Resource'
+    resource_name = consumer_resource_name(csc_container)
 
     setup_input = (setup_input_builder()
         .setup(irods_version=irods_config.get_irods_version(csc_container),
@@ -1058,6 +1284,148 @@ def setup_irods_catalog_consumer(ctx,
                        do_unattended_install=kwargs.get('do_unattended_install', False))
 
 
+def reset_irods_catalog_consumer(ctx,
+                                 provider_service_instance=1,
+                                 consumer_service_instance=1):
+    """Undo a failed setup of an iRODS catalog service consumer so that it can be set up again.
+
+    A setup which fails part way may have written the server configuration and registered the
+    default resource of the consumer in the catalog, and setup_irods.py fails on a server in that
+    state. The server is stopped, the configuration written by setup is removed, and the resource
+    is removed from the catalog if it exists.
+
+    Arguments:
+    provider_service_instance -- the service instance number of the container running the iRODS
+                                 catalog service provider
+    consumer_service_instance -- the service instance number of the container running the iRODS
+                                 catalog service consumer
+    """
+    import shlex
+
+    csp_container = ctx.docker_client.containers.get(
+        context.irods_catalog_provider_container(ctx.compose_project.name, provider_service_instance))
+
+    csc_container = ctx.docker_client.containers.get(
+        context.irods_catalog_consumer_container(ctx.compose_project.name, consumer_service_instance))
+
+    logging.warning('resetting iRODS catalog consumer [{}] after failed setup'.format(csc_container.name))
+
+    try:
+        if stop_irods(csc_container) != 0:
+            logging.debug(f'[{csc_container.name}] failed to stop iRODS server before reset')
+    except Exception as e:
+        # The service account does not exist if setup failed before creating it.
+        logging.debug(f'[{csc_container.name}] failed to stop iRODS server before reset: {str(e)}')
+
+    remove_config = 'rm -f {}'.format(' '.join([context.server_config(),
+                                                context.service_account_irods_env(),
+                                                '/input']))
+
+    if execute.execute_command(csc_container, remove_config) != 0:
+        raise RuntimeError('failed to remove configuration from [{}]'.format(csc_container.name))
+
+    resource_name = shlex.quote(consumer_resource_name(csc_container))
+
+    remove_resource = 'if iadmin lr {0} | grep -q "^resc_name: "; then iadmin rmresc {0}; fi'.format(resource_name)
+
+    if execute.execute_command(csp_container, 'bash -c {}'.format(shlex.quote(remove_resource)), user='irods') != 0:
+        raise RuntimeError('failed to remove resource [{}] from the catalog [{}]'
+                           .format(consumer_resource_name(csc_container), csp_container.name))
+
+
+def configure_consumer_admission(**kwargs):
+    """Change how catalog service consumers are admitted to their provider for setup.
+
+    Setting up a consumer registers it with the provider and the catalog, so setting up many of
+    them at once can overload both. Each provider admits consumers through an adaptive window
+    (see governor.admission_window), and a consumer whose setup fails is set up again after a
+    delay which doubles with each attempt.
+
+    Arguments:
+    limit -- maximum number of consumers to set up at once for one provider
+    initial -- number of consumers to set up at once before any have finished
+    tolerance -- how many times slower than the fastest setup a setup can be before the window
+                 shrinks
+    retries -- number of times a failed setup is tried again
+    retry_delay -- seconds to wait before the first retry
+    """
+    unknown = set(kwargs) - set(consumer_admission)
+    if unknown:
+        raise ValueError('unknown consumer admission settings {}'.format(sorted(unknown)))
+
+    with _consumer_admission_lock:
+        consumer_admission.update({k: v for k, v in kwargs.items() if v is not None})
+        _consumer_admission_windows.clear()
+
+
+def consumer_admission_window(ctx, provider_service_instance=1):
+    """Return the admission window for consumers of the given provider, creating it if needed.
+
+    Arguments:
+    ctx -- context object which contains information about the Docker environment
+    provider_service_instance -- the service instance number of the container running the iRODS
+                                 catalog service provider
+    """
+    key = (ctx.compose_project.name, provider_service_instance)
+
+    with _consumer_admission_lock:
+        if key not in _consumer_admission_windows:
+            _consumer_admission_windows[key] = governor.admission_window(
+                limit=consumer_admission['limit'],
+                initial=consumer_admission['initial'],
+                tolerance=consumer_admission['tolerance'],
+                name=context.irods_catalog_provider_container(ctx.compose_project.name,
+                                                              provider_service_instance))
+
+        return _consumer_admission_windows[key]
+
+
+def admit_irods_catalog_consumer(ctx,
+                                 provider_service_instance=1,
+                                 consumer_service_instance=1,
+                                 **kwargs):
+    """Set up an iRODS catalog service consumer once its provider has room for it.
+
+    The setup runs inside the admission window of the provider (see configure_consumer_admission)
+    and is retried with exponential backoff if it fails. The consumer is reset before each retry
+    (see reset_irods_catalog_consumer).
+
+    Arguments:
+    provider_service_instance -- the service instance number of the container running the iRODS
+                                 catalog service provider
+    consumer_service_instance -- the service instance number of the container being targeted
+                                 to run the iRODS catalog service consumer
+    """
+    import time
+
+    window = consumer_admission_window(ctx, provider_service_instance)
+
+    retries = consumer_admission['retries']
+
+    for attempt in range(retries + 1):
+        try:
+            with window.admit():
+                return setup_irods_catalog_consumer(ctx,
+                                                    provider_service_instance=provider_service_instance,
+                                                    consumer_service_instance=consumer_service_instance,
+                                                    **kwargs)
+
+        except Exception as e:
+            if attempt == retries:
+                raise
+
+            delay = consumer_admission['retry_delay'] * 2 ** attempt
+
+            logging.warning('setting up catalog consumer [{}] failed, retrying in [{}]s: {}'
+                            .format(consumer_service_instance, delay, e))
+
+            reset_irods_catalog_consumer(ctx,
+                                         provider_service_instance=provider_service_instance,
+                                         consumer_service_instance=consumer_service_instance)
+
+            time.sleep(delay)
+
+
 def setup_irods_catalog_consumers(ctx,
                                   provider_service_instance=1,
                                   consumer_service_instances=None,
@@ -1095,10 +1463,12 @@ def setup_irods_catalog_consumers(ctx,
 
     rc = 0
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    # The admission window of the provider decides how many of these actually set up at once.
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(len(consumer_service_instances))) as executor:
         futures_to_catalog_consumer_instances = {
             executor.submit(
-                setup_irods_catalog_consumer,
+                admit_irods_catalog_consumer,
                 ctx, provider_service_instance, instance, **kwargs
             ): instance for instance in consumer_service_instances
         }
@@ -1175,7 +1545,8 @@ def setup_irods_zones(ctx,
 
     rc = 0
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(len(zone_info_list))) as executor:
         futures_to_containers = {
             executor.submit(setup_irods_zone,
                             ctx,
@@ -1205,6 +1576,90 @@ def setup_irods_zones(ctx,
         raise RuntimeError('failed to set up one or more iRODS Zones, ec=[{}]'.format(rc))
 
 
+def add_zone_setup_tasks(graph,
+                         ctx,
+                         zone_info_list,
+                         odbc_driver=None,
+                         install_tasks=None,
+                         force_recreate=False,
+                         **kwargs):
+    """Add tasks which set up iRODS Zones to a task_graph.
+
+    This does what setup_irods_zones does, but each step of each Zone is its own task and only
+    waits for what it actually needs: the catalog for a Zone is set up as soon as its database is
+    ready, the catalog service provider once the catalog and its own packages are ready, and each
+    catalog service consumer once its provider and its own packages are ready. Zones and
+    consumers never wait for each other.
+
+    Arguments:
+    graph -- the task_graph to which the tasks are added
+    ctx -- context object which holds the Docker client and Compose project information
+    zone_info_list -- list of zone_info objects describing the Zones to set up
+    odbc_driver -- path to the local archive file containing the ODBC driver
+    install_tasks -- dict mapping container names to the names of tasks in `graph` which install
+                     packages on them (see install.installer.add_install_tasks)
+    force_recreate -- if True, the catalog is dropped and created again if it exists
+
+    Returns:
+        A dict mapping container names to the names of the tasks which set them up.
+    """
+    install_tasks = install_tasks or dict()
+
+    def dependencies(container_name, *task_names):
+        return list(task_names) + ([install_tasks[container_name]] if container_name in install_tasks else [])
+
+    setup_tasks = dict()
+
+    for z in zone_info_list:
+        zone_kwargs = dict(kwargs, zone_name=z.zone_name, zone_key=z.zone_key, negotiation_key=z.negotiation_key)
+
+        db_container_name = context.irods_catalog_database_container(ctx.compose_project.name,
+                                                                     z.database_service_instance)
+        provider_container_name = context.irods_catalog_provider_container(ctx.compose_project.name,
+                                                                           z.provider_service_instance)
+
+        def setup_catalog(database_service_instance=z.database_service_instance):
+            database_setup.wait_for_database_service(ctx, database_service_instance=database_service_instance)
+
+            database_setup.setup_catalog(ctx,
+                                         force_recreate=force_recreate,
+                                         service_instance=database_service_instance)
+
+        setup_tasks[db_container_name] = graph.add_task('set up catalog [{}]'.format(db_container_name),
+                                                        setup_catalog)
+
+        setup_tasks[provider_container_name] = graph.add_task(
+            'set up catalog provider [{}]'.format(provider_container_name),
+            lambda z=z, zone_kwargs=zone_kwargs: setup_irods_catalog_provider(
+                ctx,
+                database_service_instance=z.database_service_instance,
+                provider_service_instance=z.provider_service_instance,
+                odbc_driver=odbc_driver,
+                **zone_kwargs),
+            dependencies=dependencies(provider_container_name, setup_tasks[db_container_name]))
+
+        consumer_service_instances = z.consumer_service_instances
+        if consumer_service_instances is None:
+            consumer_service_instances = [
+                context.service_instance(c.name)
+                for c in ctx.compose_project.containers(service_names=[context.irods_catalog_consumer_service()])
+            ]
+
+        for instance in consumer_service_instances:
+            consumer_container_name = context.irods_catalog_consumer_container(ctx.compose_project.name, instance)
+
+            setup_tasks[consumer_container_name] = graph.add_task(
+                'set up catalog consumer [{}]'.format(consumer_container_name),
+                lambda z=z, instance=instance, zone_kwargs=zone_kwargs: admit_irods_catalog_consumer(
+                    ctx,
+                    provider_service_instance=z.provider_service_instance,
+                    consumer_service_instance=instance,
+                    **zone_kwargs),
+                dependencies=dependencies(consumer_container_name, setup_tasks[provider_container_name]))
+
+    return setup_tasks
+
+
 def make_negotiation_key(prefix=''):
     """Generate a 32-byte negotiation key with an optional prefix.
 
@@ -1319,7 +1774,8 @@ def upgrade_irods_zone(ctx, provider_service_instance=1, consumer_service_instan
         consumer_service_instances = [context.service_instance(c.name) for c in catalog_consumer_containers]
 
     # Upgrade all the catalog consumers at once.
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(len(consumer_service_instances))) as executor:
         futures_to_catalog_consumer_instances = {
             executor.submit(
                 upgrade_irods,
@@ -1360,7 +1816,8 @@ def upgrade_irods_zones(ctx, zone_info_list):
     """
     rc = 0
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(len(zone_info_list))) as executor:
         futures_to_zone_infos = {
             executor.submit(
                 upgrade_irods_zone,
@@ -0,0 +1,289 @@
+# grown-up modules
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import time
+
+def manifest_file_name():
+    """Return the name of the manifest file at the root of a packaged job output archive."""
+    return 'manifest.json'
+
+
+def compression_types():
+    """Return the list of supported compression types for packaged job output archives."""
+    return ['xz', 'zstd']
+
+
+def archive_extension(compression):
+    """Return the file extension for a packaged job output archive using `compression`.
+
+    Arguments:
+    compression -- compression type (see compression_types)
+    """
+    return {'xz': 'tar.xz', 'zstd': 'tar.zst'}[compression]
+
+
+def _hash_file(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of the contents of the file at `path`."""
+    h = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def _open_compressed_file(path_to_archive, compression, mode):
+    """Return a file object which compresses to or decompresses from `path_to_archive`.
+
+    xz is supported by the standard library. zstd requires the zstandard package, which is
+    optional and only imported when zstd is requested.
+
+    Arguments:
+    path_to_archive -- path to the archive file on the host
+    compression -- compression type (see compression_types)
+    mode -- 'w' to compress into the file, 'r' to decompress from the file
+    """
+    if compression == 'xz':
+        import lzma
+        return lzma.open(path_to_archive, mode + 'b', preset=9 if mode == 'w' else None)
+
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError('zstd compression requires the zstandard package; install it or use xz') from e
+
+        # Long distance matching finds duplicated content which is far apart in the stream.
+        if mode == 'w':
+            params = zstandard.ZstdCompressionParameters.from_level(19, enable_ldm=True, window_log=27)
+            return zstandard.open(path_to_archive, 'wb', cctx=zstandard.ZstdCompressor(compression_params=params))
+
+        return zstandard.open(path_to_archive, 'rb', dctx=zstandard.ZstdDecompressor(max_window_size=2**27))
+
+    raise ValueError(f'unsupported compression type [{compression}]')
+
+
+def _compression_from_archive_name(path_to_archive):
+    """Return the compression type implied by the extension of `path_to_archive`."""
+    for compression in compression_types():
+        if path_to_archive.endswith('.' + archive_extension(compression)):
+            return compression
+
+    raise ValueError(f'cannot determine compression type of [{path_to_archive}]')
+
+
+def package_job_directory(output_directory, path_to_archive=None, compression='xz', remove_directory=False):
+    """Package a job output directory into one compressed, deduplicated tar file.
+
+    Every regular file in `output_directory` is hashed. The first file with a given content is
+    stored in the tar as usual and every later file with the same content is stored as a hard
+    link to it, so duplicated logs and test reports from different containers and zones take up
+    no space in the archive. Standard tar tools restore the hard links as files on extraction.
+
+    A manifest is stored at the root of the archive which records the path, size, and SHA-256
+    of every file, the files collected from each container, and which files were deduplicated.
+
+    Arguments:
+    output_directory -- path to the job output directory (see test_utils.make_output_directory)
+    path_to_archive -- path to the archive to create (default: next to `output_directory`, named
+                       after it with the extension for `compression`)
+    compression -- compression type (see compression_types)
+    remove_directory -- if True, `output_directory` is removed after the archive is written
+    """
+    source = os.path.abspath(output_directory)
+    root = os.path.basename(source)
+
+    if compression not in compression_types():
+        raise ValueError(f'unsupported compression type [{compression}]')
+
+    if not path_to_archive:
+        path_to_archive = '.'.join([source, archive_extension(compression)])
+
+    path_to_archive = os.path.abspath(path_to_archive)
+
+    if os.path.commonpath([source, path_to_archive]) == source:
+        raise ValueError(f'archive [{path_to_archive}] cannot be created inside of [{source}]')
+
+    files = dict()
+    containers = dict()
+    first_path_for_digest = dict()
+    duplicate_count = 0
+    duplicate_bytes = 0
+
+    logging.info(f'packaging job output [{source}] into [{path_to_archive}]')
+
+    partial_archive = path_to_archive + '.partial'
+
+    with _open_compressed_file(partial_archive, compression, 'w') as compressed, \
+         tarfile.open(fileobj=compressed, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+        for dirpath, dirnames, filenames in os.walk(source):
+            # Walk in a stable order so that identical directories produce identical archives.
+            dirnames.sort()
+
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                relative_path = os.path.relpath(path, source)
+                arcname = os.path.join(root, relative_path)
+
+                if os.path.islink(path) or not os.path.isfile(path):
+                    logging.debug(f'skipping [{path}] because it is not a regular file')
+                    continue
+
+                digest = _hash_file(path)
+                size = os.path.getsize(path)
+
+                entry = {'size': size, 'sha256': digest}
+
+                tarinfo = tar.gettarinfo(path, arcname=arcname)
+
+                if digest in first_path_for_digest:
+                    entry['duplicate_of'] = first_path_for_digest[digest]
+
+                    tarinfo.type = tarfile.LNKTYPE
+                    tarinfo.linkname = os.path.join(root, first_path_for_digest[digest])
+                    tarinfo.size = 0
+
+                    tar.addfile(tarinfo)
+
+                    duplicate_count += 1
+                    duplicate_bytes += size
+
+                else:
+                    first_path_for_digest[digest] = relative_path
+
+                    with open(path, 'rb') as f:
+                        tar.addfile(tarinfo, f)
+
+                files[relative_path] = entry
+
+                # Collected files live under logs/<container name>/ in the job output directory.
+                parts = relative_path.split(os.sep)
+                if len(parts) > 2 and parts[0] == 'logs':
+                    containers.setdefault(parts[1], list()).append(relative_path)
+
+        manifest = {
+            'job': root,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'compression': compression,
+            'file_count': len(files),
+            'unique_file_count': len(first_path_for_digest),
+            'deduplicated_bytes': duplicate_bytes,
+            'containers': containers,
+            'files': files,
+        }
+
+        contents = (json.dumps(manifest, sort_keys=True, indent=4) + '\n').encode('utf-8')
+
+        tarinfo = tarfile.TarInfo(os.path.join(root, manifest_file_name()))
+        tarinfo.size = len(contents)
+        tarinfo.mode = 0o644
+        tarinfo.mtime = int(time.time())
+
+        tar.addfile(tarinfo, io.BytesIO(contents))
+
+    os.replace(partial_archive, path_to_archive)
+
+    logging.info(f'packaged [{len(files)}] files from [{source}] into [{path_to_archive}] '
+                 f'([{duplicate_count}] duplicates, [{duplicate_bytes}] bytes deduplicated)')
+
+    if remove_directory:
+        shutil.rmtree(source)
+
+    return path_to_archive
+
+
+def package_job_output(output_directory, compression='xz', log_file_name='script_output.log'):
+    """Package a job output directory at the end of a run and return 0 on success or 1 on failure.
+
+    The script log in the directory is closed first so that the archived copy is complete (see
+    logs.close_log_file). Afterwards, messages are only logged to the console. The directory is
+    removed once it is packaged (see package_job_directory).
+
+    Arguments:
+    output_directory -- path to the job output directory (see test_utils.make_output_directory)
+    compression -- compression type (see compression_types)
+    log_file_name -- name of the script log in `output_directory`
+    """
+    from . import logs
+
+    logs.close_log_file(os.path.join(output_directory, log_file_name))
+
+    try:
+        package_job_directory(output_directory, compression=compression, remove_directory=True)
+
+    except Exception as e:
+        logging.error(e)
+        logging.error('failed to package job output')
+        return 1
+
+    return 0
+
+
+def read_manifest(path_to_archive):
+    """Return the manifest of a packaged job output archive as a dict.
+
+    Arguments:
+    path_to_archive -- path to the archive created by package_job_directory
+    """
+    compression = _compression_from_archive_name(path_to_archive)
+
+    with _open_compressed_file(path_to_archive, compression, 'r') as compressed, \
+         tarfile.open(fileobj=compressed, mode='r|') as tar:
+        for member in tar:
+            if os.path.basename(member.name) == manifest_file_name() and member.name.count('/') == 1:
+                return json.loads(tar.extractfile(member).read())
+
+    raise RuntimeError(f'no manifest found in [{path_to_archive}]')
+
+
+def unpack_job_archive(path_to_archive, path_to_extraction=None):
+    """Extract a packaged job output archive and return the path to the restored job directory.
+
+    The directory is restored with the same layout it had when it was packaged, so the other
+    tools which operate on job output directories (e.g. show_test_logs.py) can be used on it.
+
+    Arguments:
+    path_to_archive -- path to the archive created by package_job_directory
+    path_to_extraction -- directory into which the job directory is restored (default: the
+                          directory containing the archive)
+    """
+    compression = _compression_from_archive_name(path_to_archive)
+
+    dest = os.path.abspath(path_to_extraction or os.path.dirname(os.path.abspath(path_to_archive)))
+
+    logging.info(f'unpacking job output [{path_to_archive}] into [{dest}]')
+
+    root = None
+
+    # Hard links refer to members extracted earlier, so the archive must be read in order. The
+    # stream mode also avoids seeking in the compressed file.
+    with _open_compressed_file(path_to_archive, compression, 'r') as compressed, \
+         tarfile.open(fileobj=compressed, mode='r|') as tar:
+        for member in tar:
+            target = os.path.abspath(os.path.join(dest, member.name))
+            if os.path.commonpath([dest, target]) != dest:
+                raise RuntimeError(f'attempted path traversal in archive [{member.name}]')
+
+            if member.islnk():
+                link_target = os.path.abspath(os.path.join(dest, member.linkname))
+                if os.path.commonpath([dest, link_target]) != dest:
+                    raise RuntimeError(f'attempted path traversal in archive [{member.linkname}]')
+
+            elif not member.isfile() and not member.isdir():
+                logging.debug(f'skipping [{member.name}] because it is not a regular file')
+                continue
+
+            root = root or member.name.split('/')[0]
+
+            tar.extract(member, dest)
+
+    if not root:
+        raise RuntimeError(f'no files found in [{path_to_archive}]')
+
+    return os.path.join(dest, root)
@@ -25,6 +25,24 @@ def configure(verbosity=1, log_filename=None):
     )
 
 
+def close_log_file(log_filename):
+    """Flush and detach the handler writing to `log_filename` so that the file can be moved.
+
+    Messages logged afterwards are only written to the console.
+
+    Arguments:
+    log_filename -- path to the log file passed to configure
+    """
+    path = os.path.abspath(log_filename)
+
+    root = logging.getLogger()
+
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.FileHandler) and handler.baseFilename == path:
+            root.removeHandler(handler)
+            handler.close()
+
+
 def log_directory_for_version(version):
     """Return default iRODS log directory for the given `version`."""
     major,minor,patch = version
@@ -67,3 +85,164 @@ def collect_logs(docker_client, containers, output_directory):
                                               containers,
                                               [log_directory_for_version((major,minor,patch))],
                                               output_directory)
+
+
+def test_timeline_file_name():
+    """Return the name of the file in the job output directory which holds the test timeline."""
+    return 'test_timeline.json'
+
+
+def log_index_file_name():
+    """Return the name of the file in the collected logs directory which holds the log index."""
+    return 'log_index.json'
+
+
+def _timestamp_from_log_line(line):
+    """Return the epoch timestamp of an iRODS server log line, or None if it cannot be found.
+
+    iRODS 4.3 and later write each log message as a JSON object with a `server_timestamp`
+    member in ISO-8601 format (e.g. 2023-01-01T12:34:56.789Z).
+
+    Arguments:
+    line -- bytes representing a single line from an iRODS server log file
+    """
+    import datetime
+    import json
+
+    try:
+        timestamp = json.loads(line)['server_timestamp']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    try:
+        return datetime.datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S.%fZ').replace(
+            tzinfo=datetime.timezone.utc).timestamp()
+    except (ValueError, TypeError):
+        return None
+
+
+def _line_offsets_and_timestamps(log_file):
+    """Return parallel lists of byte offsets and epoch timestamps for each line in `log_file`.
+
+    Lines which do not carry a timestamp of their own (e.g. continuations of a multi-line
+    message) inherit the timestamp of the line preceding them. Timestamps are clamped so that
+    they never decrease, which keeps the list sorted when concurrent agents log slightly out
+    of order.
+
+    Arguments:
+    log_file -- path to the log file on the host
+    """
+    offsets = list()
+    timestamps = list()
+
+    last_timestamp = 0.0
+    offset = 0
+
+    with open(log_file, 'rb') as f:
+        for line in f:
+            last_timestamp = max(_timestamp_from_log_line(line) or 0.0, last_timestamp)
+            offsets.append(offset)
+            timestamps.append(last_timestamp)
+            offset += len(line)
+
+    # Append the end of the file so that slices can always be expressed as [begin, end).
+    offsets.append(offset)
+
+    return offsets, timestamps
+
+
+def index_logs_by_test(output_directory):
+    """Build an index from test name to byte offsets in the collected iRODS server logs.
+
+    The test timeline saved by the test manager in `output_directory` is matched against the
+    timestamps of each line in every `irods.log` file collected under `output_directory/logs`.
+    The resulting index is written next to the logs and its path is returned. If no timeline or
+    no logs exist, nothing is written and None is returned.
+
+    Arguments:
+    output_directory -- the job output directory containing the timeline and collected logs
+    """
+    import bisect
+    import json
+
+    timeline_file = os.path.join(output_directory, test_timeline_file_name())
+    logs_directory = os.path.join(output_directory, 'logs')
+
+    if not os.path.exists(timeline_file) or not os.path.isdir(logs_directory):
+        logging.info(f'no test timeline or logs to index in [{output_directory}]')
+        return None
+
+    with open(timeline_file) as f:
+        timeline = json.load(f)
+
+    index = {entry['test']: list() for entry in timeline}
+    windows = {id(entry): list() for entry in timeline}
+
+    for dirpath, _, filenames in os.walk(logs_directory):
+        for filename in filenames:
+            # Rotated logs are compressed and cannot be addressed by byte offsets.
+            if not filename.startswith('irods.log') or filename.endswith('.gz'):
+                continue
+
+            log_file = os.path.join(dirpath, filename)
+            relative_path = os.path.relpath(log_file, logs_directory)
+            container_name = relative_path.split(os.sep)[0]
+
+            offsets, timestamps = _line_offsets_and_timestamps(log_file)
+
+            for entry in timeline:
+                begin = bisect.bisect_left(timestamps, entry['start'])
+                end = bisect.bisect_right(timestamps, entry['end'])
+                if begin == end:
+                    continue
+
+                windows[id(entry)].append({
+                    'container': container_name,
+                    'file': relative_path,
+                    'begin': offsets[begin],
+                    'end': offsets[end]
+                })
+
+    for entry in timeline:
+        index[entry['test']].append(dict(entry, logs=windows[id(entry)]))
+
+    index_file = os.path.join(logs_directory, log_index_file_name())
+
+    with open(index_file, 'w') as f:
+        json.dump(index, f, indent=4)
+
+    logging.info(f'saved log index to [{index_file}]')
+
+    return index_file
+
+
+def log_lines_for_test(output_directory, test, container_name=None):
+    """Generate the iRODS server log lines written while `test` was running.
+
+    Yields tuples of the container name and the decoded log line. The log index must have been
+    built with `index_logs_by_test` beforehand.
+
+    Arguments:
+    output_directory -- the job output directory containing the collected logs and the index
+    test -- name of the test as it appears in the test timeline
+    container_name -- if provided, only lines from logs collected from this container are yielded
+    """
+    import json
+
+    logs_directory = os.path.join(output_directory, 'logs')
+
+    with open(os.path.join(logs_directory, log_index_file_name())) as f:
+        index = json.load(f)
+
+    if test not in index:
+        raise KeyError(f'test [{test}] not found in log index for [{output_directory}]')
+
+    for run in index[test]:
+        for window in run['logs']:
+            if container_name and window['container'] != container_name:
+                continue
+
+            with open(os.path.join(logs_directory, window['file']), 'rb') as f:
+                f.seek(window['begin'])
+                for line in f.read(window['end'] - window['begin']).splitlines():
+                    yield window['container'], line.decode('utf-8', errors='replace')
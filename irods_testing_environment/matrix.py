@@ -0,0 +1,317 @@
+# grown-up modules
+import glob
+import json
+import logging
+import os
+import time
+
+# local modules
+from . import archive
+from . import context
+from . import governor
+from . import irods_config
+from . import logs
+from . import services
+from . import test_utils
+
+def report_file_name():
+    """Return the name of the file in the matrix output directory which holds the combined report."""
+    return 'matrix_report.json'
+
+
+def expand_project_directories(patterns):
+    """Return the sorted list of Compose project directories matching `patterns`.
+
+    Arguments:
+    patterns -- paths or glob patterns (e.g. projects/ubuntu-*/ubuntu-*-postgres-*)
+    """
+    directories = set()
+
+    for pattern in patterns:
+        matches = glob.glob(os.path.expanduser(pattern)) or [pattern]
+
+        for d in matches:
+            if not os.path.isfile(os.path.join(d, 'docker-compose.yml')):
+                raise ValueError(f'[{d}] is not a Compose project directory')
+
+            directories.add(os.path.abspath(d))
+
+    return sorted(directories)
+
+
+class matrix_job(object):
+    """A Compose project in a matrix run and the resources it is expected to use while it runs."""
+
+    def __init__(self, project_directory, zone_count, cpus, memory):
+        """Construct a matrix_job.
+
+        Arguments:
+        project_directory -- Compose project directory for the platform and database
+        zone_count -- number of identical zones (and test executors) for the project
+        cpus -- number of CPUs the project is expected to use
+        memory -- bytes of memory the project is expected to use
+        """
+        self.project_directory = project_directory
+        self.zone_count = zone_count
+        self.cpus = cpus
+        self.memory = memory
+        self.compose_project = None
+        self.output_directory = None
+        self.state = 'pending'
+        self.rc = None
+        self.error = None
+        self.start = None
+        self.end = None
+
+
+    def name(self):
+        """Return the name of the job, which is the name of the project directory."""
+        return os.path.basename(self.project_directory)
+
+
+    def failed_tests(self):
+        """Return the names of the tests which failed, as recorded in the test timeline."""
+        if not self.output_directory:
+            return list()
+
+        timeline_file = os.path.join(self.output_directory, logs.test_timeline_file_name())
+        if not os.path.isfile(timeline_file):
+            return list()
+
+        with open(timeline_file) as f:
+            return sorted({entry['test'] for entry in json.load(f) if not entry['passed']})
+
+
+    def report(self):
+        """Return a dict describing the outcome of the job for the combined report."""
+        return {
+            'project': self.name(),
+            'project_directory': self.project_directory,
+            'state': self.state,
+            'return_code': self.rc,
+            'error': self.error,
+            'zone_count': self.zone_count,
+            'duration': self.end - self.start if self.start and self.end else None,
+            'output_directory': self.output_directory,
+            'failed_tests': self.failed_tests(),
+        }
+
+
+def run_project(docker_client,
+                job,
+                output_directory,
+                tests=None,
+                fail_fast=False,
+                do_setup=True,
+                save_logs=True,
+                cleanup_containers=True,
+                **kwargs):
+    """Stand up the zones for a matrix job, run the tests on them, and return the return code.
+
+    This does the same thing as run_core_tests.py for one project.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    job -- the matrix_job to run (its Compose project must already be set)
+    output_directory -- directory in which the output directory for the job is created
+    tests -- list of tests to run (if None, the whole python test suite is run)
+    fail_fast -- if True, stop running after the first failure
+    do_setup -- if False, the zones are assumed to be set up already
+    save_logs -- if True, the server logs and test reports are collected into the job output
+    cleanup_containers -- if True, the containers are torn down at the end of the job
+    kwargs -- options passed to services.create_topologies
+    """
+    ctx = context.context(docker_client, job.compose_project)
+
+    job.output_directory = test_utils.make_output_directory(
+        output_directory, test_utils.job_name(ctx.compose_project.name))
+
+    rc = 0
+
+    try:
+        if do_setup:
+            logging.warning(f'standing up [{job.zone_count}] zones for [{job.name()}]')
+
+            services.create_topologies(ctx, zone_count=job.zone_count, **kwargs)
+
+            irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+
+        containers = [
+            ctx.docker_client.containers.get(
+                context.irods_catalog_provider_container(ctx.compose_project.name, service_instance=i + 1))
+            for i in range(job.zone_count)
+        ]
+
+        logging.warning(f'running tests for [{job.name()}]')
+
+        rc = test_utils.run_specific_tests(containers,
+                                           tests,
+                                           [['--xml_output']] * job.zone_count,
+                                           fail_fast,
+                                           output_directory=job.output_directory)
+
+    finally:
+        if save_logs:
+            try:
+                logs.collect_logs(ctx.docker_client, ctx.irods_containers(), job.output_directory)
+
+                archive.collect_files_from_containers(ctx.docker_client,
+                                                      ctx.irods_containers(),
+                                                      [os.path.join(context.irods_home(), 'test-reports')],
+                                                      job.output_directory)
+
+                logs.index_logs_by_test(job.output_directory)
+
+            except Exception as e:
+                logging.error(e)
+                logging.error(f'failed to collect some log files [{job.name()}]')
+
+                if rc == 0:
+                    rc = 1
+
+        if cleanup_containers:
+            ctx.compose_project.down(include_volumes=True, remove_image_type=False)
+
+    return rc
+
+
+def write_report(jobs, output_directory):
+    """Write the combined report for a matrix run and return its path.
+
+    Arguments:
+    jobs -- the matrix_jobs in the run
+    output_directory -- directory in which the report is written
+    """
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'return_code': 0 if all(j.rc == 0 for j in jobs) else 1,
+        'jobs': [j.report() for j in jobs],
+    }
+
+    path = os.path.join(output_directory, report_file_name())
+
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    return path
+
+
+def result_string(jobs):
+    """Return a string summarizing the outcome of every job in a matrix run."""
+    r = '==== begin matrix results ====\n'
+
+    for j in jobs:
+        duration = '{:>9.1f}s'.format(j.end - j.start) if j.start and j.end else '{:>10}'.format('-')
+        r = r + '{:<40} {:<8} {}\n'.format(j.name(), j.state, duration)
+
+        for test in j.failed_tests():
+            r = r + '\tfailed: {}\n'.format(test)
+
+        if j.error:
+            r = r + '\terror: {}\n'.format(j.error)
+
+    r = r + '==== end of matrix results ====\n'
+
+    return r
+
+
+def run_matrix(docker_client,
+               project_directories,
+               output_directory,
+               zone_count=1,
+               cpu_budget=None,
+               memory_budget=None,
+               cpus_per_zone=2,
+               memory_per_zone=2 * 1024 ** 3,
+               build_cache_directory=None,
+               **kwargs):
+    """Run the tests on several Compose projects at once within a CPU and memory budget.
+
+    The images for every project are built first, in parallel, with each distinct image built
+    only once (see compose.project.build_projects). Projects are then started in order as long
+    as the CPUs and memory they are expected to use fit in what is left of the budget. A project
+    which does not fit in the whole budget on its own is run by itself.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    project_directories -- Compose project directories to run
+    output_directory -- directory in which the job output directories and report are written
+    zone_count -- number of identical zones (and test executors) for each project
+    cpu_budget -- number of CPUs the projects may use at once (default: all CPUs on the host)
+    memory_budget -- bytes of memory the projects may use at once (default: all memory on the host)
+    cpus_per_zone -- number of CPUs each zone is expected to use
+    memory_per_zone -- bytes of memory each zone is expected to use
+    build_cache_directory -- directory on the host for the BuildKit cache (see compose.project.build_image)
+    kwargs -- options passed to run_project
+
+    Returns:
+        A list of the matrix_jobs, with their outcomes.
+    """
+    import concurrent.futures
+
+    import compose.cli.command
+    import compose.project
+
+    cpu_budget = cpu_budget or governor.host_cpu_count()
+    memory_budget = memory_budget or governor.host_memory_bytes()
+
+    jobs = [matrix_job(d, zone_count, cpus_per_zone * zone_count, memory_per_zone * zone_count)
+            for d in project_directories]
+
+    for j in jobs:
+        j.compose_project = compose.cli.command.get_project(project_dir=j.project_directory,
+                                                            docker_client=docker_client,
+                                                            build_cache_directory=build_cache_directory)
+
+    logging.warning(f'building images for [{len(jobs)}] projects')
+
+    compose.project.build_projects([j.compose_project for j in jobs])
+
+    pending = list(jobs)
+    running = dict()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        while pending or running:
+            cpus_in_use = sum(j.cpus for j in running.values())
+            memory_in_use = sum(j.memory for j in running.values())
+
+            for j in list(pending):
+                fits = cpus_in_use + j.cpus <= cpu_budget and memory_in_use + j.memory <= memory_budget
+
+                if not fits and running:
+                    continue
+
+                if not fits:
+                    logging.warning(f'[{j.name()}] needs more than the whole budget; running it alone')
+
+                pending.remove(j)
+
+                j.state = 'running'
+                j.start = time.time()
+
+                running[executor.submit(run_project, docker_client, j, output_directory, **kwargs)] = j
+
+                cpus_in_use += j.cpus
+                memory_in_use += j.memory
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for f in done:
+                j = running.pop(f)
+                j.end = time.time()
+
+                try:
+                    j.rc = f.result()
+                    j.state = 'passed' if j.rc == 0 else 'failed'
+
+                except Exception as e:
+                    logging.error(f'exception raised while running [{j.name()}]')
+                    logging.error(e)
+
+                    j.rc = 1
+                    j.state = 'error'
+                    j.error = str(e)
+
+                logging.warning(f'[{j.name()}] finished [{j.state}]')
+
+    return jobs
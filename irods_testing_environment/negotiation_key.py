@@ -9,14 +9,14 @@ from . import context
 from . import execute
 from . import json_utils
 
-def backup_file(container, file_path):
-    backup_file_path = file_path + '.orig'
+def backup_file(container, file_path, suffix='.orig'):
+    backup_file_path = file_path + suffix
     if execute.execute_command(container, f"cp {file_path} {backup_file_path}") != 0:
         raise RuntimeError('failed to backup [{}] [{}]'.format(file_path, container.name))
 
 
-def restore_file(container, file_path):
-    backup_file_path = file_path + '.orig'
+def restore_file(container, file_path, suffix='.orig'):
+    backup_file_path = file_path + suffix
     if execute.execute_command(container, f"cp {backup_file_path} {file_path}") != 0:
         raise RuntimeError('failed to restore [{}] [{}]'.format(file_path, container.name))
 
@@ -58,14 +58,21 @@ def show_configurations(container, stream_output=False):
         raise RuntimeError('failed to cat irods_environment [{}]'.format(container.name))
 
 
-def configure_negotiation_key(container, negotiation_key, server_config=None):
-    config = server_config or json_utils.get_json_from_file(container, context.server_config())
+def configure_negotiation_key(container, negotiation_key, server_config=None, session=None):
+    from . import config_session
+
+    s = session or config_session.config_session(container)
+
+    if server_config is not None:
+        s.patch(lambda _: server_config)
 
     if negotiation_key is not None:
         logging.info('adding "negotiation_key" [{}] to config'.format(negotiation_key))
-        config['negotiation_key'] = negotiation_key
-    elif 'negotiation_key' in config:
+        s.set_value(['negotiation_key'], negotiation_key)
+    else:
         logging.info('deleting "negotiation_key" from config')
-        del config['negotiation_key']
+        s.delete_value(['negotiation_key'])
 
-    json_utils.put_json_to_file(container, context.server_config(), config)
+    # Only write the file if the caller is not batching changes in its own session.
+    if session is None:
+        s.commit()
@@ -0,0 +1,99 @@
+# grown-up modules
+import json
+import logging
+import os
+import tempfile
+
+# local modules
+from . import context
+
+def shared_volume_name():
+    """Return the name of the volume in the Compose projects which is mounted on every iRODS server."""
+    return 'shared_volume'
+
+
+def scratch_directories():
+    """Return the paths in the iRODS server containers which tests write data to.
+
+    These are the vault of the default resource and /tmp, which holds the vaults of resources
+    created by tests (e.g. federation_remote_unixfilesystem_leaf).
+    """
+    return [context.default_vault_directory(), '/tmp']
+
+
+def add_scratch_storage_to_project(compose_project,
+                                   tmpfs_size=None,
+                                   shared_volume_directory=None,
+                                   path_to_override=None):
+    """Move the directories tests write data to off of the overlay filesystem of the containers.
+
+    With `tmpfs_size`, each of the scratch directories (see scratch_directories) in the iRODS
+    server containers is mounted as a tmpfs of at most that size, as is the shared volume unless
+    `shared_volume_directory` is given. With `shared_volume_directory`, the shared volume is bound
+    to that directory on the host instead. The scratch directories cannot be put on a host
+    directory because every replica of a service would share it.
+
+    The mounts are added to the Compose project in an override file, so this must be called before
+    the containers are brought up. Anything written to a tmpfs is lost when its container stops and
+    is not captured in images committed from the container.
+
+    Arguments:
+    compose_project -- compose.Project for the iRODS servers
+    tmpfs_size -- maximum size of each tmpfs as a Compose size value (e.g. '1g')
+    shared_volume_directory -- directory on the host to hold the shared volume
+    path_to_override -- path to the override file to write (default: a new temporary file)
+    """
+    if not tmpfs_size and not shared_volume_directory:
+        return
+
+    override = dict()
+
+    if tmpfs_size:
+        # tmpfs mounts are owned by root, so they are made world-writable like /tmp for the
+        # service account.
+        tmpfs = ['{}:size={},mode=1777'.format(d, tmpfs_size) for d in scratch_directories()]
+
+        override['services'] = {
+            service: {'tmpfs': tmpfs}
+            for service in [context.irods_catalog_provider_service(),
+                            context.irods_catalog_consumer_service()]
+        }
+
+    volumes = compose_project.config().get('volumes', dict())
+
+    if shared_volume_name() not in volumes:
+        logging.info('project [{}] has no volume [{}]'.format(compose_project.name, shared_volume_name()))
+
+    elif shared_volume_directory:
+        shared_volume_directory = os.path.abspath(shared_volume_directory)
+        os.makedirs(shared_volume_directory, exist_ok=True)
+
+        override['volumes'] = {
+            shared_volume_name(): {
+                'driver': 'local',
+                'driver_opts': {'type': 'none', 'o': 'bind', 'device': shared_volume_directory}
+            }
+        }
+
+    elif tmpfs_size:
+        override['volumes'] = {
+            shared_volume_name(): {
+                'driver': 'local',
+                'driver_opts': {'type': 'tmpfs', 'device': 'tmpfs', 'o': 'size={}'.format(tmpfs_size)}
+            }
+        }
+
+    if not override:
+        return
+
+    if not path_to_override:
+        fd, path_to_override = tempfile.mkstemp(prefix=compose_project.name + '-scratch-storage-', suffix='.yml')
+        os.close(fd)
+
+    with open(path_to_override, 'w') as f:
+        json.dump(override, f, indent=4)
+
+    compose_project.add_override_file(path_to_override)
+
+    logging.info('using scratch storage (tmpfs size [{}], shared volume directory [{}]) for project [{}]'
+                 .format(tmpfs_size, shared_volume_directory, compose_project.name))
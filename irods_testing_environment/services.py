@@ -4,9 +4,102 @@ import os
 
 # local modules
 from . import context
+from . import database_setup
 from . import irods_setup
+from . import scratch_storage
+from . import task_graph
 from .install import install
 
+def setup_irods_zones(ctx,
+                      zone_info_list,
+                      installer=None,
+                      externals_directory=None,
+                      package_directory=None,
+                      package_version=None,
+                      odbc_driver=None,
+                      **kwargs):
+    """Install iRODS packages (optionally) and set up iRODS Zones as one task graph.
+
+    Every step declares the steps it depends on for its own container or Zone (see
+    install.installer.add_install_tasks and irods_setup.add_zone_setup_tasks), and runs as soon as
+    they are done. The catalog is set up while packages are still being installed, a catalog
+    service provider is set up once its own packages and its catalog are ready, and each catalog
+    service consumer once its own packages and its provider are ready. A report on how each step
+    ran, with the critical path, is logged at the end.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    zone_info_list -- list of irods_setup.zone_info objects describing the Zones to set up
+    installer -- the installer for the platform (see install.make_installer). If None, the
+                 packages are assumed to be installed already.
+    externals_directory -- path to directory in which iRODS externals packages are housed
+    package_directory -- path to directory in which iRODS packages are housed
+    package_version -- version tag for official iRODS packages to download and install
+    odbc_driver -- path to archive file containing an ODBC driver to use with iRODS CSP
+    """
+    graph = task_graph.task_graph()
+
+    add_setup_tasks(graph,
+                    ctx,
+                    zone_info_list,
+                    installer=installer,
+                    externals_directory=externals_directory,
+                    package_directory=package_directory,
+                    package_version=package_version,
+                    odbc_driver=odbc_driver,
+                    **kwargs)
+
+    try:
+        graph.run()
+
+    finally:
+        logging.info(graph.report())
+
+
+def add_setup_tasks(graph,
+                    ctx,
+                    zone_info_list,
+                    installer=None,
+                    externals_directory=None,
+                    package_directory=None,
+                    package_version=None,
+                    odbc_driver=None,
+                    **kwargs):
+    """Add the tasks which setup_irods_zones runs to a task_graph, so more steps can be added.
+
+    Arguments:
+    graph -- the task_graph to which the tasks are added
+    ctx -- context object which holds the Docker client and Compose project information
+    zone_info_list -- list of irods_setup.zone_info objects describing the Zones to set up
+    installer -- the installer for the platform (see install.make_installer). If None, the
+                 packages are assumed to be installed already.
+    externals_directory -- path to directory in which iRODS externals packages are housed
+    package_directory -- path to directory in which iRODS packages are housed
+    package_version -- version tag for official iRODS packages to download and install
+    odbc_driver -- path to archive file containing an ODBC driver to use with iRODS CSP
+
+    Returns:
+        A dict mapping container names to the names of the tasks which set them up (see
+        irods_setup.add_zone_setup_tasks).
+    """
+    install_tasks = None
+
+    if installer:
+        plan = installer.make_irods_install_plan(ctx,
+                                                 externals_directory=externals_directory,
+                                                 package_directory=package_directory,
+                                                 package_version=package_version)
+
+        install_tasks = installer.add_install_tasks(graph, plan)
+
+    return irods_setup.add_zone_setup_tasks(graph,
+                                            ctx,
+                                            zone_info_list,
+                                            odbc_driver=odbc_driver,
+                                            install_tasks=install_tasks,
+                                            **kwargs)
+
+
 def create_topologies(ctx,
                       zone_count,
                       externals_directory=None,
@@ -16,6 +109,13 @@ def create_topologies(ctx,
                       zone_name='tempZone',
                       consumer_count=0,
                       install_packages=True,
+                      cache_package_images=False,
+                      package_cache_directory=None,
+                      offline_package_cache=False,
+                      catalog_profile=None,
+                      catalog_data_on_tmpfs=True,
+                      scratch_tmpfs_size=None,
+                      shared_volume_directory=None,
                       **kwargs):
     """Create several generic topologies of iRODS servers with the given inputs.
 
@@ -31,27 +131,81 @@ def create_topologies(ctx,
     odbc_driver -- path to archive file containing an ODBC driver to use with iRODS CSP
     consumer_count -- number of iRODS Catalog Service Consumers to create and set up for each
                       Zone
+    cache_package_images -- if True and `package_directory` is provided, reuse (or create) images
+                            with the packages already installed (see
+                            install.installer.add_package_images_to_project)
+    package_cache_directory -- directory on the host to mount into the iRODS containers as the
+                               package cache (see install.add_package_cache_to_project)
+    offline_package_cache -- if True, packages are installed only from the package cache
+    catalog_profile -- name of the settings profile for the database server (see
+                       database_setup.catalog_profiles)
+    catalog_data_on_tmpfs -- if False, the catalog data is kept off of tmpfs even if the catalog
+                             profile asks for it (see database_setup.add_catalog_profile_to_project)
+    scratch_tmpfs_size -- if set, the vaults and /tmp of the iRODS servers are tmpfs mounts of at
+                          most this size (see scratch_storage.add_scratch_storage_to_project)
+    shared_volume_directory -- directory on the host to hold the volume shared by the iRODS servers
     """
-    ctx.compose_project.build()
-    ctx.compose_project.up(scale_override={
+    scale_override = {
         context.irods_catalog_database_service(): zone_count,
         context.irods_catalog_provider_service(): zone_count,
         context.irods_catalog_consumer_service(): consumer_count * zone_count
-    })
+    }
+
+    if install_packages and package_cache_directory:
+        package_cache_directory = install.add_package_cache_to_project(ctx.compose_project,
+                                                                       package_cache_directory)
+
+    if catalog_profile:
+        database_setup.add_catalog_profile_to_project(ctx.compose_project,
+                                                      catalog_profile,
+                                                      data_on_tmpfs=catalog_data_on_tmpfs)
+
+    scratch_storage.add_scratch_storage_to_project(ctx.compose_project,
+                                                   tmpfs_size=scratch_tmpfs_size,
+                                                   shared_volume_directory=shared_volume_directory)
+
+    ctx.compose_project.build()
+
+    installer = install.make_installer(ctx.platform_name(),
+                                       package_cache_directory=package_cache_directory,
+                                       offline=offline_package_cache) if install_packages else None
+
+    use_package_images = install_packages and package_directory and cache_package_images
 
-    if install_packages:
-        install.make_installer(ctx.platform_name()).install_irods_packages(
+    if use_package_images and installer.add_package_images_to_project(
+            ctx,
+            scale_override,
+            externals_directory=externals_directory,
+            package_directory=package_directory):
+        # The containers are created from images which already have the packages installed.
+        installer = None
+        use_package_images = False
+
+    ctx.compose_project.up(scale_override=scale_override)
+
+    if use_package_images:
+        installer.install_irods_packages_with_image_cache(
                 ctx,
+                scale_override,
                 externals_directory=externals_directory,
-                package_directory=package_directory,
-                package_version=package_version)
+                package_directory=package_directory)
+
+        # The packages are installed now.
+        installer = None
 
     zone_names = [zone_name for i in range(zone_count)]
 
     # This should generate a list of identical zone infos
     zone_info_list = irods_setup.get_info_for_zones(ctx, zone_names, consumer_count)
 
-    irods_setup.setup_irods_zones(ctx, zone_info_list, odbc_driver=odbc_driver, **kwargs)
+    setup_irods_zones(ctx,
+                      zone_info_list,
+                      installer=installer,
+                      externals_directory=externals_directory,
+                      package_directory=package_directory,
+                      package_version=package_version,
+                      odbc_driver=odbc_driver,
+                      **kwargs)
 
 
 def create_topology(ctx,
@@ -0,0 +1,518 @@
+# grown-up modules
+import hashlib
+import json
+import logging
+import os
+import shlex
+import tarfile
+import tempfile
+
+import docker
+
+# local modules
+from . import context
+from . import database_setup
+from . import execute
+from . import governor
+from . import irods_config
+from . import irods_setup
+from . import scratch_storage
+
+# Bump this whenever setup changes in a way that makes existing snapshots stale.
+SNAPSHOT_FORMAT_VERSION = 1
+
+def snapshot_repository():
+    """Return the repository prefix for zone snapshot images."""
+    return 'irods-testing-environment-snapshot'
+
+
+def key_label():
+    """Return the name of the image label holding the snapshot key."""
+    return 'org.irods.testing_environment.snapshot.key'
+
+
+def hostname_label():
+    """Return the name of the image label holding the hostname of the snapshotted container."""
+    return 'org.irods.testing_environment.snapshot.hostname'
+
+
+def database_hostname_label():
+    """Return the name of the image label holding the hostname of the snapshotted database."""
+    return 'org.irods.testing_environment.snapshot.database_hostname'
+
+
+def _hash_path(h, path):
+    """Update hashlib object `h` with the names and contents of the files at `path`.
+
+    Arguments:
+    h -- hashlib object to update
+    path -- path to a file or directory (directories are walked in a stable order)
+    """
+    path = os.path.abspath(path)
+
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = list()
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            paths.extend(os.path.join(dirpath, f) for f in sorted(filenames))
+
+    for p in paths:
+        h.update(os.path.relpath(p, os.path.dirname(path)).encode('utf-8'))
+
+        with open(p, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+
+
+def snapshot_key(ctx,
+                 externals_directory=None,
+                 package_directory=None,
+                 package_version=None,
+                 odbc_driver=None,
+                 zone_name='tempZone',
+                 install_packages=True,
+                 cache_package_images=False,
+                 package_cache_directory=None,
+                 offline_package_cache=False,
+                 catalog_profile=None,
+                 scratch_tmpfs_size=None,
+                 shared_volume_directory=None,
+                 **kwargs):
+    """Return a key which identifies a zone set up from the given inputs.
+
+    The key is the SHA-256 of everything which determines the contents of a freshly set up
+    zone: the resolved Compose configuration (which names the platform and database images),
+    the Dockerfile, the iRODS packages, the ODBC driver, and the setup options. Zones created
+    from the same inputs are identical, so a snapshot with a matching key can be used in place
+    of setting up a new zone. No containers need to be running to compute the key.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    externals_directory -- path to directory in which iRODS externals packages are housed
+    package_directory -- path to directory in which iRODS packages are housed
+    package_version -- version tag for official iRODS packages to download and install
+    odbc_driver -- path to archive file containing an ODBC driver to use with iRODS CSP
+    zone_name -- name of the iRODS Zone
+    install_packages -- if False, the packages are part of the image (see release.Dockerfile)
+    cache_package_images -- ignored: it only decides whether installed packages are reused from
+                            an image, and the packages themselves are already hashed
+    package_cache_directory -- ignored: it only changes where packages are downloaded from
+    offline_package_cache -- ignored: it only forbids downloading packages from the network
+    catalog_profile -- ignored: the catalog holds the same data under every profile, and the
+                       profile is applied again to zones started from a snapshot. Running zones
+                       still differ, so zone_pool matches it separately (see zone_pool.member_options).
+    scratch_tmpfs_size -- ignored: tmpfs mounts are not captured in a snapshot and are applied again
+                          to zones started from it. zone_pool matches it separately.
+    shared_volume_directory -- ignored: the shared volume is not part of a snapshot. zone_pool
+                               matches it separately.
+    kwargs -- other options passed to irods_setup.setup_irods_zones
+    """
+    h = hashlib.sha256()
+
+    config = ctx.compose_project.config()
+
+    inputs = {
+        'format': SNAPSHOT_FORMAT_VERSION,
+        'services': {
+            service: config['services'][service]
+            for service in [context.irods_catalog_database_service(),
+                            context.irods_catalog_provider_service()]
+        },
+        'package_version': package_version,
+        'install_packages': install_packages,
+        'zone_name': zone_name,
+        'setup_options': {k: str(v) for k, v in kwargs.items()},
+    }
+    h.update(json.dumps(inputs, sort_keys=True).encode('utf-8'))
+
+    build = config['services'][context.irods_catalog_provider_service()].get('build', dict())
+    dockerfile = os.path.join(build.get('context', ''), build.get('dockerfile', 'Dockerfile'))
+    if os.path.isfile(dockerfile):
+        _hash_path(h, dockerfile)
+
+    for path in [package_directory, externals_directory, odbc_driver]:
+        h.update(b'\0')
+        if path:
+            _hash_path(h, path)
+
+    return h.hexdigest()
+
+
+def snapshot_images(ctx, key):
+    """Return a dict mapping service names to the snapshot image names for `key`.
+
+    The database image is named after the original database image so that the database type
+    can still be derived from the image (see context.database).
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    key -- snapshot key (see snapshot_key)
+    """
+    config = ctx.compose_project.config()
+
+    database_image = config['services'][context.irods_catalog_database_service()]['image']
+    database_repo, database_tag = context.image_repo_and_tag(database_image.split('/')[-1])
+    project = os.path.basename(str(ctx.compose_project.project_dir)).lower()
+    short_key = key[:16]
+
+    return {
+        context.irods_catalog_database_service():
+            f'{snapshot_repository()}/{database_repo}:{database_tag}-{project}-{short_key}',
+        context.irods_catalog_provider_service():
+            f'{snapshot_repository()}/{project}:{short_key}',
+    }
+
+
+def snapshot_exists(docker_client, images):
+    """Return whether every image in `images` exists locally.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    images -- dict mapping service names to image names (see snapshot_images)
+    """
+    for image in images.values():
+        try:
+            docker_client.images.get(image)
+        except docker.errors.ImageNotFound:
+            return False
+
+    return True
+
+
+def _relocated_archive(bits, source_name, destination, extra_files):
+    """Rewrite a tar stream from get_archive so that its contents are placed at `destination`.
+
+    Returns the path to a temporary tar file to be passed to put_archive at '/'.
+
+    Arguments:
+    bits -- iterable of chunks of the tar stream returned by get_archive
+    source_name -- name of the top-level member of the tar stream
+    destination -- absolute path in the container where the top-level member should be placed
+    extra_files -- dict mapping absolute paths to string contents of files to add
+    """
+    import io
+
+    with tempfile.TemporaryFile() as source:
+        for chunk in bits:
+            source.write(chunk)
+        source.seek(0)
+
+        relocated = tempfile.NamedTemporaryFile(suffix='.tar', delete=False)
+
+        with tarfile.open(fileobj=source, mode='r|') as src, \
+             tarfile.open(fileobj=relocated, mode='w', format=tarfile.PAX_FORMAT) as dst:
+            for member in src:
+                name = destination.lstrip('/') + member.name[len(source_name):]
+                f = src.extractfile(member) if member.isfile() else None
+
+                member.name = name
+                if member.islnk():
+                    member.linkname = destination.lstrip('/') + member.linkname[len(source_name):]
+
+                dst.addfile(member, f)
+
+            for path, contents in extra_files.items():
+                data = contents.encode('utf-8')
+                info = tarfile.TarInfo(path.lstrip('/'))
+                info.size = len(data)
+                info.mode = 0o644
+                dst.addfile(info, io.BytesIO(data))
+
+        relocated.close()
+
+    return relocated.name
+
+
+def snapshot_database(ctx, db_container, image, key):
+    """Commit a stopped database container, including its data directory, to `image`.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    db_container -- stopped docker.Container running the catalog database
+    image -- name of the image to create
+    key -- snapshot key (see snapshot_key)
+    """
+    strat = database_setup.make_strategy(ctx.database(), db_container)
+
+    data_directory = strat.data_directory()
+
+    # Volumes can still be read from a stopped container.
+    bits, _ = db_container.get_archive(data_directory)
+
+    path_to_archive = _relocated_archive(bits,
+                                         os.path.basename(data_directory),
+                                         strat.snapshot_data_directory(),
+                                         strat.snapshot_image_files())
+
+    repository, tag = context.image_repo_and_tag(image)
+
+    staging = ctx.docker_client.containers.create(db_container.image.id)
+
+    try:
+        with open(path_to_archive, 'rb') as f:
+            if not staging.put_archive('/', f):
+                raise RuntimeError(f'[{staging.name}] failed to copy database data into snapshot')
+
+        changes = strat.snapshot_image_changes() + [
+            f'LABEL {key_label()}={key}',
+            f'LABEL {hostname_label()}={context.container_hostname(db_container)}',
+        ]
+
+        staging.commit(repository=repository, tag=tag, changes=changes)
+
+    finally:
+        staging.remove(force=True)
+        os.unlink(path_to_archive)
+
+    logging.warning(f'[{db_container.name}] committed database snapshot [{image}]')
+
+
+def snapshot_provider(csp_container, db_container, image, key):
+    """Commit a container running a stopped iRODS catalog service provider to `image`.
+
+    Arguments:
+    csp_container -- docker.Container running the iRODS catalog service provider
+    db_container -- docker.Container running the catalog database used by the provider
+    image -- name of the image to create
+    key -- snapshot key (see snapshot_key)
+    """
+    repository, tag = context.image_repo_and_tag(image)
+
+    changes = [
+        f'LABEL {key_label()}={key}',
+        f'LABEL {hostname_label()}={context.container_hostname(csp_container)}',
+        f'LABEL {database_hostname_label()}={context.container_hostname(db_container)}',
+    ]
+
+    csp_container.commit(repository=repository, tag=tag, changes=changes)
+
+    logging.warning(f'[{csp_container.name}] committed provider snapshot [{image}]')
+
+
+def create_zone_snapshot(ctx, key, provider_service_instance=1):
+    """Commit the provider and database of a set-up zone to snapshot images for `key`.
+
+    The iRODS server and the database server are stopped while the snapshot is taken so that the
+    catalog is consistent, and both are started again afterwards.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    key -- snapshot key (see snapshot_key)
+    provider_service_instance -- service instance of the provider (and its database) to commit
+    """
+    images = snapshot_images(ctx, key)
+
+    csp_container = ctx.docker_client.containers.get(
+        context.irods_catalog_provider_container(ctx.compose_project.name, provider_service_instance))
+
+    db_container = ctx.docker_client.containers.get(
+        context.irods_catalog_database_container(ctx.compose_project.name, provider_service_instance))
+
+    data_directory = database_setup.make_strategy(ctx.database(), db_container).data_directory()
+
+    # Stopping the container would throw away a catalog on tmpfs (see the 'fast' catalog profile)
+    # and leave an empty one in its place.
+    if data_directory in (db_container.attrs['HostConfig'].get('Tmpfs') or dict()):
+        raise RuntimeError(f'[{db_container.name}] cannot snapshot a catalog kept on tmpfs [{data_directory}]')
+
+    if irods_setup.stop_irods(csp_container) != 0:
+        raise RuntimeError(f'[{csp_container.name}] failed to stop iRODS server for snapshot')
+
+    try:
+        db_container.stop()
+
+        try:
+            snapshot_database(ctx, db_container, images[context.irods_catalog_database_service()], key)
+            snapshot_provider(csp_container,
+                              db_container,
+                              images[context.irods_catalog_provider_service()],
+                              key)
+
+        finally:
+            db_container.start()
+            database_setup.wait_for_database_service(ctx, database_service_instance=provider_service_instance)
+
+    finally:
+        if irods_setup.restart_irods(csp_container) != 0:
+            raise RuntimeError(f'[{csp_container.name}] failed to start iRODS server after snapshot')
+
+    return images
+
+
+def write_compose_override(ctx, images, path_to_override=None):
+    """Write a Compose override file which runs the services from `images` and return its path.
+
+    The file is JSON, which Compose accepts as YAML.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    images -- dict mapping service names to image names (see snapshot_images)
+    path_to_override -- path to the file to write (default: a new temporary file)
+    """
+    override = {
+        'services': {
+            service: {'image': image, 'pull_policy': 'never'}
+            for service, image in images.items()
+        }
+    }
+
+    if not path_to_override:
+        fd, path_to_override = tempfile.mkstemp(prefix=ctx.compose_project.name + '-snapshot-', suffix='.yml')
+        os.close(fd)
+
+    with open(path_to_override, 'w') as f:
+        json.dump(override, f, indent=4)
+
+    return path_to_override
+
+
+def restore_provider(ctx, provider_service_instance):
+    """Start the iRODS server in a provider container created from a snapshot image.
+
+    The containers created from the snapshot images have new hostnames and addresses, so every
+    reference to the old hostnames in the iRODS configuration and the catalog is updated first.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    provider_service_instance -- service instance of the provider (and its database)
+    """
+    csp_container = ctx.docker_client.containers.get(
+        context.irods_catalog_provider_container(ctx.compose_project.name, provider_service_instance))
+
+    db_container = ctx.docker_client.containers.get(
+        context.irods_catalog_database_container(ctx.compose_project.name, provider_service_instance))
+
+    labels = csp_container.image.labels
+
+    replacements = [
+        (labels[hostname_label()], context.container_hostname(csp_container)),
+        (labels[database_hostname_label()], context.container_hostname(db_container)),
+    ]
+
+    grep_args = ' '.join(f'-e {shlex.quote(old)}' for old, _ in replacements)
+    sed_args = ' '.join(f'-e s/{old}/{new}/g' for old, new in replacements)
+    config_paths = ' '.join([
+        '/etc/irods',
+        os.path.join(context.irods_home(), '.irods'),
+        os.path.join(context.irods_home(), '.odbc.ini'),
+        '/etc/odbc.ini',
+    ])
+
+    update_hostnames = f'grep -rlF {grep_args} {config_paths} 2>/dev/null | xargs -r sed -i {sed_args}'
+
+    if execute.execute_command(csp_container, f'bash -c {shlex.quote(update_hostnames)}') != 0:
+        raise RuntimeError(f'[{csp_container.name}] failed to update hostnames in configuration')
+
+    database_setup.wait_for_database_service(ctx, database_service_instance=provider_service_instance)
+
+    irods_setup.configure_rsyslog(csp_container)
+
+    if irods_setup.restart_irods(csp_container) != 0:
+        raise RuntimeError(f'[{csp_container.name}] failed to start iRODS server from snapshot')
+
+    old_hostname, new_hostname = replacements[0]
+
+    list_resources = f'iquest --no-page "%s" "select RESC_NAME where RESC_LOC = \'{old_hostname}\'"'
+    ec, out = csp_container.exec_run(list_resources, user='irods')
+    if ec == 0:
+        for resource in out.decode().split():
+            modify_host = f'iadmin modresc {resource} host {new_hostname}'
+            if execute.execute_command(csp_container, modify_host, user='irods') != 0:
+                raise RuntimeError(f'[{csp_container.name}] failed to update host for resource [{resource}]')
+
+    logging.warning(f'[{csp_container.name}] iRODS server started from snapshot')
+
+
+def create_topologies_from_snapshot(ctx, images, zone_count):
+    """Start `zone_count` zones from snapshot images instead of setting them up.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    images -- dict mapping service names to image names (see snapshot_images)
+    zone_count -- number of identical zones to start
+    """
+    import concurrent.futures
+
+    ctx.compose_project.add_override_file(write_compose_override(ctx, images))
+
+    ctx.compose_project.up(scale_override={
+        context.irods_catalog_database_service(): zone_count,
+        context.irods_catalog_provider_service(): zone_count,
+        context.irods_catalog_consumer_service(): 0
+    })
+
+    rc = 0
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=governor.default_governor().setup_workers(zone_count)) as executor:
+        futures_to_instances = {
+            executor.submit(restore_provider, ctx, i + 1): i + 1 for i in range(zone_count)
+        }
+
+        for f in concurrent.futures.as_completed(futures_to_instances):
+            instance = futures_to_instances[f]
+            try:
+                f.result()
+                logging.debug(f'zone restored from snapshot successfully [{instance}]')
+
+            except Exception as e:
+                logging.error(f'exception raised while restoring zone from snapshot [{instance}]')
+                logging.error(e)
+                rc = 1
+
+    if rc != 0:
+        raise RuntimeError('failed to restore zone from snapshot on some service')
+
+    # Addresses change with every container, so host resolution is configured again.
+    irods_config.configure_host_resolution(ctx.docker_client, ctx.compose_project)
+
+
+def create_topologies(ctx, zone_count, consumer_count=0, **kwargs):
+    """Create identical, fully configured zones for testing, reusing a snapshot when possible.
+
+    If snapshot images exist for the inputs, the zones are started from them and setup is
+    skipped entirely. Otherwise, the zones are created with services.create_topologies and
+    configured with irods_config.configure_irods_testing, and then the first zone is committed to
+    snapshot images for later runs.
+
+    Arguments:
+    ctx -- context object which holds the Docker client and Compose project information
+    zone_count -- number of identical zones to create
+    consumer_count -- must be 0 because only the provider and database are snapshotted
+    kwargs -- options passed to services.create_topologies (see snapshot_key)
+    """
+    from . import services
+
+    if consumer_count:
+        raise ValueError('zone snapshots do not support iRODS catalog service consumers')
+
+    key = snapshot_key(ctx, **kwargs)
+    images = snapshot_images(ctx, key)
+
+    if snapshot_exists(ctx.docker_client, images):
+        logging.warning(f'starting [{zone_count}] zones from snapshot [{key}]')
+
+        if kwargs.get('catalog_profile'):
+            # The restored catalog is kept outside of the data directory (see
+            # snapshot_data_directory), so a tmpfs there would hold nothing.
+            database_setup.add_catalog_profile_to_project(ctx.compose_project,
+                                                          kwargs['catalog_profile'],
+                                                          data_on_tmpfs=False)
+
+        scratch_storage.add_scratch_storage_to_project(ctx.compose_project,
+                                                       tmpfs_size=kwargs.get('scratch_tmpfs_size'),
+                                                       shared_volume_directory=kwargs.get('shared_volume_directory'))
+
+        create_topologies_from_snapshot(ctx, images, zone_count)
+        return
+
+    logging.warning(f'no snapshot found for [{key}], setting up [{zone_count}] zones')
+
+    # The zone is committed to a snapshot below, which stops the database container, so the
+    # catalog must not be on a tmpfs.
+    services.create_topologies(ctx, zone_count=zone_count, consumer_count=0, catalog_data_on_tmpfs=False, **kwargs)
+
+    irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+
+    create_zone_snapshot(ctx, key)
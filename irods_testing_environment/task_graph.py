@@ -0,0 +1,225 @@
+# grown-up modules
+import logging
+import time
+
+# local modules
+from . import governor
+
+class task(object):
+    """A unit of work in a task_graph and the record of how it ran."""
+
+    def __init__(self, name, function, dependencies=None, retries=0, retry_delay=5):
+        """Construct a task.
+
+        Arguments:
+        name -- unique name of the task in its graph
+        function -- callable which takes no arguments and does the work (raise to fail the task)
+        dependencies -- names of the tasks which must finish successfully before this one starts
+        retries -- number of times the task is run again after raising
+        retry_delay -- seconds to wait before each retry
+        """
+        self.name = name
+        self.function = function
+        self.dependencies = list(dependencies or list())
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.state = 'pending'
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.start = None
+        self.end = None
+
+
+    def duration(self):
+        """Return the number of seconds the task ran, or 0 if it did not run."""
+        if self.start is None or self.end is None:
+            return 0
+
+        return self.end - self.start
+
+
+class task_graph(object):
+    """A set of tasks with dependencies, run as soon as the tasks they depend on are done.
+
+    There are no barriers between phases: a task starts when its own dependencies have finished,
+    no matter what else is still running. When a task fails, the tasks which depend on it (directly
+    or not) are skipped and everything else keeps going.
+    """
+
+    def __init__(self):
+        self.tasks = dict()
+
+
+    def add_task(self, name, function, dependencies=None, retries=0, retry_delay=5):
+        """Add a task to the graph and return its name (see task for the arguments)."""
+        if name in self.tasks:
+            raise ValueError(f'task [{name}] is already in the graph')
+
+        self.tasks[name] = task(name, function, dependencies, retries, retry_delay)
+
+        return name
+
+
+    def result(self, name):
+        """Return the value returned by the function of the named task."""
+        return self.tasks[name].result
+
+
+    def ordered(self):
+        """Return the tasks in an order in which every task comes after its dependencies.
+
+        Raises ValueError if a dependency is not in the graph or the dependencies form a cycle.
+        """
+        ordered = list()
+        visiting = set()
+        visited = set()
+
+        def visit(t, path):
+            if t.name in visited:
+                return
+
+            if t.name in visiting:
+                raise ValueError('dependency cycle in task graph [{}]'.format(' -> '.join(path + [t.name])))
+
+            visiting.add(t.name)
+
+            for d in t.dependencies:
+                if d not in self.tasks:
+                    raise ValueError(f'task [{t.name}] depends on unknown task [{d}]')
+
+                visit(self.tasks[d], path + [t.name])
+
+            visiting.remove(t.name)
+            visited.add(t.name)
+            ordered.append(t)
+
+        for t in self.tasks.values():
+            visit(t, list())
+
+        return ordered
+
+
+    def _run_task(self, t):
+        t.start = time.time()
+
+        while True:
+            t.attempts += 1
+
+            try:
+                logging.debug(f'running task [{t.name}] (attempt [{t.attempts}])')
+
+                return t.function()
+
+            except Exception as e:
+                if t.attempts > t.retries:
+                    raise
+
+                logging.warning(f'task [{t.name}] failed, retrying in [{t.retry_delay}]s: {e}')
+
+                time.sleep(t.retry_delay)
+
+
+    def run(self, max_workers=None):
+        """Run every task in the graph and raise RuntimeError if any of them failed.
+
+        Arguments:
+        max_workers -- maximum number of tasks to run at once (default: determined by the governor)
+        """
+        import concurrent.futures
+
+        ordered = self.ordered()
+
+        if not ordered:
+            return
+
+        max_workers = max_workers or governor.default_governor().setup_workers(len(ordered))
+
+        running = dict()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                # The tasks are ordered by dependency, so one pass is enough to skip everything
+                # downstream of a failure and to start everything which is ready.
+                for t in ordered:
+                    if t.state != 'pending':
+                        continue
+
+                    dependency_states = [self.tasks[d].state for d in t.dependencies]
+
+                    if any(s in ('failed', 'skipped') for s in dependency_states):
+                        logging.error(f'skipping task [{t.name}] because a task it depends on failed')
+                        t.state = 'skipped'
+
+                    elif all(s == 'done' for s in dependency_states):
+                        t.state = 'running'
+                        running[executor.submit(self._run_task, t)] = t
+
+                if not running:
+                    break
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for f in done:
+                    t = running.pop(f)
+                    t.end = time.time()
+
+                    try:
+                        t.result = f.result()
+                        t.state = 'done'
+
+                        logging.debug(f'task [{t.name}] done in [{t.duration():.1f}]s')
+
+                    except Exception as e:
+                        logging.error(f'exception raised by task [{t.name}]')
+                        logging.error(e)
+
+                        t.state = 'failed'
+                        t.error = e
+
+        failed = [t.name for t in ordered if t.state == 'failed']
+        if failed:
+            raise RuntimeError(f'[{len(failed)}] tasks failed: {failed}')
+
+
+    def critical_path(self):
+        """Return the chain of tasks which determined how long the graph took to run.
+
+        Starting from the task which finished last, each step goes back to the dependency which
+        finished last, i.e. the one the task was waiting for before it could start.
+        """
+        finished = [t for t in self.tasks.values() if t.end is not None]
+        if not finished:
+            return list()
+
+        path = [max(finished, key=lambda t: t.end)]
+
+        while True:
+            dependencies = [self.tasks[d] for d in path[-1].dependencies if self.tasks[d].end is not None]
+            if not dependencies:
+                break
+
+            path.append(max(dependencies, key=lambda t: t.end))
+
+        return list(reversed(path))
+
+
+    def report(self):
+        """Return a string describing how each task ran and which tasks were on the critical path."""
+        started = [t.start for t in self.tasks.values() if t.start is not None]
+        origin = min(started) if started else 0
+
+        r = '==== begin task graph report ====\n'
+
+        for t in sorted(self.tasks.values(), key=lambda t: (t.start is None, t.start or 0)):
+            start = '{:>9.1f}s'.format(t.start - origin) if t.start is not None else '{:>10}'.format('-')
+            r = r + '{:<8} {} {:>9.1f}s  {}\n'.format(t.state, start, t.duration(), t.name)
+
+        r = r + 'critical path:\n'
+
+        for t in self.critical_path():
+            r = r + '\t{:>9.1f}s  {}\n'.format(t.duration(), t.name)
+
+        r = r + '==== end of task graph report ====\n'
+
+        return r
@@ -9,7 +9,7 @@ from . import test_runner
 class test_manager:
     """A class that manages a list of tests and `test_runners` for executing tests."""
 
-    def __init__(self, containers, tests, test_type='irods_python_suite'):
+    def __init__(self, containers, tests, test_type='irods_python_suite', zone_resets=None):
         """Constructor for `test_manager`.
 
         A note about passing `None` to `tests`:
@@ -24,11 +24,15 @@ class test_manager:
         containers -- list of containers which will be used to construct `test_runner`s
         tests -- list of tests which will run on the `test_runners`
         test_type -- a string representing the name of the class implementing the test_runner
+        zone_resets -- list of callables, one for each container, which return the zone of the
+                       container to a clean state between tests (see test_runner)
         """
         tr_name = '_'.join(['test_runner', test_type])
         tr = eval('.'.join(['test_runner', tr_name]))
 
-        self.test_runners = [tr(c) for c in containers]
+        zone_resets = zone_resets or [None] * len(containers)
+
+        self.test_runners = [tr(c, r) for c, r in zip(containers, zone_resets)]
         self.test_list = tests
         self.duration = -1
 
@@ -45,6 +49,50 @@ class test_manager:
         return [t for tr in self.test_runners for t in tr.failed_tests()]
 
 
+    def test_timeline(self):
+        """Return a list of dicts describing when each executed test started and finished.
+
+        Each entry contains the test name, the name of the executing container, the epoch
+        timestamps for the start and end of the test, and whether the test passed.
+        """
+        timeline = list()
+
+        for tr in self.test_runners:
+            failed = [t for t,_ in tr.failed_tests()]
+
+            for test, start, end in tr.test_timeline():
+                timeline.append({
+                    'test': test or 'all tests',
+                    'executor': tr.name(),
+                    'start': start,
+                    'end': end,
+                    'passed': test not in failed
+                })
+
+        return sorted(timeline, key=lambda entry: entry['start'])
+
+
+    def save_test_timeline(self, output_directory):
+        """Write the test timeline to a JSON file in `output_directory` and return its path.
+
+        Arguments:
+        output_directory -- directory on the host in which the timeline file will be written
+        """
+        import json
+        import os
+
+        from . import logs
+
+        timeline_file = os.path.join(output_directory, logs.test_timeline_file_name())
+
+        with open(timeline_file, 'w') as f:
+            json.dump(self.test_timeline(), f, indent=4)
+
+        logging.info(f'saved test timeline to [{timeline_file}]')
+
+        return timeline_file
+
+
     def return_code(self):
         """Return int representing the 'overall' return code from a test run.
 
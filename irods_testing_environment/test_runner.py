@@ -7,18 +7,22 @@ import time
 # local modules
 from . import context
 from . import execute
+from . import governor
 
 class test_runner:
     """A class that manages a list of tests and can execute them on a managed container."""
 
-    def __init__(self, executing_container):
+    def __init__(self, executing_container, reset=None):
         """Constructor for `test_runner`.
 
         Arguments:
         executing_container -- the container on which tests will be executed
+        reset -- callable which returns the zone of the executing container to a clean state. If
+                 provided, it is called before every test except the first.
         """
         # TODO: each test runner is tied to a single container... might need to abstract this out later
         self.executor = executing_container
+        self.reset = reset
         self.tests = list()
         self.rc = 0
 
@@ -29,6 +33,11 @@ class test_runner:
         self.passed = list()
         self.failed = list()
 
+        # Every executed test is also recorded with the epoch timestamps marking when it started
+        # and when it finished. These are used to find the server log lines which were produced
+        # while the test was running.
+        self.timeline = list()
+
         # Start the duration time at -1 to indicate that no tests have run
         self.duration = -1
 
@@ -73,6 +82,11 @@ class test_runner:
         return self.failed
 
 
+    def test_timeline(self):
+        """Return the list of (test, start, end) tuples for the tests which have been executed."""
+        return self.timeline
+
+
     def skipped_tests(self):
         """Return the list of tests which have not been executed."""
         executed_tests = [t for t,_ in self.passed_tests()] + [t for t,_ in self.failed_tests()]
@@ -127,8 +141,28 @@ class test_runner:
                 # TODO: Consider block=True/Queue.join(). May butt heads with current design.
                 # Queue.get will raise queue.Empty when there is nothing in the queue.
                 t = test_queue.get(block=False)
+
+                # Hold the test back while the host is overloaded rather than make every test slower.
+                governor.default_governor().wait_for_capacity(self.name())
+
+                # Keep state left behind by the previous test from leaking into this one.
                 self.add_test(t)
 
+                if self.reset and self.test_timeline():
+                    logging.warning(f'[{self.name()}]: resetting zone before test [{t}]')
+
+                    try:
+                        self.reset()
+
+                    except Exception as e:
+                        # The zone is in an unknown state, so the test is counted as failed and no
+                        # more tests are run on it.
+                        test_queue.task_done()
+                        self.rc = 1
+                        self.failed_tests().append((t, 0.0))
+                        logging.error(f'[{self.name()}]: test failed because the zone could not be reset [{t or "all tests"}]: {e}')
+                        raise RuntimeError(f'[{self.name()}]: failed to reset zone before test [{t}]') from e
+
                 logging.warning(f'[{self.name()}]: running test [{t}]')
 
                 start = time.time()
@@ -139,6 +173,8 @@ class test_runner:
 
                 test_queue.task_done()
 
+                self.test_timeline().append((t, start, end))
+
                 duration = end - start
 
                 logging.info(f'[{self.name()}]: cmd [{ec}] [{cmd}]')
@@ -172,8 +208,8 @@ class test_runner:
 
 
 class test_runner_irods_python_suite(test_runner):
-    def __init__(self, executing_container):
-        super(test_runner_irods_python_suite, self).__init__(executing_container)
+    def __init__(self, executing_container, reset=None):
+        super(test_runner_irods_python_suite, self).__init__(executing_container, reset)
 
 
     @staticmethod
@@ -206,8 +242,8 @@ class test_runner_irods_python_suite(test_runner):
 
 
 class test_runner_irods_unit_tests(test_runner):
-    def __init__(self, executing_container):
-        super(test_runner_irods_unit_tests, self).__init__(executing_container)
+    def __init__(self, executing_container, reset=None):
+        super(test_runner_irods_unit_tests, self).__init__(executing_container, reset)
 
 
     def execute_test(self, test, options=None, reporter='junit'):
@@ -237,8 +273,8 @@ class test_runner_irods_unit_tests(test_runner):
 
 
 class test_runner_irods_plugin_tests(test_runner):
-    def __init__(self, executing_container):
-        super(test_runner_irods_plugin_tests, self).__init__(executing_container)
+    def __init__(self, executing_container, reset=None):
+        super(test_runner_irods_plugin_tests, self).__init__(executing_container, reset)
 
 
     # TODO: this could likely just be implemented in yet another subclass
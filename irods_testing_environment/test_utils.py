@@ -50,7 +50,7 @@ def make_output_directory(dirname, basename):
 
     return directory
 
-def run_unit_tests(containers, test_list=None, fail_fast=True):
+def run_unit_tests(containers, test_list=None, fail_fast=True, output_directory=None):
     """Run a set of tests from the python test suite for iRODS.
 
     Arguments:
@@ -58,6 +58,7 @@ def run_unit_tests(containers, test_list=None, fail_fast=True):
     test_list -- a list of strings of the tests to be run
     options -- list of strings representing script options to pass to the run_tests.py script
     fail_fast -- if True, stop running after first failure; else, runs all tests
+    output_directory -- if provided, the test timeline is saved here for log indexing
     """
     tests = test_list or get_unit_test_list(containers[0])
 
@@ -69,6 +70,9 @@ def run_unit_tests(containers, test_list=None, fail_fast=True):
     finally:
         logging.error(tm.result_string())
 
+        if output_directory:
+            tm.save_test_timeline(output_directory)
+
     return tm.return_code()
 
 
@@ -77,7 +81,8 @@ def run_plugin_tests(containers,
                      path_to_test_hook_on_host=None,
                      test_list=None,
                      options=None,
-                     fail_fast=True):
+                     fail_fast=True,
+                     output_directory=None):
     """Run a set of tests from the test hook for the specified iRODS plugin.
 
     Arguments:
@@ -87,6 +92,7 @@ def run_plugin_tests(containers,
     test_list -- a list of strings of the tests to be run
     options -- list of strings representing script options to pass to the run_tests.py script
     fail_fast -- if True, stop running after first failure; else, runs all tests
+    output_directory -- if provided, the test timeline is saved here for log indexing
     """
     tm = test_manager.test_manager(containers, test_list, test_type='irods_plugin_tests')
 
@@ -100,10 +106,18 @@ def run_plugin_tests(containers,
     finally:
         logging.error(tm.result_string())
 
+        if output_directory:
+            tm.save_test_timeline(output_directory)
+
     return tm.return_code()
 
 
-def run_specific_tests(containers, test_list=None, options=None, fail_fast=True):
+def run_specific_tests(containers,
+                       test_list=None,
+                       options=None,
+                       fail_fast=True,
+                       output_directory=None,
+                       zone_resets=None):
     """Run a set of tests from the python test suite for iRODS.
 
     Arguments:
@@ -111,10 +125,13 @@ def run_specific_tests(containers, test_list=None, options=None, fail_fast=True)
     test_list -- a list of strings of the tests to be run
     options -- A list of lists of strings representing options to pass to the scripts running tests
     fail_fast -- if True, stop running after first failure; else, runs all tests
+    output_directory -- if provided, the test timeline is saved here for log indexing
+    zone_resets -- list of callables, one for each container, which return the zone of the
+                   container to a clean state between tests
     """
     tests = test_list or get_test_list(containers[0])
 
-    tm = test_manager.test_manager(containers, tests)
+    tm = test_manager.test_manager(containers, tests, zone_resets=zone_resets)
 
     try:
         tm.run(fail_fast, options=options)
@@ -122,6 +139,9 @@ def run_specific_tests(containers, test_list=None, options=None, fail_fast=True)
     finally:
         logging.error(tm.result_string())
 
+        if output_directory:
+            tm.save_test_timeline(output_directory)
+
     return tm.return_code()
 
 
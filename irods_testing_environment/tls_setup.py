@@ -110,7 +110,7 @@ def configure_tls_for_service_account(container, cert_file):
     json_utils.put_json_to_file(container, service_account_irods_env, irods_env)
 
 
-def configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file):
+def configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file, session=None):
     """Configure TLS in server_config on the iRODS server.
 
     Arguments:
@@ -118,27 +118,28 @@ def configure_tls_in_server_config(container, key_file, chain_file, dhparams_fil
     key_file -- path to the file in the container containing the private key for the cert
     chain_file -- path to the file in the container containing the self-signed cert
     dhparams_file -- path to the file in the container containing the dhparams PEM file
+    session -- config_session in which to batch the changes to server_config (if None, the
+               changes are written to the container immediately)
     """
+    from . import config_session
     from . import negotiation_key
 
-    config = json_utils.get_json_from_file(container, context.server_config())
+    s = session or config_session.config_session(container)
 
-    logging.debug(f'[{container.name}: config before [{json.dumps(config)}]')
-
-    config["client_server_policy"] = "CS_NEG_REQUIRE"
-    config["tls_server"] = {
+    s.set_value(["client_server_policy"], "CS_NEG_REQUIRE")
+    s.set_value(["tls_server"], {
         "certificate_chain_file": chain_file,
         "certificate_key_file": key_file,
         "dh_params_file": dhparams_file,
-    }
-    config["tls_client"] = {
+    })
+    s.set_value(["tls_client"], {
         "ca_certificate_file": cert_file,
         "verify_server": "cert"
-    }
-
-    json_utils.put_json_to_file(container, context.server_config(), config)
+    })
 
-    logging.debug(f'[{container.name}: config after [{json.dumps(config)}]')
+    # Only write the file if the caller is not batching changes in its own session.
+    if session is None:
+        s.commit()
 
     negotiation_key.backup_file(container, context.core_re())
     negotiation_key.configure_tls_in_server(container, 'CS_NEG_REQUIRE')
@@ -210,7 +211,8 @@ def configure_tls_on_irods4_server(container,
 def configure_tls_on_server(container,
                             path_to_key_file_on_host,
                             path_to_cert_file_on_host,
-                            path_to_dhparams_file_on_host):
+                            path_to_dhparams_file_on_host,
+                            session=None):
     """Copy TLS files to the container and configure TLS on the iRODS server.
 
     Arguments:
@@ -218,6 +220,8 @@ def configure_tls_on_server(container,
     path_to_key_file_on_host -- path to file on host containing the private key for the cert
     path_to_cert_file_on_host -- path to file on host containing the self-signed cert
     path_to_dhparams_file_on_host -- path to file on host containing the dhparams PEM file
+    session -- config_session holding other pending changes to server_config, if any. The
+               TLS changes are added to it and it is committed before the server is started.
     """
     # If this is not an iRODS 5 server, use the old way of configuring TLS.
     version = irods_config.get_irods_version(container)
@@ -247,7 +251,10 @@ def configure_tls_on_server(container,
 
     configure_tls_for_service_account(container, cert_file)
 
-    configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file)
+    configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file, session=session)
+
+    if session is not None:
+        session.commit()
 
     # start the server again
     start_cmd = "python3 -c 'from scripts.irods.controller import IrodsController; IrodsController().start()'"
@@ -257,7 +264,16 @@ def configure_tls_on_server(container,
     logging.warning(f"[{container.name}] TLS configured successfully")
 
 
-def configure_tls_in_zone(docker_client, compose_project):
+def configure_tls_in_zone(docker_client, compose_project, config_sessions=None):
+    """Configure TLS on every iRODS server in the Compose project.
+
+    Arguments:
+    docker_client -- docker client for interacting with the docker-compose project
+    compose_project -- compose.Project in which the iRODS servers are running
+    config_sessions -- dict mapping container names to config_sessions with pending changes to
+                       server_config (optional). Each session is committed while its server is
+                       stopped for TLS configuration.
+    """
     import concurrent.futures
     import tempfile
 
@@ -285,7 +301,8 @@ def configure_tls_in_zone(docker_client, compose_project):
                                 docker_client.containers.get(c.name),
                                 key_file,
                                 cert_file,
-                                dhparams_file): c for c in csps
+                                dhparams_file,
+                                (config_sessions or dict()).get(c.name)): c for c in csps
             }
 
             for f in concurrent.futures.as_completed(futures_to_containers):
@@ -310,7 +327,8 @@ def configure_tls_in_zone(docker_client, compose_project):
                                 docker_client.containers.get(c.name),
                                 key_file,
                                 cert_file,
-                                dhparams_file): c for c in cscs
+                                dhparams_file,
+                                (config_sessions or dict()).get(c.name)): c for c in cscs
             }
 
             for f in concurrent.futures.as_completed(futures_to_containers):
@@ -0,0 +1,388 @@
+# grown-up modules
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+
+# local modules
+from . import context
+
+class zone_pool(object):
+    """A pool of idle, fully set up zones which test runs can lease instead of creating zones.
+
+    Each member of the pool is a Compose project with one or more identical zones started from
+    a zone snapshot (see snapshot.create_topologies). The state of the pool is kept in a
+    directory on the host with one JSON file per member, so the pool manager and any number of
+    test runs can share it. A lock file serializes changes to the pool.
+
+    A member moves through these states:
+        provisioning -- the pool manager is creating the zones
+        idle -- the zones are ready to be leased
+        leased -- a test run is using the zones
+        returned -- the test run is done and the zones are waiting to be destroyed
+    """
+
+    def __init__(self, pool_directory):
+        """Construct a zone_pool.
+
+        Arguments:
+        pool_directory -- directory on the host in which the state of the pool is kept
+        """
+        self.pool_directory = os.path.abspath(pool_directory)
+
+        os.makedirs(self.pool_directory, exist_ok=True)
+
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Hold an exclusive lock on the pool for the duration of the `with` block."""
+        with open(os.path.join(self.pool_directory, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+    def _path(self, project_name):
+        return os.path.join(self.pool_directory, project_name + '.json')
+
+
+    def _write(self, entry):
+        path = self._path(entry['project_name'])
+        tmp = path + '.tmp'
+
+        with open(tmp, 'w') as f:
+            json.dump(entry, f, sort_keys=True, indent=4)
+
+        os.replace(tmp, path)
+
+
+    def entries(self):
+        """Return a list of the members of the pool as dicts."""
+        entries = list()
+
+        for name in sorted(os.listdir(self.pool_directory)):
+            if not name.endswith('.json'): continue
+
+            try:
+                with open(os.path.join(self.pool_directory, name)) as f:
+                    entries.append(json.load(f))
+
+            except (OSError, ValueError) as e:
+                logging.debug(f'ignoring unreadable pool entry [{name}]: {e}')
+
+        return entries
+
+
+    def add(self, project_directory, key, zone_count, options=None):
+        """Add a new member in the provisioning state and return its entry.
+
+        Arguments:
+        project_directory -- Compose project directory from which the member is created
+        key -- snapshot key of the zones in the member (see snapshot.snapshot_key)
+        zone_count -- number of zones in the member
+        options -- options the running zones were created with (see member_options)
+        """
+        base_name = context.sanitize(os.path.basename(os.path.abspath(project_directory))).lower()
+
+        entry = {
+            'project_name': f'{base_name}-pool-{uuid.uuid4().hex[:8]}',
+            'project_directory': os.path.abspath(project_directory),
+            'key': key,
+            'zone_count': zone_count,
+            'options': options or member_options(),
+            'state': 'provisioning',
+            'owner': os.getpid(),
+            'updated': time.time(),
+        }
+
+        with self.lock():
+            self._write(entry)
+
+        return entry
+
+
+    def set_state(self, project_name, state, owner=None):
+        """Set the state of a member of the pool and return its entry.
+
+        Arguments:
+        project_name -- Compose project name of the member
+        state -- the new state
+        owner -- pid of the process responsible for the member in its new state
+        """
+        with self.lock():
+            with open(self._path(project_name)) as f:
+                entry = json.load(f)
+
+            entry['state'] = state
+            entry['owner'] = owner
+            entry['updated'] = time.time()
+
+            self._write(entry)
+
+        return entry
+
+
+    def remove(self, project_name):
+        """Remove a member from the pool.
+
+        Arguments:
+        project_name -- Compose project name of the member
+        """
+        with self.lock():
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._path(project_name))
+
+
+    def lease(self, project_directory, key, zone_count, options=None):
+        """Lease an idle member matching the inputs and return its entry, or None if there is none.
+
+        Arguments:
+        project_directory -- Compose project directory of the zones to lease
+        key -- snapshot key of the zones to lease (see snapshot.snapshot_key)
+        zone_count -- number of zones needed
+        options -- options the running zones must have been created with (see member_options)
+        """
+        options = options or member_options()
+
+        with self.lock():
+            for entry in self.entries():
+                if entry['state'] != 'idle': continue
+                if entry['key'] != key or entry['zone_count'] != zone_count: continue
+                if entry.get('options', member_options()) != options: continue
+                if entry['project_directory'] != os.path.abspath(project_directory): continue
+
+                entry['state'] = 'leased'
+                entry['owner'] = os.getpid()
+                entry['updated'] = time.time()
+
+                self._write(entry)
+
+                logging.warning(f'leased zones [{entry["project_name"]}] from pool [{self.pool_directory}]')
+
+                return entry
+
+        return None
+
+
+    def release(self, project_name):
+        """Return a leased member to the pool so that it can be replaced.
+
+        Arguments:
+        project_name -- Compose project name of the member
+        """
+        logging.warning(f'returning zones [{project_name}] to pool [{self.pool_directory}]')
+
+        return self.set_state(project_name, 'returned')
+
+
+def member_options(catalog_profile=None, scratch_tmpfs_size=None, shared_volume_directory=None, **kwargs):
+    """Return the options which change running zones but not their snapshot, as a dict.
+
+    Zones started from the same snapshot still differ in how their database server is tuned and
+    where their scratch data is kept, so a pool member is only leased to runs which ask for the
+    same options.
+
+    Arguments:
+    catalog_profile -- name of the catalog profile (see database_setup.catalog_profiles)
+    scratch_tmpfs_size -- size of the tmpfs scratch mounts (see scratch_storage)
+    shared_volume_directory -- directory on the host holding the shared volume
+    kwargs -- other options, which are ignored
+    """
+    return {
+        'catalog_profile': catalog_profile if catalog_profile != 'default' else None,
+        'scratch_tmpfs_size': scratch_tmpfs_size,
+        'shared_volume_directory': os.path.abspath(shared_volume_directory) if shared_volume_directory else None,
+    }
+
+
+def _owner_is_alive(entry):
+    """Return whether the process which owns `entry` is still running."""
+    if not entry.get('owner'):
+        return False
+
+    try:
+        os.kill(entry['owner'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def provision_member(docker_client, pool, entry, **kwargs):
+    """Create the zones for a pool member in the provisioning state and mark it idle.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    pool -- zone_pool to which the member belongs
+    entry -- the entry for the member (see zone_pool.add)
+    kwargs -- options passed to snapshot.create_topologies
+    """
+    import compose.cli.command
+
+    from . import snapshot
+
+    ctx = context.context(docker_client,
+                          compose.cli.command.get_project(project_dir=entry['project_directory'],
+                                                          project_name=entry['project_name'],
+                                                          docker_client=docker_client))
+
+    try:
+        snapshot.create_topologies(ctx, zone_count=entry['zone_count'], **kwargs)
+
+    except Exception:
+        destroy_member(docker_client, pool, entry)
+        raise
+
+    pool.set_state(entry['project_name'], 'idle')
+
+    logging.warning(f'zones [{entry["project_name"]}] are ready in pool [{pool.pool_directory}]')
+
+
+def destroy_member(docker_client, pool, entry):
+    """Tear down the zones for a pool member and remove it from the pool.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    pool -- zone_pool to which the member belongs
+    entry -- the entry for the member
+    """
+    import compose.cli.command
+
+    compose_project = compose.cli.command.get_project(project_dir=entry['project_directory'],
+                                                      project_name=entry['project_name'],
+                                                      docker_client=docker_client)
+
+    try:
+        compose_project.down(include_volumes=True, remove_image_type=False)
+
+    finally:
+        pool.remove(entry['project_name'])
+
+    logging.warning(f'zones [{entry["project_name"]}] removed from pool [{pool.pool_directory}]')
+
+
+def manage_pool(docker_client,
+                pool_directory,
+                project_directory,
+                pool_size,
+                zone_count=1,
+                poll_interval=5,
+                max_iterations=None,
+                **kwargs):
+    """Keep `pool_size` idle members in the pool until interrupted.
+
+    Members which have been returned, and leased members whose owner has exited, are destroyed
+    and replaced in the background. The first member created in a new pool sets up a zone and
+    commits the zone snapshot; later members start from the snapshot in seconds.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    pool_directory -- directory on the host in which the state of the pool is kept
+    project_directory -- Compose project directory from which members are created
+    pool_size -- number of idle (or provisioning) members to maintain
+    zone_count -- number of identical zones in each member
+    poll_interval -- seconds to wait between checks of the pool
+    max_iterations -- stop after this many checks (default: run until interrupted)
+    kwargs -- options passed to snapshot.create_topologies (see snapshot.snapshot_key)
+    """
+    import concurrent.futures
+
+    import compose.cli.command
+
+    from . import snapshot
+
+    pool = zone_pool(pool_directory)
+
+    ctx = context.context(docker_client,
+                          compose.cli.command.get_project(project_dir=project_directory,
+                                                          docker_client=docker_client))
+
+    key = snapshot.snapshot_key(ctx, **kwargs)
+    options = member_options(**kwargs)
+
+    logging.warning(f'managing pool [{pool.pool_directory}] of [{pool_size}] members for [{key}]')
+
+    # Create the first member on its own so that the snapshot is only committed once. Every
+    # other member can then be started from the snapshot in parallel.
+    if not snapshot.snapshot_exists(docker_client, snapshot.snapshot_images(ctx, key)):
+        provision_member(docker_client, pool, pool.add(project_directory, key, zone_count, options), **kwargs)
+
+    pending = dict()
+
+    iteration = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        while max_iterations is None or iteration < max_iterations:
+            iteration += 1
+
+            for f in [f for f in pending if f.done()]:
+                project_name = pending.pop(f)
+                try:
+                    f.result()
+                except Exception as e:
+                    logging.error(f'exception raised while managing pool member [{project_name}]')
+                    logging.error(e)
+
+            busy = set(pending.values())
+
+            entries = [e for e in pool.entries()
+                       if e['project_directory'] == os.path.abspath(project_directory)
+                       and e['key'] == key
+                       and e.get('options', member_options()) == options]
+
+            for e in entries:
+                if e['project_name'] in busy: continue
+
+                abandoned = e['state'] in ['leased', 'provisioning'] and not _owner_is_alive(e)
+
+                if e['state'] == 'returned' or abandoned:
+                    pending[executor.submit(destroy_member, docker_client, pool, e)] = e['project_name']
+
+            available = len([e for e in entries if e['state'] in ['idle', 'provisioning']])
+
+            for _ in range(pool_size - available):
+                entry = pool.add(project_directory, key, zone_count, options)
+                pending[executor.submit(provision_member, docker_client, pool, entry, **kwargs)] = \
+                    entry['project_name']
+
+            time.sleep(poll_interval)
+
+        for f in concurrent.futures.as_completed(pending):
+            with contextlib.suppress(Exception):
+                f.result()
+
+
+def lease_zones(docker_client, pool_directory, project_directory, zone_count, **kwargs):
+    """Lease zones matching the inputs from a pool and return (pool, entry).
+
+    entry is None if the pool has no idle member matching the inputs, in which case the caller
+    should set up its own zones.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    pool_directory -- directory on the host in which the state of the pool is kept
+    project_directory -- Compose project directory of the zones to lease
+    zone_count -- number of zones needed
+    kwargs -- options which determine the zones (see snapshot.snapshot_key and member_options)
+    """
+    import compose.cli.command
+
+    from . import snapshot
+
+    pool = zone_pool(pool_directory)
+
+    ctx = context.context(docker_client,
+                          compose.cli.command.get_project(project_dir=project_directory,
+                                                          docker_client=docker_client))
+
+    entry = pool.lease(project_directory, snapshot.snapshot_key(ctx, **kwargs), zone_count, member_options(**kwargs))
+    if entry is None:
+        logging.warning(f'no idle zones in pool [{pool.pool_directory}] match this run')
+
+    return pool, entry
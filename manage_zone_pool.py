@@ -0,0 +1,87 @@
+# grown-up modules
+import logging
+import os
+
+import docker
+
+if __name__ == "__main__":
+    import argparse
+    import textwrap
+
+    import cli
+    from irods_testing_environment import logs, zone_pool
+
+    parser = argparse.ArgumentParser(
+        description='Keep a pool of idle, set up iRODS zones which test runs can lease with --zone-pool.')
+
+    cli.add_common_args(parser)
+    cli.add_compose_args(parser)
+    cli.add_irods_package_args(parser)
+    cli.add_irods_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
+
+    parser.add_argument('pool_directory',
+                        metavar='PATH_TO_POOL_DIRECTORY',
+                        help='Directory in which the state of the pool is kept.')
+
+    parser.add_argument('--pool-size',
+                        dest='pool_size', type=int, default=2,
+                        help='Number of idle members to keep in the pool.')
+
+    parser.add_argument('--concurrent-test-executor-count',
+                        dest='executor_count', type=int, default=1,
+                        help=textwrap.dedent('''\
+                            Number of identical zones in each member of the pool. This must match \
+                            the value used by the test runs which lease from the pool.'''))
+
+    parser.add_argument('--poll-interval',
+                        dest='poll_interval', type=float, default=5,
+                        help='Seconds to wait between checks for returned members.')
+
+    parser.add_argument('--use-unattended-install',
+                        action='store_true', dest='do_unattended_install',
+                        help='''\
+                            If indicated, the iRODS servers will be set up using \
+                            unattended installation.''')
+
+    args = parser.parse_args()
+
+    if not args.package_version and not args.install_packages:
+        print('--irods-package-version is required when using --use-static-image')
+        exit(1)
+
+    if args.package_directory and args.package_version:
+        print('--irods-package-directory and --irods-package-version are incompatible')
+        exit(1)
+
+    project_directory = os.path.abspath(args.project_directory or os.getcwd())
+
+    if not args.install_packages:
+        os.environ['dockerfile'] = 'release.Dockerfile'
+        if args.package_version:
+            os.environ['irods_package_version'] = args.package_version
+
+    logs.configure(args.verbosity)
+
+    try:
+        zone_pool.manage_pool(docker.from_env(use_ssh_client=True),
+                              args.pool_directory,
+                              project_directory,
+                              args.pool_size,
+                              zone_count=args.executor_count,
+                              poll_interval=args.poll_interval,
+                              externals_directory=args.irods_externals_package_directory,
+                              package_directory=args.package_directory,
+                              package_version=args.package_version,
+                              odbc_driver=args.odbc_driver,
+                              install_packages=args.install_packages,
+                              package_cache_directory=args.package_cache_directory,
+                              offline_package_cache=args.offline_package_cache,
+                              catalog_profile=args.catalog_profile,
+                              scratch_tmpfs_size=args.scratch_tmpfs_size,
+                              shared_volume_directory=args.shared_volume_directory,
+                              do_unattended_install=args.do_unattended_install)
+
+    except KeyboardInterrupt:
+        logging.warning('pool manager interrupted; idle members are left running for the next manager')
@@ -0,0 +1,76 @@
+# grown-up modules
+import json
+import logging
+import os
+import sys
+
+if __name__ == "__main__":
+    import argparse
+    import textwrap
+
+    import cli
+    from irods_testing_environment import job_archive, logs
+
+    parser = argparse.ArgumentParser(
+        description='Package a job output directory into a compressed, deduplicated archive, or restore it.')
+
+    cli.add_common_args(parser)
+
+    parser.add_argument('path',
+                        metavar='PATH_TO_JOB_OUTPUT_DIRECTORY_OR_ARCHIVE',
+                        help=textwrap.dedent('''\
+                            Path to the job output directory to package or, with --extract or \
+                            --list, path to the archive.'''))
+
+    parser.add_argument('--compression',
+                        dest='compression',
+                        choices=job_archive.compression_types(),
+                        default='xz',
+                        help='Compression used for the archive. zstd requires the zstandard package.')
+
+    parser.add_argument('--archive-path',
+                        metavar='PATH_TO_ARCHIVE',
+                        dest='archive_path',
+                        help=textwrap.dedent('''\
+                            Path to the archive to create. Defaults to the job output directory \
+                            path with an extension for the compression type.'''))
+
+    parser.add_argument('--remove-job-directory',
+                        dest='remove_directory', action='store_true',
+                        help='If indicated, the job output directory is removed once it has been packaged.')
+
+    parser.add_argument('--extract',
+                        metavar='PATH_TO_EXTRACTION',
+                        dest='extraction_directory', nargs='?', const='', default=None,
+                        help=textwrap.dedent('''\
+                            Restore the job output directory from the archive into this \
+                            directory. Defaults to the directory containing the archive.'''))
+
+    parser.add_argument('--list',
+                        dest='list_manifest', action='store_true',
+                        help='Print the manifest of the archive.')
+
+    args = parser.parse_args()
+
+    logs.configure(args.verbosity)
+
+    try:
+        if args.list_manifest:
+            print(json.dumps(job_archive.read_manifest(args.path), indent=4))
+
+        elif args.extraction_directory is not None:
+            print(job_archive.unpack_job_archive(args.path, args.extraction_directory or None))
+
+        else:
+            if not os.path.isdir(args.path):
+                logging.critical(f'[{args.path}] is not a directory')
+                sys.exit(1)
+
+            print(job_archive.package_job_directory(args.path,
+                                                    path_to_archive=args.archive_path,
+                                                    compression=args.compression,
+                                                    remove_directory=args.remove_directory))
+
+    except Exception as e:
+        logging.critical(e)
+        sys.exit(1)
@@ -1,4 +1,5 @@
 # grown-up modules
+import functools
 import logging
 import os
 import sys
@@ -8,7 +9,19 @@ import docker
 import compose.cli.command
 
 # local modules
-from irods_testing_environment import archive, context, irods_config, services, test_utils, tls_setup
+from irods_testing_environment import (
+    archive,
+    context,
+    governor,
+    irods_config,
+    irods_setup,
+    job_archive,
+    services,
+    snapshot,
+    test_utils,
+    tls_setup,
+    zone_pool,
+)
 
 if __name__ == "__main__":
     import argparse
@@ -21,9 +34,13 @@ if __name__ == "__main__":
 
     cli.add_common_args(parser)
     cli.add_compose_args(parser)
+    cli.add_build_args(parser)
     cli.add_irods_package_args(parser)
     cli.add_irods_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
     cli.add_irods_test_args(parser)
+    cli.add_zone_pool_args(parser)
 
     parser.add_argument(
         '--upgrade-package-directory',
@@ -45,6 +62,27 @@ if __name__ == "__main__":
                             be upgraded.'''),
     )
 
+    parser.add_argument(
+        '--use-zone-snapshot',
+        dest='use_zone_snapshot',
+        action='store_true',
+        help=textwrap.dedent('''\
+                            Start the zones from snapshot images of a previously set up zone with the same \
+                            packages, platform, database, and setup options, skipping setup. If no such \
+                            snapshot exists, the zones are set up as usual and the first one is committed to \
+                            snapshot images for later runs.'''),
+    )
+
+    parser.add_argument(
+        '--reset-zone-between-tests',
+        dest='reset_zone_between_tests',
+        action='store_true',
+        help=textwrap.dedent('''\
+                            Before each test after the first, return the zone to the state it was in before \
+                            any tests ran: restore the catalog, the server configuration files, and the vault, \
+                            and restart the servers.'''),
+    )
+
     args = parser.parse_args()
 
     if not args.package_version and not args.install_packages:
@@ -66,10 +104,41 @@ if __name__ == "__main__":
         if args.package_version:
             os.environ['irods_package_version'] = args.package_version
 
-    ctx = context.context(docker.from_env(use_ssh_client=True),
+    args.executor_count = governor.resolve_executor_count(args.executor_count,
+                                                          compose.cli.command.get_project(
+                                                              project_dir=project_directory))
+
+    docker_client = docker.from_env(use_ssh_client=True)
+
+    project_name = args.project_name
+
+    pool = None
+    lease = None
+    if args.zone_pool:
+        pool, lease = zone_pool.lease_zones(docker_client,
+                                            args.zone_pool,
+                                            project_directory,
+                                            args.executor_count,
+                                            externals_directory=args.irods_externals_package_directory,
+                                            package_directory=args.package_directory,
+                                            package_version=args.package_version,
+                                            odbc_driver=args.odbc_driver,
+                                            install_packages=args.install_packages,
+                                            cache_package_images=args.cache_package_images,
+                                            package_cache_directory=args.package_cache_directory,
+                                            offline_package_cache=args.offline_package_cache,
+                                            catalog_profile=args.catalog_profile,
+                                            scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                            shared_volume_directory=args.shared_volume_directory,
+                                            do_unattended_install=args.do_unattended_install)
+        if lease:
+            project_name = lease['project_name']
+
+    ctx = context.context(docker_client,
                           compose.cli.command.get_project(
                               project_dir=project_directory,
-                              project_name=args.project_name))
+                              project_name=project_name,
+                              build_cache_directory=args.build_cache_directory))
 
     job_name = test_utils.job_name(ctx.compose_project.name, args.job_name)
 
@@ -89,22 +158,46 @@ if __name__ == "__main__":
 
     try:
         consumer_count = 0
-        if args.do_setup:
+        if args.do_setup and not lease:
             # Bring up the services
             logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
-            services.create_topologies(ctx,
-                                       zone_count=args.executor_count,
-                                       externals_directory=args.irods_externals_package_directory,
-                                       package_directory=args.package_directory,
-                                       package_version=args.package_version,
-                                       odbc_driver=args.odbc_driver,
-                                       consumer_count=consumer_count,
-                                       install_packages=args.install_packages,
-                                       do_unattended_install=args.do_unattended_install)
-
-            # Configure the containers for running iRODS automated tests
-            logging.info('configuring iRODS containers for testing')
-            irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+            if args.use_zone_snapshot:
+                snapshot.create_topologies(ctx,
+                                           zone_count=args.executor_count,
+                                           externals_directory=args.irods_externals_package_directory,
+                                           package_directory=args.package_directory,
+                                           package_version=args.package_version,
+                                           odbc_driver=args.odbc_driver,
+                                           consumer_count=consumer_count,
+                                           install_packages=args.install_packages,
+                                           cache_package_images=args.cache_package_images,
+                                           package_cache_directory=args.package_cache_directory,
+                                           offline_package_cache=args.offline_package_cache,
+                                           catalog_profile=args.catalog_profile,
+                                           scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                           shared_volume_directory=args.shared_volume_directory,
+                                           do_unattended_install=args.do_unattended_install)
+
+            else:
+                services.create_topologies(ctx,
+                                           zone_count=args.executor_count,
+                                           externals_directory=args.irods_externals_package_directory,
+                                           package_directory=args.package_directory,
+                                           package_version=args.package_version,
+                                           odbc_driver=args.odbc_driver,
+                                           consumer_count=consumer_count,
+                                           install_packages=args.install_packages,
+                                           cache_package_images=args.cache_package_images,
+                                           package_cache_directory=args.package_cache_directory,
+                                           offline_package_cache=args.offline_package_cache,
+                                           catalog_profile=args.catalog_profile,
+                                           scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                           shared_volume_directory=args.shared_volume_directory,
+                                           do_unattended_install=args.do_unattended_install)
+
+                # Configure the containers for running iRODS automated tests
+                logging.info('configuring iRODS containers for testing')
+                irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
 
         # Get the container on which the command is to be executed
         containers = [
@@ -139,7 +232,21 @@ if __name__ == "__main__":
             if args.do_setup:
                 tls_setup.configure_tls_in_zone(ctx.docker_client, ctx.compose_project)
 
-        rc = test_utils.run_specific_tests(containers, args.tests, [options] * args.executor_count, args.fail_fast)
+        zone_resets = None
+        if args.reset_zone_between_tests:
+            zone_info_list = irods_setup.get_info_for_zones(ctx, ['tempZone'] * args.executor_count, consumer_count)
+
+            for z in zone_info_list:
+                z.prepare_reset(ctx)
+
+            zone_resets = [functools.partial(z.reset, ctx) for z in zone_info_list]
+
+        rc = test_utils.run_specific_tests(containers,
+                                           args.tests,
+                                           [options] * args.executor_count,
+                                           args.fail_fast,
+                                           output_directory=output_directory,
+                                           zone_resets=zone_resets)
 
     except Exception as e:
         logging.critical(e)
@@ -167,6 +274,9 @@ if __name__ == "__main__":
                                                       [os.path.join(context.irods_home(), 'test-reports')],
                                                       output_directory)
 
+                # and then index the server logs by the tests which were running
+                logs.index_logs_by_test(output_directory)
+
             except Exception as e:
                 logging.error(e)
                 logging.error('failed to collect some log files')
@@ -175,7 +285,14 @@ if __name__ == "__main__":
                     rc = 1
 
 
-        if args.cleanup_containers:
+        if lease:
+            pool.release(lease['project_name'])
+
+        elif args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
+        if args.package_output:
+            packaged = job_archive.package_job_output(output_directory, compression=args.package_output)
+            rc = rc or packaged
+
     exit(rc)
@@ -0,0 +1,164 @@
+# grown-up modules
+import compose.cli.command
+import docker
+import logging
+import os
+
+# local modules
+from irods_testing_environment import context
+from irods_testing_environment import database_setup
+from irods_testing_environment import federate
+from irods_testing_environment import federation_scale
+from irods_testing_environment import scratch_storage
+from irods_testing_environment import test_utils
+from irods_testing_environment.install import install
+
+if __name__ == "__main__":
+    import argparse
+    import textwrap
+
+    import cli
+    from irods_testing_environment import logs
+
+    parser = argparse.ArgumentParser(
+        description='Measure how iRODS federation performs as the number of federated zones grows.')
+
+    cli.add_common_args(parser)
+    cli.add_compose_args(parser)
+    cli.add_build_args(parser)
+    cli.add_irods_package_args(parser)
+    cli.add_irods_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
+    cli.add_federation_topology_args(parser)
+
+    parser.add_argument('--zone-counts',
+                        metavar='ZONE_COUNT',
+                        nargs='+', dest='zone_counts', type=int, default=[2, 10],
+                        help=textwrap.dedent('''\
+                            Space-delimited list of numbers of zones to stand up and measure, \
+                            one after another.'''))
+
+    parser.add_argument('--samples',
+                        metavar='SAMPLES',
+                        dest='samples', type=int, default=5,
+                        help='Number of times each remote operation is run for each pair of zones.')
+
+    parser.add_argument('--max-pairs',
+                        metavar='MAX_PAIRS',
+                        dest='max_pairs', type=int, default=20,
+                        help='Maximum number of pairs of federated zones to measure at each zone count.')
+
+    parser.add_argument('--output-directory', '-o',
+                        metavar='FULLPATH_TO_DIRECTORY_FOR_OUTPUT',
+                        dest='output_directory',
+                        help='Full path to local directory for the report. Defaults to temporary directory.')
+
+    parser.add_argument('--leave-containers',
+                        action='store_false', dest='cleanup_containers',
+                        help='If indicated, the containers of the last zone count are not torn down.')
+
+    parser.add_argument('--use-unattended-install',
+                        action='store_true', dest='do_unattended_install',
+                        help='''\
+                            If indicated, the iRODS servers will be set up using \
+                            unattended installation.''')
+
+    args = parser.parse_args()
+
+    if not args.package_version and not args.install_packages:
+        print('--irods-package-version is required when using --use-static-image')
+        exit(1)
+
+    if args.package_directory and args.package_version:
+        print('--package-directory and --package-version are incompatible')
+        exit(1)
+
+    if args.topology == 'pairs' and not args.federation_pairs:
+        print('--federation-pairs is required when using --topology pairs')
+        exit(1)
+
+    if args.topology == 'pairs':
+        # Every step uses the same pairs, so they must only name zones which the smallest step has.
+        try:
+            federate.pairs_topology(federation_scale.zone_names(min(args.zone_counts)), args.federation_pairs)
+        except ValueError as e:
+            print('--federation-pairs must name zones which exist at every --zone-counts step: {}'.format(e))
+            exit(1)
+
+    project_directory = os.path.abspath(args.project_directory or os.getcwd())
+
+    if not args.install_packages:
+        os.environ['dockerfile'] = 'release.Dockerfile'
+        if args.package_version:
+            os.environ['irods_package_version'] = args.package_version
+
+    ctx = context.context(docker.from_env(use_ssh_client=True),
+                          compose.cli.command.get_project(
+                              project_dir=project_directory,
+                              project_name=args.project_name,
+                              build_cache_directory=args.build_cache_directory))
+
+    job_name = test_utils.job_name(ctx.compose_project.name, 'federation_scale')
+
+    if args.output_directory:
+        dirname = args.output_directory
+    else:
+        import tempfile
+        dirname = tempfile.mkdtemp(prefix=job_name)
+
+    output_directory = test_utils.make_output_directory(dirname, job_name)
+
+    logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+
+    package_cache_directory = None
+    if args.install_packages and args.package_cache_directory:
+        package_cache_directory = install.add_package_cache_to_project(ctx.compose_project,
+                                                                       args.package_cache_directory)
+
+    database_setup.add_catalog_profile_to_project(ctx.compose_project, args.catalog_profile)
+
+    scratch_storage.add_scratch_storage_to_project(ctx.compose_project,
+                                                   tmpfs_size=args.scratch_tmpfs_size,
+                                                   shared_volume_directory=args.shared_volume_directory)
+
+    installer = None
+    if args.install_packages:
+        installer = install.make_installer(ctx.platform_name(),
+                                           package_cache_directory=package_cache_directory,
+                                           offline=args.offline_package_cache)
+
+    results = list()
+    rc = 0
+
+    try:
+        ctx.compose_project.build()
+
+        for i, zone_count in enumerate(sorted(args.zone_counts)):
+            last = i == len(args.zone_counts) - 1
+
+            results.append(federation_scale.run_scale_step(
+                ctx,
+                zone_count,
+                topology_kind=args.topology,
+                pairs=args.federation_pairs,
+                installer=installer,
+                samples=args.samples,
+                max_pairs=args.max_pairs,
+                cleanup_containers=args.cleanup_containers or not last,
+                externals_directory=args.irods_externals_package_directory,
+                package_directory=args.package_directory,
+                package_version=args.package_version,
+                odbc_driver=args.odbc_driver,
+                do_unattended_install=args.do_unattended_install))
+
+    except Exception as e:
+        logging.critical(e)
+        rc = 1
+
+    finally:
+        if results:
+            logging.error(federation_scale.result_string(results))
+            logging.error('report [{}]'.format(federation_scale.write_report(results, output_directory)))
+
+    exit(rc)
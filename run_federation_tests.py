@@ -6,12 +6,17 @@ import os
 
 # local modules
 from irods_testing_environment import archive
+from irods_testing_environment import config_session
 from irods_testing_environment import context
+from irods_testing_environment import database_setup
+from irods_testing_environment import governor
 from irods_testing_environment import execute
 from irods_testing_environment import federate
 from irods_testing_environment.install import install
 from irods_testing_environment import irods_config
 from irods_testing_environment import irods_setup
+from irods_testing_environment import job_archive
+from irods_testing_environment import scratch_storage
 from irods_testing_environment import tls_setup
 from irods_testing_environment import test_utils
 
@@ -26,8 +31,11 @@ if __name__ == "__main__":
 
     cli.add_common_args(parser)
     cli.add_compose_args(parser)
+    cli.add_build_args(parser)
     cli.add_irods_package_args(parser)
     cli.add_irods_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
     cli.add_irods_test_args(parser)
 
     args = parser.parse_args()
@@ -47,10 +55,15 @@ if __name__ == "__main__":
         if args.package_version:
             os.environ['irods_package_version'] = args.package_version
 
+    args.executor_count = governor.resolve_executor_count(args.executor_count,
+                                                          compose.cli.command.get_project(
+                                                              project_dir=project_directory))
+
     ctx = context.context(docker.from_env(use_ssh_client=True),
                           compose.cli.command.get_project(
                               project_dir=project_directory,
-                              project_name=args.project_name))
+                              project_name=args.project_name,
+                              build_cache_directory=args.build_cache_directory))
 
     job_name = test_utils.job_name(ctx.compose_project.name, args.job_name)
 
@@ -71,6 +84,17 @@ if __name__ == "__main__":
         if args.do_setup:
             # Bring up the services
             logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
+            package_cache_directory = None
+            if args.install_packages and args.package_cache_directory:
+                package_cache_directory = install.add_package_cache_to_project(ctx.compose_project,
+                                                                               args.package_cache_directory)
+
+            database_setup.add_catalog_profile_to_project(ctx.compose_project, args.catalog_profile)
+
+            scratch_storage.add_scratch_storage_to_project(ctx.compose_project,
+                                                           tmpfs_size=args.scratch_tmpfs_size,
+                                                           shared_volume_directory=args.shared_volume_directory)
+
             ctx.compose_project.build()
             containers = ctx.compose_project.up(scale_override={
                 context.irods_catalog_database_service(): 2,
@@ -82,29 +106,36 @@ if __name__ == "__main__":
         zone_info_list = irods_setup.get_info_for_zones(ctx, ['tempZone', 'otherZone'])
 
         if args.do_setup:
+            installer = None
             if args.install_packages:
-                install.make_installer(ctx.platform_name()).install_irods_packages(
-                    ctx,
-                    externals_directory=args.irods_externals_package_directory,
-                    package_directory=args.package_directory,
-                    package_version=args.package_version)
-
-            for z in zone_info_list:
-                irods_setup.setup_irods_zone(ctx,
-                                             provider_service_instance=z.provider_service_instance,
-                                             database_service_instance=z.database_service_instance,
-                                             consumer_service_instances=z.consumer_service_instances,
-                                             odbc_driver=args.odbc_driver,
-                                             zone_name=z.zone_name,
-                                             zone_key=z.zone_key,
-                                             negotiation_key=z.negotiation_key,
-                                             do_unattended_install=args.do_unattended_install)
-
-            federate.form_federation_clique(ctx, zone_info_list)
+                installer = install.make_installer(ctx.platform_name(),
+                                                   package_cache_directory=package_cache_directory,
+                                                   offline=args.offline_package_cache)
+
+            # Federation and host resolution both modify server_config.json, so batch the changes
+            # to write the file and reload the configuration once per server.
+            config_sessions = config_session.open_sessions(
+                ctx.docker_client,
+                ctx.compose_project.containers(service_names=[
+                    context.irods_catalog_provider_service(),
+                    context.irods_catalog_consumer_service()]),
+                reload_configuration=True)
+
+            federate.setup_federated_zones(ctx,
+                                           zone_info_list,
+                                           installer=installer,
+                                           config_sessions=config_sessions,
+                                           externals_directory=args.irods_externals_package_directory,
+                                           package_directory=args.package_directory,
+                                           package_version=args.package_version,
+                                           odbc_driver=args.odbc_driver,
+                                           do_unattended_install=args.do_unattended_install)
 
             # Configure the containers for running iRODS automated tests
             logging.info('configuring iRODS containers for testing')
-            irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+            irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project, config_sessions)
+
+            config_session.commit_sessions(config_sessions)
 
         # Get the container on which the command is to be executed
         container = ctx.docker_client.containers.get(
@@ -140,7 +171,8 @@ if __name__ == "__main__":
         rc = test_utils.run_specific_tests([container],
                                            args.tests or ['test_federation'],
                                            [options] * args.executor_count,
-                                           args.fail_fast)
+                                           args.fail_fast,
+                                           output_directory=output_directory)
 
     except Exception as e:
         logging.critical(e)
@@ -168,6 +200,9 @@ if __name__ == "__main__":
                                                       [os.path.join(context.irods_home(), 'test-reports')],
                                                       output_directory)
 
+                # and then index the server logs by the tests which were running
+                logs.index_logs_by_test(output_directory)
+
             except Exception as e:
                 logging.error(e)
                 logging.error('failed to collect some log files')
@@ -178,4 +213,8 @@ if __name__ == "__main__":
         if args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
+        if args.package_output:
+            packaged = job_archive.package_job_output(output_directory, compression=args.package_output)
+            rc = rc or packaged
+
     exit(rc)
@@ -0,0 +1,140 @@
+# grown-up modules
+import logging
+import os
+import sys
+
+import docker
+
+# local modules
+from irods_testing_environment import job_archive, matrix, test_utils
+
+if __name__ == "__main__":
+    import argparse
+    import textwrap
+
+    import cli
+    from irods_testing_environment import logs
+
+    parser = argparse.ArgumentParser(
+        description='Run iRODS tests on several platform and database projects at once.')
+
+    cli.add_common_args(parser)
+    cli.add_build_args(parser)
+    cli.add_irods_package_args(parser)
+    cli.add_irods_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
+    cli.add_irods_test_args(parser)
+
+    parser.add_argument('project_directories',
+                        metavar='PATH_TO_PROJECT_DIRECTORY',
+                        nargs='+',
+                        help=textwrap.dedent('''\
+                            Paths to the Compose projects to run, or glob patterns matching \
+                            them (e.g. "projects/*/*-postgres-*").'''))
+
+    parser.add_argument('--cpus',
+                        dest='cpu_budget', type=float,
+                        help=textwrap.dedent('''\
+                            Number of CPUs the running projects may use at once. Defaults to \
+                            the number of CPUs on the host.'''))
+
+    parser.add_argument('--memory',
+                        dest='memory_budget', type=float,
+                        help=textwrap.dedent('''\
+                            GiB of memory the running projects may use at once. Defaults to \
+                            the memory on the host.'''))
+
+    parser.add_argument('--cpus-per-zone',
+                        dest='cpus_per_zone', type=float, default=2,
+                        help='Number of CPUs each zone is expected to use.')
+
+    parser.add_argument('--memory-per-zone',
+                        dest='memory_per_zone', type=float, default=2,
+                        help='GiB of memory each zone is expected to use.')
+
+    args = parser.parse_args()
+
+    if not args.package_version and not args.install_packages:
+        print('--irods-package-version is required when using --use-static-image')
+        exit(1)
+
+    if args.package_directory and args.package_version:
+        print('--irods-package-directory and --irods-package-version are incompatible')
+        exit(1)
+
+    if not args.install_packages:
+        os.environ['dockerfile'] = 'release.Dockerfile'
+        if args.package_version:
+            os.environ['irods_package_version'] = args.package_version
+
+    job_name = args.job_name or test_utils.job_name('matrix')
+
+    if args.output_directory:
+        dirname = args.output_directory
+    else:
+        import tempfile
+        dirname = tempfile.mkdtemp(prefix=job_name)
+
+    output_directory = test_utils.make_output_directory(dirname, job_name)
+
+    logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+
+    GiB = 1024 ** 3
+
+    # The matrix gets its parallelism from running several projects at once, so 'auto' means one
+    # zone per project here and the CPU and memory budget decides how many projects run.
+    if args.executor_count == 'auto':
+        logging.warning('using [1] zone for each project; the budget decides how many projects run at once')
+        args.executor_count = 1
+
+    rc = 0
+    jobs = list()
+
+    try:
+        jobs = matrix.run_matrix(docker.from_env(use_ssh_client=True),
+                                 matrix.expand_project_directories(args.project_directories),
+                                 output_directory,
+                                 zone_count=args.executor_count,
+                                 cpu_budget=args.cpu_budget,
+                                 memory_budget=args.memory_budget * GiB if args.memory_budget else None,
+                                 cpus_per_zone=args.cpus_per_zone,
+                                 memory_per_zone=args.memory_per_zone * GiB,
+                                 build_cache_directory=args.build_cache_directory,
+                                 tests=args.tests,
+                                 fail_fast=args.fail_fast,
+                                 do_setup=args.do_setup,
+                                 save_logs=args.save_logs,
+                                 cleanup_containers=args.cleanup_containers,
+                                 externals_directory=args.irods_externals_package_directory,
+                                 package_directory=args.package_directory,
+                                 package_version=args.package_version,
+                                 odbc_driver=args.odbc_driver,
+                                 install_packages=args.install_packages,
+                                 cache_package_images=args.cache_package_images,
+                                 package_cache_directory=args.package_cache_directory,
+                                 offline_package_cache=args.offline_package_cache,
+                                 catalog_profile=args.catalog_profile,
+                                 scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                 shared_volume_directory=args.shared_volume_directory,
+                                 do_unattended_install=args.do_unattended_install)
+
+        rc = 0 if all(j.rc == 0 for j in jobs) else 1
+
+    except Exception as e:
+        logging.critical(e)
+        rc = 1
+
+    finally:
+        if jobs:
+            logging.error(matrix.result_string(jobs))
+            logging.error('combined report [{}]'.format(matrix.write_report(jobs, output_directory)))
+
+        # TODO(#286): Replace use of root logger
+        logging.error("message:[%s]", args.job_message)  # noqa: LOG015
+
+        if args.package_output:
+            packaged = job_archive.package_job_output(output_directory, compression=args.package_output)
+            rc = rc or packaged
+
+    sys.exit(rc)
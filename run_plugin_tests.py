@@ -9,7 +9,9 @@ import textwrap
 # local modules
 from irods_testing_environment import archive
 from irods_testing_environment import context
+from irods_testing_environment import governor
 from irods_testing_environment import irods_config
+from irods_testing_environment import job_archive
 from irods_testing_environment import logs
 from irods_testing_environment import services
 from irods_testing_environment import test_utils
@@ -20,9 +22,12 @@ parser = argparse.ArgumentParser(description='Run iRODS plugin test hooks in a c
 
 cli.add_common_args(parser)
 cli.add_compose_args(parser)
+cli.add_build_args(parser)
 cli.add_irods_package_args(parser)
 cli.add_irods_plugin_args(parser)
 cli.add_irods_setup_args(parser)
+cli.add_catalog_profile_args(parser)
+cli.add_scratch_storage_args(parser)
 cli.add_irods_test_args(parser)
 
 parser.add_argument('--test-hook-path',
@@ -51,10 +56,15 @@ if not args.install_packages:
     if args.package_version:
         os.environ['irods_package_version'] = args.package_version
 
+args.executor_count = governor.resolve_executor_count(args.executor_count,
+                                                      compose.cli.command.get_project(
+                                                          project_dir=project_directory))
+
 ctx = context.context(docker.from_env(use_ssh_client=True),
                       compose.cli.command.get_project(
                           project_dir=project_directory,
-                          project_name=args.project_name))
+                          project_name=args.project_name,
+                          build_cache_directory=args.build_cache_directory))
 
 job_name = test_utils.job_name(ctx.compose_project.name, args.job_name)
 
@@ -82,6 +92,12 @@ try:
                                    odbc_driver=args.odbc_driver,
                                    consumer_count=consumer_count,
                                    install_packages=args.install_packages,
+                                   cache_package_images=args.cache_package_images,
+                                   package_cache_directory=args.package_cache_directory,
+                                   offline_package_cache=args.offline_package_cache,
+                                   catalog_profile=args.catalog_profile,
+                                   scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                   shared_volume_directory=args.shared_volume_directory,
                                    do_unattended_install=args.do_unattended_install)
 
         # Configure the containers for running iRODS automated tests
@@ -116,7 +132,8 @@ try:
                                      args.test_hook,
                                      args.tests,
                                      [options] * args.executor_count,
-                                     args.fail_fast)
+                                     args.fail_fast,
+                                     output_directory=output_directory)
 
 except Exception as e:
     logging.critical(e)
@@ -146,6 +163,9 @@ finally:
                     ctx.docker_client, ctx.irods_containers(), [args.extra_logs_path], output_directory
                 )
 
+            # ...and then index the server logs by the tests which were running.
+            logs.index_logs_by_test(output_directory)
+
         except Exception as e:
             logging.error(e)
             logging.error('failed to collect some log files')
@@ -156,5 +176,9 @@ finally:
     if args.cleanup_containers:
         ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
+    if args.package_output:
+        packaged = job_archive.package_job_output(output_directory, compression=args.package_output)
+        rc = rc or packaged
+
 
 exit(rc)
@@ -7,9 +7,12 @@ import os
 # local modules
 from irods_testing_environment import archive
 from irods_testing_environment import context
+from irods_testing_environment import governor
 from irods_testing_environment import execute
 from irods_testing_environment import install
 from irods_testing_environment import irods_config
+from irods_testing_environment import irods_setup
+from irods_testing_environment import job_archive
 from irods_testing_environment import services
 from irods_testing_environment import tls_setup
 from irods_testing_environment import test_utils
@@ -25,7 +28,11 @@ if __name__ == "__main__":
 
     cli.add_common_args(parser)
     cli.add_compose_args(parser)
+    cli.add_build_args(parser)
     cli.add_irods_setup_args(parser)
+    cli.add_consumer_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
     cli.add_irods_package_args(parser)
     cli.add_irods_test_args(parser)
 
@@ -53,10 +60,16 @@ if __name__ == "__main__":
         if args.package_version:
             os.environ['irods_package_version'] = args.package_version
 
+    args.executor_count = governor.resolve_executor_count(args.executor_count,
+                                                          compose.cli.command.get_project(
+                                                              project_dir=project_directory),
+                                                          consumer_count=3)
+
     ctx = context.context(docker.from_env(use_ssh_client=True),
                           compose.cli.command.get_project(
                               project_dir=project_directory,
-                              project_name=args.project_name))
+                              project_name=args.project_name,
+                              build_cache_directory=args.build_cache_directory))
 
     job_name = test_utils.job_name(ctx.compose_project.name, args.job_name)
 
@@ -70,6 +83,9 @@ if __name__ == "__main__":
 
     logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
 
+    irods_setup.configure_consumer_admission(limit=args.max_concurrent_consumer_setups,
+                                            retries=args.consumer_setup_retries)
+
     rc = 0
     containers = None
 
@@ -89,6 +105,12 @@ if __name__ == "__main__":
                                        odbc_driver=args.odbc_driver,
                                        consumer_count=consumer_count,
                                        install_packages=args.install_packages,
+                                       cache_package_images=args.cache_package_images,
+                                       package_cache_directory=args.package_cache_directory,
+                                       offline_package_cache=args.offline_package_cache,
+                                       catalog_profile=args.catalog_profile,
+                                       scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                       shared_volume_directory=args.shared_volume_directory,
                                        do_unattended_install=args.do_unattended_install)
 
             # Configure the containers for running iRODS automated tests
@@ -168,7 +190,11 @@ if __name__ == "__main__":
 
         logging.info(options_list)
 
-        rc = test_utils.run_specific_tests(containers, args.tests, options_list, args.fail_fast)
+        rc = test_utils.run_specific_tests(containers,
+                                           args.tests,
+                                           options_list,
+                                           args.fail_fast,
+                                           output_directory=output_directory)
 
     except Exception as e:
         logging.critical(e)
@@ -196,6 +222,9 @@ if __name__ == "__main__":
                                                       [os.path.join(context.irods_home(), 'test-reports')],
                                                       output_directory)
 
+                # and then index the server logs by the tests which were running
+                logs.index_logs_by_test(output_directory)
+
             except Exception as e:
                 logging.error(e)
                 logging.error('failed to collect some log files')
@@ -207,4 +236,8 @@ if __name__ == "__main__":
         if args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
+        if args.package_output:
+            packaged = job_archive.package_job_output(output_directory, compression=args.package_output)
+            rc = rc or packaged
+
     exit(rc)
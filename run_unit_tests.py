@@ -7,9 +7,12 @@ import os
 # local modules
 from irods_testing_environment import archive
 from irods_testing_environment import context
+from irods_testing_environment import governor
 from irods_testing_environment import irods_config
+from irods_testing_environment import job_archive
 from irods_testing_environment import services
 from irods_testing_environment import test_utils
+from irods_testing_environment import zone_pool
 
 if __name__ == "__main__":
     import argparse
@@ -22,9 +25,13 @@ if __name__ == "__main__":
 
     cli.add_common_args(parser)
     cli.add_compose_args(parser)
+    cli.add_build_args(parser)
     cli.add_irods_package_args(parser)
     cli.add_irods_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
     cli.add_irods_test_args(parser)
+    cli.add_zone_pool_args(parser)
 
     args = parser.parse_args()
 
@@ -43,10 +50,41 @@ if __name__ == "__main__":
         if args.package_version:
             os.environ['irods_package_version'] = args.package_version
 
-    ctx = context.context(docker.from_env(use_ssh_client=True),
+    args.executor_count = governor.resolve_executor_count(args.executor_count,
+                                                          compose.cli.command.get_project(
+                                                              project_dir=project_directory))
+
+    docker_client = docker.from_env(use_ssh_client=True)
+
+    project_name = args.project_name
+
+    pool = None
+    lease = None
+    if args.zone_pool:
+        pool, lease = zone_pool.lease_zones(docker_client,
+                                            args.zone_pool,
+                                            project_directory,
+                                            args.executor_count,
+                                            externals_directory=args.irods_externals_package_directory,
+                                            package_directory=args.package_directory,
+                                            package_version=args.package_version,
+                                            odbc_driver=args.odbc_driver,
+                                            install_packages=args.install_packages,
+                                            cache_package_images=args.cache_package_images,
+                                            package_cache_directory=args.package_cache_directory,
+                                            offline_package_cache=args.offline_package_cache,
+                                            catalog_profile=args.catalog_profile,
+                                            scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                            shared_volume_directory=args.shared_volume_directory,
+                                            do_unattended_install=args.do_unattended_install)
+        if lease:
+            project_name = lease['project_name']
+
+    ctx = context.context(docker_client,
                           compose.cli.command.get_project(
                               project_dir=project_directory,
-                              project_name=args.project_name))
+                              project_name=project_name,
+                              build_cache_directory=args.build_cache_directory))
 
     job_name = test_utils.job_name(ctx.compose_project.name, args.job_name)
 
@@ -64,7 +102,7 @@ if __name__ == "__main__":
     containers = None
 
     try:
-        if args.do_setup:
+        if args.do_setup and not lease:
             # Bring up the services
             logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
             consumer_count = 0
@@ -76,6 +114,12 @@ if __name__ == "__main__":
                                        odbc_driver=args.odbc_driver,
                                        consumer_count=consumer_count,
                                        install_packages=args.install_packages,
+                                       cache_package_images=args.cache_package_images,
+                                       package_cache_directory=args.package_cache_directory,
+                                       offline_package_cache=args.offline_package_cache,
+                                       catalog_profile=args.catalog_profile,
+                                       scratch_tmpfs_size=args.scratch_tmpfs_size,
+                                       shared_volume_directory=args.shared_volume_directory,
                                        do_unattended_install=args.do_unattended_install)
 
             # Configure the containers for running iRODS automated tests
@@ -94,7 +138,7 @@ if __name__ == "__main__":
 
         # TODO(#296): configure TLS here if --use-tls was specified
 
-        rc = test_utils.run_unit_tests(containers, args.tests, args.fail_fast)
+        rc = test_utils.run_unit_tests(containers, args.tests, args.fail_fast, output_directory=output_directory)
 
     except Exception as e:
         logging.critical(e)
@@ -115,7 +159,17 @@ if __name__ == "__main__":
             # collect the usual logs (unit test reports appear in /var/lib/irods/log for now)
             logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory)
 
-        if args.cleanup_containers:
+            # and then index the server logs by the tests which were running
+            logs.index_logs_by_test(output_directory)
+
+        if lease:
+            pool.release(lease['project_name'])
+
+        elif args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
+        if args.package_output:
+            packaged = job_archive.package_job_output(output_directory, compression=args.package_output)
+            rc = rc or packaged
+
     exit(rc)
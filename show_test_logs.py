@@ -0,0 +1,57 @@
+# grown-up modules
+import logging
+import os
+import sys
+
+if __name__ == "__main__":
+    import argparse
+    import textwrap
+
+    import cli
+    from irods_testing_environment import logs
+
+    parser = argparse.ArgumentParser(
+        description='Print the iRODS server log lines written while a specific test was running.')
+
+    cli.add_common_args(parser)
+
+    parser.add_argument('job_directory',
+                        metavar='PATH_TO_JOB_OUTPUT_DIRECTORY',
+                        help='Path to the output directory of the job which ran the test.')
+
+    parser.add_argument('test',
+                        metavar='TEST_NAME',
+                        help='Name of the test as it was passed to the test runner.')
+
+    parser.add_argument('--container',
+                        metavar='CONTAINER_NAME',
+                        dest='container_name',
+                        help=textwrap.dedent('''\
+                            Only print log lines collected from this container. By default, \
+                            log lines from every container in the job are printed.'''))
+
+    parser.add_argument('--rebuild-index',
+                        dest='rebuild_index', action='store_true',
+                        help=textwrap.dedent('''\
+                            Rebuild the log index from the test timeline and collected logs \
+                            before printing, even if an index already exists.'''))
+
+    args = parser.parse_args()
+
+    logs.configure(args.verbosity)
+
+    job_directory = os.path.abspath(args.job_directory)
+
+    index_file = os.path.join(job_directory, 'logs', logs.log_index_file_name())
+    if args.rebuild_index or not os.path.exists(index_file):
+        if not logs.index_logs_by_test(job_directory):
+            logging.critical(f'no test timeline or collected logs found in [{job_directory}]')
+            sys.exit(1)
+
+    try:
+        for container_name, line in logs.log_lines_for_test(job_directory, args.test, args.container_name):
+            print(f'[{container_name}] {line}')
+
+    except KeyError as e:
+        logging.critical(e)
+        sys.exit(1)
@@ -6,6 +6,7 @@ import os
 
 # local modules
 from irods_testing_environment import context
+from irods_testing_environment import irods_setup
 from irods_testing_environment import services
 from irods_testing_environment import tls_setup
 
@@ -20,8 +21,12 @@ if __name__ == "__main__":
 
     cli.add_common_args(parser)
     cli.add_compose_args(parser)
+    cli.add_build_args(parser)
     cli.add_irods_package_args(parser)
     cli.add_irods_setup_args(parser)
+    cli.add_consumer_setup_args(parser)
+    cli.add_catalog_profile_args(parser)
+    cli.add_scratch_storage_args(parser)
 
     parser.add_argument('--consumer-instance-count',
                         metavar='IRODS_CATALOG_SERVICE_CONSUMER_INSTANCE_COUNT',
@@ -55,10 +60,14 @@ if __name__ == "__main__":
     ctx = context.context(docker.from_env(use_ssh_client=True),
                           compose.cli.command.get_project(
                               project_dir=project_directory,
-                              project_name=args.project_name))
+                              project_name=args.project_name,
+                              build_cache_directory=args.build_cache_directory))
 
     logs.configure(args.verbosity)
 
+    irods_setup.configure_consumer_admission(limit=args.max_concurrent_consumer_setups,
+                                            retries=args.consumer_setup_retries)
+
     logging.debug(f'environment variables:[{os.environ}]')
 
     # Bring up the services
@@ -70,6 +79,11 @@ if __name__ == "__main__":
                              odbc_driver=args.odbc_driver,
                              consumer_count=args.consumer_count,
                              install_packages=args.install_packages,
+                             package_cache_directory=args.package_cache_directory,
+                             offline_package_cache=args.offline_package_cache,
+                             catalog_profile=args.catalog_profile,
+                             scratch_tmpfs_size=args.scratch_tmpfs_size,
+                             shared_volume_directory=args.shared_volume_directory,
                              do_unattended_install=args.do_unattended_install)
 
     if args.use_tls: